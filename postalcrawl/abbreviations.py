@@ -0,0 +1,21 @@
+# common street type and direction abbreviations, shared by address matching and dedup
+STREET_ABBREVIATIONS = {
+    "st": "street",
+    "str": "strasse",
+    "straße": "strasse",
+    "ave": "avenue",
+    "av": "avenue",
+    "rd": "road",
+    "dr": "drive",
+    "blvd": "boulevard",
+    "ln": "lane",
+    "hwy": "highway",
+    "pkwy": "parkway",
+    "ct": "court",
+    "pl": "place",
+    "sq": "square",
+    "n": "north",
+    "s": "south",
+    "e": "east",
+    "w": "west",
+}
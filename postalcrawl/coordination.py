@@ -0,0 +1,300 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger
+
+LEASE_SECONDS = 300.0
+# tolerated clock skew between nodes: owners stop renewing this long before expiry,
+# other nodes only reclaim this long after expiry
+CLOCK_MARGIN = 10.0
+POLL_SECONDS = 30.0
+# a task that failed this often, on any workers, is marked done with its error
+MAX_ATTEMPTS = 3
+
+
+def task_key(task: str) -> str:
+    return hashlib.blake2b(task.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _write_json_atomic(path: Path, data: dict):
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    tmp_path.replace(path)
+
+
+def _read_json(path: Path) -> dict | None:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None  # gone, or created but not yet written by its owner
+
+
+@dataclass
+class Lease:
+    task: str
+    owner: str
+    token: str
+    expires_at: float
+    lost: threading.Event = field(default_factory=threading.Event)
+
+    def to_dict(self) -> dict:
+        return {
+            "task": self.task,
+            "owner": self.owner,
+            "token": self.token,
+            "expires_at": self.expires_at,
+        }
+
+
+class LeaseCoordinator:
+    """
+    Work distribution over a directory on shared storage (e.g. NFS), without a coordinator
+    process. Any number of workers on any number of hosts claim tasks (segments, shards) with
+    expiring leases:
+
+    - `leases/<key>.json`: the current lease of a task, created with O_EXCL so one worker wins
+    - the owner renews its lease from a heartbeat thread. A lease that is not renewed (dead or
+      hung worker) expires, and is reclaimed by renaming it away: only one worker's rename
+      succeeds, and it re-checks the renamed lease before taking over the task
+    - `done/<key>.json`: written atomically once the outputs of a task are in place. Tasks
+      with a done marker are never claimed again
+    - `failed/<key>.json`: the failed attempts of a task. A failed task is released and
+      retried (by any worker) until it failed `max_attempts` times, then it is marked done
+      with its error
+
+    Outputs should be written atomically (tmp file + rename) by the task itself, so a
+    reclaimed task can safely rewrite them.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        worker_id: str | None = None,
+        lease_seconds: float = LEASE_SECONDS,
+        clock_margin: float = CLOCK_MARGIN,
+        poll_seconds: float = POLL_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        assert clock_margin < lease_seconds / 2, f"{clock_margin=} too large for {lease_seconds=}"
+        self.root = Path(root)
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.clock_margin = clock_margin
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.lease_dir = self.root / "leases"
+        self.done_dir = self.root / "done"
+        self.failed_dir = self.root / "failed"
+        for directory in (self.lease_dir, self.done_dir, self.failed_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def lease_path(self, task: str) -> Path:
+        return self.lease_dir / f"{task_key(task)}.json"
+
+    def done_path(self, task: str) -> Path:
+        return self.done_dir / f"{task_key(task)}.json"
+
+    def failed_path(self, task: str) -> Path:
+        return self.failed_dir / f"{task_key(task)}.json"
+
+    def is_done(self, task: str) -> bool:
+        return self.done_path(task).exists()
+
+    def _new_lease(self, task: str) -> Lease:
+        expires_at = time.time() + self.lease_seconds
+        return Lease(task, self.worker_id, uuid.uuid4().hex, expires_at)
+
+    def _create(self, task: str) -> Lease | None:
+        lease = self._new_lease(task)
+        try:
+            fd = os.open(self.lease_path(task), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, "w") as f:
+            json.dump(lease.to_dict(), f)
+        return lease
+
+    def _is_expired(self, path: Path) -> bool:
+        current = _read_json(path)
+        if current is not None:
+            expires_at = current["expires_at"]
+        else:
+            try:  # owner died between creating and writing the lease
+                expires_at = path.stat().st_mtime + self.lease_seconds
+            except FileNotFoundError:
+                return False
+        return expires_at + self.clock_margin < time.time()
+
+    def _reclaim(self, task: str) -> bool:
+        """move an expired lease out of the way. true if this worker did it"""
+        path = self.lease_path(task)
+        if not self._is_expired(path):
+            return False
+        reclaimed = path.with_name(f"{path.name}.{uuid.uuid4().hex}.reclaimed")
+        try:
+            path.rename(reclaimed)
+        except FileNotFoundError:
+            return False  # another worker was faster
+        if not self._is_expired(reclaimed):
+            # the lease was replaced by a live one after we read it: put it back
+            try:
+                os.link(reclaimed, path)
+            except FileExistsError:
+                pass  # the task was claimed again in the meantime, the old owner loses it
+            reclaimed.unlink()
+            return False
+        reclaimed.unlink()
+        logger.warning(f"Reclaimed expired lease on {task}")
+        return True
+
+    def claim(self, task: str) -> Lease | None:
+        """lease `task` for this worker. None if it is done or leased by a live worker"""
+        if self.is_done(task):
+            return None
+        lease = self._create(task)
+        if lease is None and self._reclaim(task):
+            lease = self._create(task)
+        if lease is not None and self.is_done(task):
+            # finished by the previous owner between the checks
+            self.release(lease)
+            return None
+        return lease
+
+    def renew(self, lease: Lease) -> bool:
+        """extend `lease`. false if it expired or was taken over, the work should be abandoned"""
+        now = time.time()
+        current = _read_json(self.lease_path(lease.task))
+        if (
+            current is None
+            or current["token"] != lease.token
+            or lease.expires_at - self.clock_margin < now
+        ):
+            lease.lost.set()
+            return False
+        lease.expires_at = now + self.lease_seconds
+        _write_json_atomic(self.lease_path(lease.task), lease.to_dict())
+        return True
+
+    def release(self, lease: Lease):
+        """give up `lease` without finishing the task"""
+        current = _read_json(self.lease_path(lease.task))
+        if current is not None and current["token"] == lease.token:
+            self.lease_path(lease.task).unlink(missing_ok=True)
+
+    def commit(self, lease: Lease, outputs: Iterable[Path], error: str | None = None) -> bool:
+        """
+        mark the task of `lease` as done, after its outputs were written.
+        false if the lease was lost before, the task then stays with its new owner
+        """
+        if not self.renew(lease):
+            logger.warning(f"Lost lease on {lease.task}, not committing")
+            return False
+        marker = {
+            "task": lease.task,
+            "owner": self.worker_id,
+            "finished_at": time.time(),
+            "outputs": [str(o) for o in outputs],
+            "error": error,
+        }
+        _write_json_atomic(self.done_path(lease.task), marker)
+        self.release(lease)
+        return True
+
+    def fail(self, lease: Lease, error: str) -> bool:
+        """
+        record a failed attempt at the task of `lease` and release it for a retry, or mark
+        it done with `error` after `max_attempts`. true if the task was given up
+        """
+        if not self.renew(lease):
+            logger.warning(f"Lost lease on {lease.task}, not recording its failure")
+            return False
+        failed_path = self.failed_path(lease.task)
+        failures: dict = _read_json(failed_path) or {"task": lease.task, "errors": []}
+        failures["errors"].append(
+            {"owner": self.worker_id, "failed_at": time.time(), "error": error}
+        )
+        _write_json_atomic(failed_path, failures)
+        attempts = len(failures["errors"])
+        if attempts < self.max_attempts:
+            logger.warning(f"Attempt {attempts} at {lease.task} failed, releasing it for a retry")
+            self.release(lease)
+            return False
+        logger.error(f"Giving up on {lease.task} after {attempts} failed attempts")
+        return self.commit(lease, [], error=error)
+
+    @contextmanager
+    def heartbeat(self, lease: Lease, interval: float | None = None):
+        """renew `lease` in a background thread while the block runs"""
+        interval = interval or self.lease_seconds / 3
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                if not self.renew(lease):
+                    logger.warning(f"Lost lease on {lease.task}")
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield lease
+        finally:
+            stop.set()
+            thread.join()
+
+    def claimed(self, tasks: Iterable[str]) -> Iterator[Lease]:
+        """
+        Claim and yield leases until every task is done. Tasks leased by other workers are
+        retried after `poll_seconds`, so tasks of dead workers are picked up once their leases
+        expire. The caller commits each lease (or `fail`s it); leases that were not committed
+        are released, and their tasks retried like leased ones.
+        """
+        pending = list(tasks)
+        while pending:
+            waiting = []
+            for task in pending:
+                if self.is_done(task):
+                    continue
+                lease = self.claim(task)
+                if lease is None:
+                    waiting.append(task)
+                    continue
+                yield lease
+                if not self.is_done(task):
+                    self.release(lease)
+                    waiting.append(task)
+            pending = [task for task in waiting if not self.is_done(task)]
+            if pending:
+                time.sleep(self.poll_seconds)
+
+    def run(self, tasks: Iterable[str], work: Callable[[str], list[Path]]):
+        """
+        run `work(task)` for the tasks this worker claims. `work` returns its outputs, and
+        raises if the task failed, which is then retried, see `fail`
+        """
+        for lease in self.claimed(tasks):
+            with self.heartbeat(lease):
+                try:
+                    outputs, error = work(lease.task), None
+                except Exception as ex:
+                    logger.error(f"Error processing {lease.task}: {ex}")
+                    outputs, error = [], str(ex)
+            if error is None:
+                self.commit(lease, outputs)
+            else:
+                self.fail(lease, error)
@@ -0,0 +1,118 @@
+import polars as pl
+from rapidfuzz.distance import DamerauLevenshtein
+from rapidfuzz.process import cpdist
+
+ERROR_CLASSES = [
+    "match",
+    "missing",
+    "capitalization",
+    "special chars",
+    "typo",
+    "synonym",
+    "token subset",
+    "unknown",
+]
+ErrorClass = pl.Enum(ERROR_CLASSES)
+SPECIAL_CHARS = r"[^\p{L}\p{N}]+"
+MAX_TYPO_DISTANCE = 2
+BATCH_SIZE = 200_000
+
+
+def _tokens(expr: pl.Expr) -> pl.Expr:
+    return expr.str.extract_all(r"[\p{L}\p{N}]+")
+
+
+def _expansions_intersect(values: list[str], truths: list[str]) -> list[bool]:
+    from postal.expand import expand_address  # loads the libpostal models
+
+    return [bool(set(expand_address(v)) & set(expand_address(t))) for v, t in zip(values, truths)]
+
+
+def classify_column(values: pl.Series, truth: pl.Series, synonyms: bool = True) -> pl.Series:
+    """
+    Error class of every cell of `values` compared to `truth`. The cheap classes are column
+    expressions; typos are scored with a batch Damerau-Levenshtein scorer and the libpostal
+    synonym check only runs on the cells left over by all other classes.
+    """
+    df = pl.DataFrame({"v": values, "t": truth}).with_columns(
+        pl.col("v").str.to_lowercase().alias("vl"), pl.col("t").str.to_lowercase().alias("tl")
+    )
+    vl, tl = pl.col("vl"), pl.col("tl")
+    labels = df.select(
+        pl.when(pl.col("v").eq_missing(pl.col("t")))
+        .then(pl.lit("match"))
+        .when(pl.col("v").is_null())
+        .then(pl.lit("missing"))
+        .when(pl.col("t").is_null())
+        .then(pl.lit("unknown"))
+        .when(vl == tl)
+        .then(pl.lit("capitalization"))
+        .when(vl.str.replace_all(SPECIAL_CHARS, "") == tl.str.replace_all(SPECIAL_CHARS, ""))
+        .then(pl.lit("special chars"))
+    ).to_series()
+
+    pending = labels.is_null()
+    rest = df.filter(pending)
+    distance = cpdist(
+        rest["vl"].to_list(), rest["tl"].to_list(), scorer=DamerauLevenshtein.distance, workers=-1
+    )
+    rest = rest.with_columns(pl.Series("distance", distance), pl.lit(False).alias("synonym"))
+    if synonyms:
+        candidates = rest.with_row_index().filter(pl.col("distance") > MAX_TYPO_DISTANCE)
+        is_synonym = _expansions_intersect(candidates["vl"].to_list(), candidates["tl"].to_list())
+        synonym = rest["synonym"].scatter(
+            candidates["index"], pl.Series(is_synonym, dtype=pl.Boolean)
+        )
+        rest = rest.with_columns(synonym)
+    v_tokens, t_tokens = _tokens(vl), _tokens(tl)
+    rest_labels = rest.select(
+        pl.when(pl.col("distance") <= MAX_TYPO_DISTANCE)
+        .then(pl.lit("typo"))
+        .when(pl.col("synonym"))
+        .then(pl.lit("synonym"))
+        .when(
+            (v_tokens.list.set_difference(t_tokens).list.len() == 0)
+            | (t_tokens.list.set_difference(v_tokens).list.len() == 0)
+        )
+        .then(pl.lit("token subset"))
+        .otherwise(pl.lit("unknown"))
+    ).to_series()
+    return labels.scatter(pending.arg_true(), rest_labels).cast(ErrorClass).alias(values.name)
+
+
+def classify_errors(
+    values: pl.DataFrame, truth: pl.DataFrame, synonyms: bool = True
+) -> pl.DataFrame:
+    """per cell error classes of a dirty table, with the columns of `values`"""
+    return pl.DataFrame([classify_column(values[c], truth[c], synonyms) for c in values.columns])
+
+
+def error_breakdown(
+    values: pl.LazyFrame, truth: pl.LazyFrame, synonyms: bool = True, batch_size: int = BATCH_SIZE
+) -> pl.DataFrame:
+    """
+    Cell counts per column and error class. The tables are classified in streaming batches, so
+    memory is bounded by the batch size, not by the dataset variant.
+    returns: a frame with the columns (column, error_class, count)
+    """
+    columns = values.collect_schema().names()
+    truth_columns = [f"{c}/truth" for c in columns]
+    lf = pl.concat([values, truth.rename(dict(zip(columns, truth_columns)))], how="horizontal")
+    counts = []
+    for batch in lf.collect_batches(chunk_size=batch_size):
+        errors = classify_errors(
+            batch.select(columns),
+            batch.select(truth_columns).rename(dict(zip(truth_columns, columns))),
+            synonyms,
+        )
+        counts.append(
+            errors.unpivot(variable_name="column", value_name="error_class")
+            .group_by(pl.all())
+            .len()
+        )
+    return (
+        pl.concat(counts)
+        .group_by("column", "error_class")
+        .agg(pl.col("len").sum().alias("count"))
+        .sort(pl.col("column").cast(pl.Enum(columns)), "error_class")
+    )
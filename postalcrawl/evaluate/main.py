@@ -0,0 +1,72 @@
+import argparse
+from pathlib import Path
+
+import polars as pl
+from loguru import logger
+
+from postalcrawl.evaluate.errors import error_breakdown
+from postalcrawl.evaluate.metrics import apply_cells, evaluate_repair, read_cells, scan_table
+from postalcrawl.utils import project_root
+
+DATASET_DIR = project_root() / "data" / "v1"
+# holoclean lowercases its repair, so truth and dirty are lowercased for the comparison as well
+LOWERCASE_REPAIRS = {"holoclean"}
+
+
+def load_repair(dataset_dir: Path, dirty: pl.LazyFrame, repair: str) -> pl.LazyFrame:
+    """repair from `cells.<repair>.json`, `repaired.<repair>.csv` or `<repair>.repaired.csv`"""
+    cells_file = dataset_dir / f"cells.{repair}.json"
+    if cells_file.is_file():
+        return apply_cells(dirty, read_cells(cells_file))
+    for csv_file in [
+        dataset_dir / f"repaired.{repair}.csv",
+        dataset_dir / f"{repair}.repaired.csv",
+    ]:
+        if csv_file.is_file():
+            return scan_table(csv_file)
+    raise FileNotFoundError(f"No repair '{repair}' in {dataset_dir}")
+
+
+def main(
+    dataset: str = "2k",
+    repairs: list[str] | None = None,
+    errors: bool = False,
+    synonyms: bool = True,
+    lower_case: bool = False,
+):
+    dataset_dir = Path(dataset) if Path(dataset).is_dir() else DATASET_DIR / dataset
+    dirty = scan_table(dataset_dir / "values.csv")
+    truth = scan_table(dataset_dir / "targets.csv")
+
+    for repair in repairs or []:
+        df_repair = load_repair(dataset_dir, dirty, repair)
+        scores = evaluate_repair(
+            dirty, truth, df_repair, lower_case=lower_case or repair in LOWERCASE_REPAIRS
+        )
+        p, r, f, edr = (
+            scores.filter(pl.col("column") == "total")
+            .select("precision", "recall", "f1", "edr")
+            .row(0)
+        )
+        logger.info(f"{dataset_dir.name} {repair} {p=:.2%} {r=:.2%} {f=:.2%} {edr=:.2%}")
+        print(scores)
+
+    if errors:
+        breakdown = error_breakdown(dirty, truth, synonyms=synonyms)
+        print(breakdown.pivot(on="error_class", index="column", values="count").fill_null(0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate data cleaning repairs of a dataset")
+    parser.add_argument("dataset", help="dataset variant in data/v1 (e.g. 2k) or a directory")
+    parser.add_argument(
+        "--repair",
+        action="append",
+        dest="repairs",
+        help="repair to evaluate, e.g. baran, raha-baran or holoclean. can be repeated",
+    )
+    parser.add_argument("--errors", action="store_true", help="error class breakdown of values")
+    parser.add_argument("--no-synonyms", action="store_true", help="skip the libpostal synonyms")
+    parser.add_argument("--lowercase", action="store_true", help="compare lowercased values")
+    args = parser.parse_args()
+    main(args.dataset, args.repairs, args.errors, not args.no_synonyms, args.lowercase)
@@ -0,0 +1,115 @@
+from pathlib import Path
+
+import polars as pl
+
+ROW_INDEX = "_row"
+TRUTH_SUFFIX = "/truth"
+REPAIR_SUFFIX = "/repair"
+COUNT_COLUMNS = ["changed", "correct", "changed_errors", "errors", "errors_before", "errors_after"]
+
+
+def scan_table(path: Path) -> pl.LazyFrame:
+    """dirty, truth or repaired csv. all columns are read as strings, e.g. to keep postcode zeros"""
+    return pl.scan_csv(path, infer_schema=False)
+
+
+def read_cells(path: Path) -> pl.DataFrame:
+    """Baran / Raha `cells.*.json`: a list of `{"row": int, "col": int, "value": str}` repairs"""
+    cells = pl.read_json(path, schema={"row": pl.Int64, "col": pl.Int64, "value": pl.String})
+    return cells.unique(["row", "col"], keep="last", maintain_order=True)
+
+
+def apply_cells(dirty: pl.LazyFrame, cells: pl.DataFrame) -> pl.LazyFrame:
+    """repaired table: the dirty table with the values of `cells` joined in, one column at a time"""
+    columns = dirty.collect_schema().names()
+    lf = dirty.with_row_index(ROW_INDEX).with_columns(pl.col(ROW_INDEX).cast(pl.Int64))
+    for col_idx, col in enumerate(columns):
+        updates = (
+            cells.lazy()
+            .filter(pl.col("col") == col_idx)
+            .select(pl.col("row").alias(ROW_INDEX), "value", pl.lit(True).alias("_updated"))
+        )
+        lf = (
+            lf.join(updates, on=ROW_INDEX, how="left", maintain_order="left")
+            .with_columns(pl.when("_updated").then("value").otherwise(col).alias(col))
+            .drop("value", "_updated")
+        )
+    return lf.drop(ROW_INDEX)
+
+
+def lowercase(lf: pl.LazyFrame) -> pl.LazyFrame:
+    return lf.with_columns(pl.col(pl.String).str.to_lowercase())
+
+
+def cell_counts(
+    dirty: pl.LazyFrame, truth: pl.LazyFrame, repair: pl.LazyFrame, lower_case: bool = False
+) -> pl.DataFrame:
+    """
+    Per column cell counts for the repair metrics, in one streaming pass over the three tables:
+    - changed: cells where the repair differs from the dirty value
+    - correct: changed cells that equal the truth
+    - changed_errors: changed cells that were wrong in the dirty table
+    - errors: non-null dirty cells that differ from the truth
+    - errors_before / errors_after: dirty / repaired cells that differ from the truth, with
+      missing values counted as errors
+    """
+    if lower_case:
+        dirty, truth, repair = lowercase(dirty), lowercase(truth), lowercase(repair)
+    columns = dirty.collect_schema().names()
+    lf = pl.concat(
+        [
+            dirty,
+            truth.rename({c: c + TRUTH_SUFFIX for c in columns}),
+            repair.rename({c: c + REPAIR_SUFFIX for c in columns}),
+        ],
+        how="horizontal",
+    )
+    exprs = []
+    for col in columns:
+        d, t, r = pl.col(col), pl.col(col + TRUTH_SUFFIX), pl.col(col + REPAIR_SUFFIX)
+        changed = d.ne_missing(r)
+        error = d.ne(t).fill_null(False)
+        exprs += [
+            changed.sum().alias(f"{col}:changed"),
+            (changed & r.eq_missing(t)).sum().alias(f"{col}:correct"),
+            (changed & error).sum().alias(f"{col}:changed_errors"),
+            error.sum().alias(f"{col}:errors"),
+            d.ne(t).fill_null(True).sum().alias(f"{col}:errors_before"),
+            r.ne(t).fill_null(True).sum().alias(f"{col}:errors_after"),
+        ]
+    counts = lf.select(exprs).collect(engine="streaming")
+    return (
+        counts.unpivot()
+        .with_columns(pl.col("variable").str.split_exact(":", 1).struct.unnest())
+        .pivot(on="field_1", index="field_0", values="value")
+        .rename({"field_0": "column"})
+        .select("column", pl.col(COUNT_COLUMNS).cast(pl.Int64))
+    )
+
+
+def repair_scores(counts: pl.DataFrame) -> pl.DataFrame:
+    """precision, recall, f1 and error distance ratio per column and in total"""
+    total = counts.select(pl.lit("total").alias("column"), pl.exclude("column").sum())
+    precision = pl.col("correct") / pl.col("changed")
+    recall = pl.col("changed_errors") / pl.col("errors")
+    return (
+        pl.concat([counts, total])
+        .with_columns(precision.alias("precision"), recall.alias("recall"))
+        .with_columns(
+            (
+                2
+                * pl.col("precision")
+                * pl.col("recall")
+                / (pl.col("precision") + pl.col("recall"))
+            ).alias("f1"),
+            ((pl.col("errors_before") - pl.col("errors_after")) / pl.col("errors_before")).alias(
+                "edr"
+            ),
+        )
+    )
+
+
+def evaluate_repair(
+    dirty: pl.LazyFrame, truth: pl.LazyFrame, repair: pl.LazyFrame, lower_case: bool = False
+) -> pl.DataFrame:
+    return repair_scores(cell_counts(dirty, truth, repair, lower_case))
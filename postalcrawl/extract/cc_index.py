@@ -0,0 +1,89 @@
+import gzip
+import json
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+import polars as pl
+import yarl
+
+from postalcrawl.stats import StatCounter
+
+HTML_MIME_TYPES = ("text/html", "application/xhtml+xml")
+
+
+@dataclass(frozen=True, slots=True)
+class IndexEntry:
+    url: str
+    filename: str  # file id relative to data.commoncrawl.org
+    offset: int
+    length: int
+    mime: str | None = None
+
+    @property
+    def host(self) -> str | None:
+        return yarl.URL(self.url).host
+
+
+def read_cdx_index(index_file: Path) -> Iterator[IndexEntry]:
+    """
+    Read a CDXJ index file (`<surt> <timestamp> <json>` per line), optionally gzip-compressed.
+    """
+    opener = gzip.open if Path(index_file).suffix == ".gz" else open
+    with opener(index_file, "rt", encoding="utf-8") as f:
+        for line in f:
+            _, _, fields = line.strip().split(" ", 2)
+            data = json.loads(fields)
+            yield IndexEntry(
+                url=data["url"],
+                filename=data["filename"],
+                offset=int(data["offset"]),
+                length=int(data["length"]),
+                mime=data.get("mime-detected") or data.get("mime"),
+            )
+
+
+def read_columnar_index(
+    parquet_files: Path | list[Path], mime_types: Iterable[str] = HTML_MIME_TYPES
+) -> Iterator[IndexEntry]:
+    """
+    Read the columnar (parquet) Common Crawl index. The mime filter is pushed down to the scan.
+    """
+    lf = (
+        pl.scan_parquet(parquet_files)
+        .filter(pl.col("content_mime_detected").is_in(list(mime_types)))
+        .select(
+            pl.col("url"),
+            pl.col("warc_filename").alias("filename"),
+            pl.col("warc_record_offset").alias("offset"),
+            pl.col("warc_record_length").alias("length"),
+            pl.col("content_mime_detected").alias("mime"),
+        )
+    )
+    for row in lf.collect().iter_rows(named=True):
+        yield IndexEntry(**row)
+
+
+def filter_index_entries(
+    entries: Iterable[IndexEntry],
+    stats: StatCounter,
+    mime_types: Iterable[str] | None = HTML_MIME_TYPES,
+    host_allowlist: set[str] | None = None,
+) -> Iterator[IndexEntry]:
+    """
+    Select index entries by MIME type and, optionally, by host.
+
+    input: all index entries of a crawl (or a subset of it).
+    output: entries whose records should be fetched.
+    """
+    mime_types = set(mime_types) if mime_types is not None else None
+    for entry in entries:
+        stats.inc("index/entry")
+        if mime_types is not None and entry.mime not in mime_types:
+            continue
+        if host_allowlist is not None and entry.host not in host_allowlist:
+            stats.inc("index/host_excluded")
+            continue
+        stats.inc("index/selected")
+        stats.inc("index/selected_bytes", entry.length)
+        yield entry
@@ -0,0 +1,89 @@
+import json
+import shutil
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from postalcrawl.extract.warc_loaders import RecordCursor
+from postalcrawl.record import Record
+from postalcrawl.stats import StatCounter
+
+CHECKPOINT_SECONDS = 30.0
+STATE_FILE = "state.json"
+RECORDS_FILE = "records.jsonl"
+
+
+class SegmentCheckpoint(RecordCursor):
+    """
+    Record-level checkpoint of a segment extraction, in a directory next to its output: the
+    offset of the next WARC record, and the outputs and stats of all records before it.
+
+    Checkpoints are taken at record boundaries, at most every `interval` seconds. The serial
+    pipeline has emitted all outputs of a record before it reads the next one, so at a
+    boundary `records` and `stats` are complete up to the offset. New outputs are appended to
+    a jsonl file; the state file, replaced atomically after them, says how many lines count.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        version: str,
+        stats: StatCounter,
+        interval: float = CHECKPOINT_SECONDS,
+    ):
+        super().__init__()
+        self.directory = directory
+        self.version = version
+        self.stats = stats
+        self.interval = interval
+        self.records: list[Record[dict]] = []  # the outputs, appended to by the caller
+        self.n_written = 0
+        self.last_write = time.monotonic()
+
+    def resume(self) -> bool:
+        """
+        Continue from the checkpoint of an earlier attempt with the same version: restores the
+        offset, outputs and stats. returns: whether there was one
+        """
+        try:
+            with open(self.directory / STATE_FILE) as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = None
+        if state is None or state["version"] != self.version:
+            self.clear()
+            return False
+        with open(self.directory / RECORDS_FILE, "r+b") as f:
+            self.records = [json.loads(f.readline()) for _ in range(state["records"])]
+            f.truncate(f.tell())  # outputs appended after the last state
+        self.n_written = len(self.records)
+        self.offset = state["offset"]
+        self.stats.merge(state["stats"])
+        return True
+
+    def advance(self, offset: int):
+        self.offset = offset
+        if time.monotonic() - self.last_write >= self.interval:
+            self.write()
+
+    def write(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / RECORDS_FILE, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in self.records[self.n_written :])
+        self.n_written = len(self.records)
+        state = {
+            "version": self.version,
+            "offset": self.offset,
+            "records": self.n_written,
+            "stats": self.stats.snapshot(),
+        }
+        tmp_path = self.directory / f"{STATE_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        tmp_path.replace(self.directory / STATE_FILE)
+        self.last_write = time.monotonic()
+        logger.debug(f"Checkpoint at byte {self.offset} with {self.n_written} records")
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,256 @@
+import argparse
+import io
+import math
+import random
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from statistics import NormalDist, fmean, variance
+
+import requests
+from loguru import logger
+from warcio import ArchiveIterator
+from warcio.recordloader import ArcWarcRecord
+
+from postalcrawl.extract.extract import extract_pipeline
+from postalcrawl.extract.parallel_gzip import find_member_candidates, inflate_member
+from postalcrawl.extract.warc_loaders import CC_DATA_URL, CC_PATHS_FILE, range_session
+from postalcrawl.stats import StatCounter
+
+PROBE_BYTES = 2 * 1024 * 1024  # larger than the 1 MiB truncation limit of CC records
+N_SEGMENTS = 20
+N_PROBES = 8
+CONFIDENCE = 0.95
+# stats that are extrapolated to the whole crawl. "error" sums all "error/" counters,
+# "time/segment_s" is the projected processing time of a segment
+ESTIMATE_KEYS = [
+    "warc/record",
+    "warc/html_response",
+    "extract/address",
+    "error",
+    "time/segment_s",
+]
+
+
+@dataclass(frozen=True, slots=True)
+class Estimate:
+    key: str
+    total: float
+    low: float
+    high: float
+
+
+@dataclass(slots=True)
+class SegmentSample:
+    file_id: str
+    size: int
+    fetched_bytes: int
+    covered_bytes: int  # compressed bytes of the complete records that were processed
+    fetch_s: float
+    process_s: float
+    stats: StatCounter
+
+    def projected(self, key: str) -> float:
+        """`key` extrapolated from the sampled bytes to the whole segment"""
+        scale = self.size / self.covered_bytes
+        if key == "time/segment_s":
+            download_s = self.fetch_s * self.size / self.fetched_bytes
+            return download_s + self.process_s * scale
+        if key == "error":
+            return self.stats.sum_prefix("error/") * scale
+        return self.stats.get(key, 0) * scale
+
+
+def t_quantile(p: float, df: int) -> float:
+    """student t quantile, from the normal quantile by a Cornish-Fisher expansion"""
+    z = NormalDist().inv_cdf(p)
+    return (
+        z
+        + (z**3 + z) / (4 * df)
+        + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+        + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+    )
+
+
+def probe_windows(
+    size: int, n_probes: int, probe_bytes: int, rng: random.Random
+) -> list[tuple[int, int]]:
+    """
+    (offset, length) of a random window in each of `n_probes` equal strata of the segment, so
+    probes spread over the whole segment and do not overlap. segments too small for that are
+    read as a whole, a single window from the start would not be a sample of the segment
+    """
+    stratum = size // n_probes
+    if stratum <= probe_bytes:
+        return [(0, size)]
+    return [
+        (i * stratum + rng.randrange(stratum - probe_bytes), probe_bytes) for i in range(n_probes)
+    ]
+
+
+def window_records(window: bytes, stats: StatCounter) -> tuple[bytes, int]:
+    """
+    The complete WARC records of a byte window at an arbitrary offset of a .warc.gz file.
+    Each record is its own gzip member: skip to the first member that starts a record and
+    inflate members until the window cuts one off.
+    returns: (uncompressed records, compressed bytes they span)
+    """
+    for start in find_member_candidates(window):
+        member = inflate_member(window[start:])
+        if member is not None and member[1] and member[0].startswith(b"WARC/"):
+            break
+    else:
+        stats.inc("estimate/empty_probe")
+        return b"", 0
+    parts, pos = [], start
+    while pos < len(window):
+        member = inflate_member(window[pos:])
+        if member is None or not member[1]:
+            break
+        data, _, unused = member
+        parts.append(data)
+        pos = len(window) - len(unused)
+    return b"".join(parts), pos - start
+
+
+def counted_records(records: bytes, stats: StatCounter) -> Iterator[ArcWarcRecord]:
+    for record in ArchiveIterator(io.BytesIO(records), arc2warc=True):
+        stats.inc("warc/record")
+        yield record
+
+
+def fetch_window(
+    session: requests.Session, url: str, offset: int, length: int
+) -> tuple[bytes, float]:
+    start_time = time.perf_counter()
+    resp = session.get(url, headers={"Range": f"bytes={offset}-{offset + length - 1}"}, timeout=60)
+    resp.raise_for_status()
+    if resp.status_code != 206 and offset > 0:
+        raise ValueError(f"Server ignored range request for {url}")
+    return resp.content, time.perf_counter() - start_time
+
+
+def segment_size(session: requests.Session, url: str) -> int:
+    resp = session.head(url, timeout=60)
+    resp.raise_for_status()
+    return int(resp.headers["Content-Length"])
+
+
+def sample_segment(
+    session: requests.Session,
+    pool: ThreadPoolExecutor,
+    file_id: str,
+    rng: random.Random,
+    base_url: str = CC_DATA_URL,
+    n_probes: int = N_PROBES,
+    probe_bytes: int = PROBE_BYTES,
+    n_threads: int = 0,
+) -> SegmentSample:
+    """run the extraction on random windows of a segment, fetched by range requests"""
+    url = base_url + file_id
+    size = segment_size(session, url)
+    windows = probe_windows(size, n_probes, probe_bytes, rng)
+    futures = [pool.submit(fetch_window, session, url, o, n) for o, n in windows]
+    stats = StatCounter()
+    fetched = covered = 0
+    fetch_s = process_s = 0.0
+    for future in futures:
+        window, elapsed = future.result()
+        fetch_s += elapsed
+        fetched += len(window)
+        stats.inc("estimate/probe")
+        start_time = time.perf_counter()
+        records, covered_bytes = window_records(window, stats)
+        for _ in extract_pipeline(counted_records(records, stats), stats, n_threads=n_threads):
+            stats.inc("extract/address")
+        process_s += time.perf_counter() - start_time
+        covered += covered_bytes
+    return SegmentSample(file_id, size, fetched, covered, fetch_s, process_s, stats)
+
+
+def extrapolate(
+    samples: list[SegmentSample],
+    n_segments: int,
+    keys: list[str] = ESTIMATE_KEYS,
+    confidence: float = CONFIDENCE,
+) -> dict[str, Estimate]:
+    """
+    Crawl totals from a simple random sample of segments (two-stage sampling). Each sampled
+    segment's counts are scaled up by its size over the bytes covered by its probes; the total
+    is `n_segments` times the mean of these, with a t confidence interval from the variance
+    between segments (which includes the variance between the probes of a segment).
+    """
+    samples = [s for s in samples if s.covered_bytes > 0]
+    assert len(samples) >= 2, "need at least two sampled segments with complete records"
+    m = len(samples)
+    fpc = max(1 - m / n_segments, 0.0)  # finite population correction
+    t = t_quantile(0.5 + confidence / 2, m - 1)
+    estimates = {}
+    for key in keys:
+        values = [s.projected(key) for s in samples]
+        total = n_segments * fmean(values)
+        margin = t * n_segments * math.sqrt(fpc * variance(values) / m)
+        estimates[key] = Estimate(key, total, max(total - margin, 0.0), total + margin)
+    return estimates
+
+
+def estimate_yield(
+    paths: list[str],
+    n_segments: int = N_SEGMENTS,
+    n_probes: int = N_PROBES,
+    probe_bytes: int = PROBE_BYTES,
+    n_workers: int = 6,
+    seed: int = 0,
+    base_url: str = CC_DATA_URL,
+    n_threads: int = 0,
+) -> dict[str, Estimate]:
+    """
+    Estimate what extracting all WARC files in `paths` yields, and how long it takes, from
+    `n_segments` random segments with `n_probes` random windows each: minutes instead of days.
+    "time/wall_s" is the projected wall time of a run with `n_workers` parallel processes,
+    as in `main`.
+    """
+    rng = random.Random(seed)
+    sampled = rng.sample(paths, min(n_segments, len(paths)))
+    samples = []
+    session = range_session(2 * n_probes)
+    with session, ThreadPoolExecutor(max_workers=n_probes) as pool:
+        for file_id in sampled:
+            try:
+                sample = sample_segment(
+                    session, pool, file_id, rng, base_url, n_probes, probe_bytes, n_threads
+                )
+            except (requests.RequestException, ValueError) as ex:
+                logger.warning(f"Failed to sample {file_id}: {ex}")
+                continue
+            samples.append(sample)
+            logger.info(
+                f"[{file_id}] {sample.stats['estimate/probe']} probes, {sample.covered_bytes} of"
+                f" {sample.size} bytes: {sample.stats['extract/address']} addresses"
+            )
+    estimates = extrapolate(samples, len(paths))
+    segment_time = estimates["time/segment_s"]
+    estimates["time/wall_s"] = Estimate(
+        "time/wall_s",
+        segment_time.total / n_workers,
+        segment_time.low / n_workers,
+        segment_time.high / n_workers,
+    )
+    for e in estimates.values():
+        logger.info(f"{e.key:<20} {e.total:>16,.1f}  [{e.low:,.1f}, {e.high:,.1f}]")
+    return estimates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="estimate the yield of extracting a crawl")
+    parser.add_argument("paths_file", type=Path, nargs="?", default=CC_PATHS_FILE)
+    parser.add_argument("--segments", type=int, default=N_SEGMENTS)
+    parser.add_argument("--probes", type=int, default=N_PROBES)
+    parser.add_argument("--workers", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with open(args.paths_file) as f:
+        warc_paths = [p.strip() for p in f if p.strip()]
+    estimate_yield(warc_paths, args.segments, args.probes, n_workers=args.workers, seed=args.seed)
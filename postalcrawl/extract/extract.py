@@ -1,24 +1,46 @@
+import io
+import itertools
 import json
 import sys
-from typing import Callable, Iterable, Iterator
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 
 from loguru import logger
 from parsel import Selector
 from warcio.recordloader import ArcWarcRecord
 
-from postalcrawl.extract.utils import parse_content_type
+from postalcrawl.extract.host_skip import HOST_RESPONSE_PREFIX, HostSkipList, url_host
+from postalcrawl.extract.memo import ParseMemo
+from postalcrawl.extract.structured_data import (
+    DEFAULT_SYNTAXES,
+    JSON_LD,
+    POSTAL_ADDRESS_MARKER,
+    mentions_postal_address,
+    needs_full_parse,
+    page_items,
+)
+from postalcrawl.extract.utils import MAX_BODY_BYTES, parse_content_type, scan_ld_json_scripts
 from postalcrawl.record import Record
 from postalcrawl.stats import StatCounter
 
 logger.remove()
 logger.add(sys.stdout, level="INFO")
 
+THREAD_BATCH_SIZE = 32
+
 
 def filter_html_responses(
-    record_generator: Iterable[ArcWarcRecord], stats: StatCounter
+    record_generator: Iterable[ArcWarcRecord],
+    stats: StatCounter,
+    skip_list: HostSkipList | None = None,
+    track_hosts: bool = False,
 ) -> Iterator[ArcWarcRecord]:
     """
     Filter WARC records to only include HTTP responses with HTML or XML content types.
+    Responses of hosts in `skip_list` are dropped before their body is read.
+    With `track_hosts`, html responses are counted per host for the host yield table.
 
     input: WARC records including requests, responses and metadata of any type.
     output: only WARC HTTP response records with HTML or XML content types.
@@ -32,7 +54,7 @@ def filter_html_responses(
         if content_type is None:
             stats.inc(f"warc/content_type/{None}")
             continue
-        media_type, charset = parse_content_type(content_type)
+        media_type, _ = parse_content_type(content_type)
         stats.inc(f"warc/content_type/{media_type}")
 
         # todo: maybe just check for content type contains text?
@@ -41,41 +63,61 @@ def filter_html_responses(
         if not_html and not_xml:
             continue
         stats.inc("warc/html_response")
+        if skip_list is not None or track_hosts:
+            url = record.rec_headers.get_header("WARC-Target-URI")
+            if skip_list is not None and skip_list.should_skip(url):
+                stats.inc("host_skip/skipped")
+                continue
+            if track_hosts and (host := url_host(url)):
+                stats.inc(HOST_RESPONSE_PREFIX + host)
         yield record
 
 
 def extractor_response_content(
-    response_generator: Iterable[ArcWarcRecord], stats: StatCounter
+    response_generator: Iterable[ArcWarcRecord],
+    stats: StatCounter,
+    max_body_bytes: int = MAX_BODY_BYTES,
 ) -> Iterator[Record[str]]:
     """
-    Extract and decode the content of WARC HTTP response records.
+    Extract and decode the JSON-LD script elements of WARC HTTP response records.
+    Bodies are scanned in bounded windows, reading at most `max_body_bytes` per record.
 
     input: WARC HTTP response records.
-    output: string containing the decoded response content + response metadata.
+    output: string containing the decoded ld+json script elements + response metadata.
     """
     for record in response_generator:
         content_type = record.http_headers.get_header("Content-Type")
-        media_type, charset = parse_content_type(content_type)
+        _, charset = parse_content_type(content_type)
         stats.inc(f"response/charset/{charset or None}")
 
-        raw_content: bytes = record.content_stream().read()
-        try:
-            content = raw_content.decode(charset or "utf-8", errors="replace")
-        except LookupError:  # likely invalid charset, fallback to utf-8
-            stats.inc(f"error/charset_unknown/{charset}")
-            content = raw_content.decode("utf-8", errors="replace")
-
+        raw_content, truncated = scan_ld_json_scripts(record.content_stream(), max_body_bytes)
+        if truncated:
+            stats.inc("response/truncated")
+        if not raw_content:
+            continue
         out: Record[str] = {
-            "data": content,
-            "crawl_metadata": {
-                "url": record.rec_headers.get_header("WARC-Target-URI"),
-                "warc_rec_id": record.rec_headers.get_header("WARC-Record-ID"),
-                "warc_date": record.rec_headers.get_header("WARC-Date"),
-            },
+            "data": decode_content(raw_content, charset, stats),
+            "crawl_metadata": crawl_metadata(record),
         }
         yield out
 
 
+def crawl_metadata(record: ArcWarcRecord) -> dict:
+    return {
+        "url": record.rec_headers.get_header("WARC-Target-URI"),
+        "warc_rec_id": record.rec_headers.get_header("WARC-Record-ID"),
+        "warc_date": record.rec_headers.get_header("WARC-Date"),
+    }
+
+
+def decode_content(raw_content: bytes, charset: str | None, stats: StatCounter) -> str:
+    try:
+        return raw_content.decode(charset or "utf-8", errors="replace")
+    except LookupError:  # likely invalid charset, fallback to utf-8
+        stats.inc(f"error/charset_unknown/{charset}")
+        return raw_content.decode("utf-8", errors="replace")
+
+
 def extract_ld_json(
     response_generator: Iterable[Record[str]], stats: StatCounter
 ) -> Iterator[Record[str]]:
@@ -101,19 +143,29 @@ def extract_ld_json(
             yield out
 
 
+def load_json(content: str) -> dict | json.decoder.JSONDecodeError:
+    """the deserialized json, or the error. errors are memoized as well"""
+    try:
+        return json.loads(content)
+    except json.decoder.JSONDecodeError as e:
+        return e
+
+
 def deserialize_json_records(
-    records: Iterable[Record[str]], stats: StatCounter
+    records: Iterable[Record[str]], stats: StatCounter, memo: ParseMemo | None = None
 ) -> Iterator[Record[dict]]:
+    """with a `memo`, repeated scripts are deserialized once, see `ParseMemo`"""
     for record in records:
         content = record["data"]
-        try:
-            deserialized: dict = json.loads(content)
-            out: Record[dict] = {"data": deserialized, "crawl_metadata": record["crawl_metadata"]}
-            yield out
-        except json.decoder.JSONDecodeError as e:
-            logger.debug(f"Failed to load as JSON with error: {e}\n{content[:60]}")
+        deserialized = (
+            load_json(content) if memo is None else memo.lookup(content, load_json, stats)
+        )
+        if isinstance(deserialized, json.decoder.JSONDecodeError):
+            logger.debug(f"Failed to load as JSON with error: {deserialized}\n{content[:60]}")
             stats.inc("error/json/decode_error")
             continue
+        out: Record[dict] = {"data": deserialized, "crawl_metadata": record["crawl_metadata"]}
+        yield out
 
 
 def extract_json_by_condition(
@@ -136,13 +188,185 @@ def extract_json_by_condition(
                 yield out
 
 
-def extract_pipeline(
-    warc_gen: Iterable[ArcWarcRecord], stats: StatCounter
+def ld_json_pipeline(
+    records: Iterable[Record[str]], stats: StatCounter, memo: ParseMemo | None = None
 ) -> Iterator[Record[dict]]:
-    gen = filter_html_responses(warc_gen, stats)
-    gen = extractor_response_content(gen, stats)
-    gen = (rec for rec in gen if "postaladdress" in rec["data"].lower())
+    """decoded ld+json script elements -> deserialized ld+json objects that mention an address"""
+    gen = (rec for rec in records if "postaladdress" in rec["data"].lower())
     gen = extract_ld_json(gen, stats)
     gen = (rec for rec in gen if "postaladdress" in rec["data"].lower())
-    gen = deserialize_json_records(gen, stats)
+    gen = deserialize_json_records(gen, stats, memo)
+    yield from gen
+
+
+@dataclass(slots=True)
+class RawResponse:
+    body: bytes
+    charset: str | None
+    crawl_metadata: dict
+
+
+def read_html_responses(
+    record_generator: Iterable[ArcWarcRecord],
+    stats: StatCounter,
+    skip_list: HostSkipList | None = None,
+    track_hosts: bool = False,
+    max_body_bytes: int = MAX_BODY_BYTES,
+) -> Iterator[RawResponse]:
+    """the sequential part of the threaded backend: read bounded bodies of html responses"""
+    for record in filter_html_responses(record_generator, stats, skip_list, track_hosts):
+        _, charset = parse_content_type(record.http_headers.get_header("Content-Type"))
+        stats.inc(f"response/charset/{charset or None}")
+        stream = record.content_stream()
+        chunks, size = [], 0
+        while size < max_body_bytes and (chunk := stream.read(max_body_bytes - size)):
+            chunks.append(chunk)
+            size += len(chunk)
+        body = b"".join(chunks)
+        if stream.read(1):
+            stats.inc("response/truncated")
+        yield RawResponse(body, charset, crawl_metadata(record))
+
+
+def ld_json_scripts(response: RawResponse, stats: StatCounter) -> Record[str] | None:
+    raw_content, _ = scan_ld_json_scripts(io.BytesIO(response.body), len(response.body))
+    if not raw_content:
+        return None
+    content = decode_content(raw_content, response.charset, stats)
+    return {"data": content, "crawl_metadata": response.crawl_metadata}
+
+
+def structured_data_records(
+    responses: Iterable[RawResponse],
+    stats: StatCounter,
+    syntaxes: tuple[str, ...],
+    memo: ParseMemo | None = None,
+) -> Iterator[Record[dict]]:
+    """
+    Multi-syntax extraction: JSON-LD, Microdata and RDFa items that mention an address, tagged
+    with their syntax in `crawl_metadata["syntax"]`. Pages without inline markup take the
+    cheap ld+json path; the others are parsed once for all syntaxes, see `page_items`.
+    """
+    for response in responses:
+        lower = response.body.lower()
+        if POSTAL_ADDRESS_MARKER not in lower:
+            continue
+        items: list[tuple[str, Record]] = []
+        if not needs_full_parse(lower, syntaxes):
+            scripts = ld_json_scripts(response, stats) if JSON_LD in syntaxes else None
+            if scripts is not None:
+                items = [(JSON_LD, rec) for rec in ld_json_pipeline([scripts], stats, memo)]
+        else:
+            stats.inc("extract/full_parse")
+            content = decode_content(response.body, response.charset, stats)
+            try:
+                found = list(page_items(content, syntaxes))
+            except ValueError:
+                stats.inc("error/parsel/not_html")
+                continue
+            for syntax, item in found:
+                if isinstance(item, str):  # ld+json text
+                    if POSTAL_ADDRESS_MARKER.decode() in item.lower():
+                        script: Record[str] = {
+                            "data": item,
+                            "crawl_metadata": response.crawl_metadata,
+                        }
+                        deserialized = deserialize_json_records([script], stats, memo)
+                        items += [(JSON_LD, r) for r in deserialized]
+                elif mentions_postal_address(item):
+                    record: Record[dict] = {
+                        "data": item,
+                        "crawl_metadata": response.crawl_metadata,
+                    }
+                    items.append((syntax, record))
+        for syntax, record in items:
+            stats.inc(f"extract/syntax/{syntax}")
+            out: Record[dict] = {
+                "data": record["data"],
+                "crawl_metadata": {**record["crawl_metadata"], "syntax": syntax},
+            }
+            yield out
+
+
+def process_responses(
+    batch: list[RawResponse],
+    syntaxes: tuple[str, ...] = DEFAULT_SYNTAXES,
+    memo: ParseMemo | None = None,
+) -> tuple[list[Record[dict]], StatCounter]:
+    """the parallel part of the threaded backend. each batch counts into its own stats"""
+    stats = StatCounter()
+    if syntaxes != DEFAULT_SYNTAXES:
+        return list(structured_data_records(batch, stats, syntaxes, memo)), stats
+    records = [rec for response in batch if (rec := ld_json_scripts(response, stats))]
+    return list(ld_json_pipeline(records, stats, memo)), stats
+
+
+def free_threading_enabled() -> bool:
+    return not getattr(sys, "_is_gil_enabled", lambda: True)()
+
+
+def threaded_extract_pipeline(
+    warc_gen: Iterable[ArcWarcRecord],
+    stats: StatCounter,
+    n_threads: int,
+    skip_list: HostSkipList | None = None,
+    track_hosts: bool = False,
+    batch_size: int = THREAD_BATCH_SIZE,
+    syntaxes: tuple[str, ...] = DEFAULT_SYNTAXES,
+    memo: ParseMemo | None = None,
+) -> Iterator[Record[dict]]:
+    """
+    Thread pool backend of `extract_pipeline`. The WARC stream is read sequentially; bodies are
+    scanned, decoded, parsed and deserialized in batches on `n_threads` threads, which share
+    the skip list and content type cache instead of copying them into worker processes.
+    Output order and stats are the same as with the serial pipeline.
+
+    On free-threaded builds (python3.13t) the threads run in parallel. On GIL builds the
+    result is the same, but only the parts that release the GIL (reading, zlib, lxml parsing)
+    overlap, so use process parallelism over segments (joblib in extract/main.py) to scale.
+    """
+    if n_threads > 1 and not free_threading_enabled():
+        logger.debug("GIL enabled: extraction threads will mostly run one at a time")
+    responses = read_html_responses(warc_gen, stats, skip_list, track_hosts)
+    batches = itertools.batched(responses, batch_size)
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        in_flight: deque[Future] = deque()
+        for batch in batches:
+            in_flight.append(executor.submit(process_responses, list(batch), syntaxes, memo))
+            if len(in_flight) >= 2 * n_threads:
+                records, batch_stats = in_flight.popleft().result()
+                stats.merge(batch_stats.snapshot())
+                yield from records
+        while in_flight:
+            records, batch_stats = in_flight.popleft().result()
+            stats.merge(batch_stats.snapshot())
+            yield from records
+
+
+def extract_pipeline(
+    warc_gen: Iterable[ArcWarcRecord],
+    stats: StatCounter,
+    skip_list: HostSkipList | None = None,
+    track_hosts: bool = False,
+    n_threads: int = 0,
+    syntaxes: tuple[str, ...] = DEFAULT_SYNTAXES,
+    memo: ParseMemo | None = None,
+) -> Iterator[Record[dict]]:
+    """
+    with `n_threads > 0`, runs on the thread pool backend `threaded_extract_pipeline`.
+    `syntaxes` other than the default (JSON-LD only) extract Microdata and RDFa items as well,
+    see `structured_data_records`. With a `memo`, repeated ld+json scripts are parsed once.
+    """
+    if n_threads > 0:
+        yield from threaded_extract_pipeline(
+            warc_gen, stats, n_threads, skip_list, track_hosts, syntaxes=syntaxes, memo=memo
+        )
+        return
+    if syntaxes != DEFAULT_SYNTAXES:
+        responses = read_html_responses(warc_gen, stats, skip_list, track_hosts)
+        yield from structured_data_records(responses, stats, syntaxes, memo)
+        return
+    gen = filter_html_responses(warc_gen, stats, skip_list=skip_list, track_hosts=track_hosts)
+    gen = extractor_response_content(gen, stats)
+    gen = ld_json_pipeline(gen, stats, memo)
     yield from gen
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import math
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+import yarl
+from loguru import logger
+
+from postalcrawl.record import Record
+from postalcrawl.stats import StatCounter
+
+HOST_RESPONSE_PREFIX = "host/response/"
+
+
+def url_host(url: str | None) -> str | None:
+    if not url:
+        return None
+    try:
+        return yarl.URL(url).host
+    except ValueError:
+        return None
+
+
+class HostYieldTable(dict[str, list[int]]):
+    """per-host [html responses, extracted address records], merged across segments and crawls"""
+
+    def add(self, host: str, responses: int = 0, addresses: int = 0):
+        counts = self.setdefault(host, [0, 0])
+        counts[0] += responses
+        counts[1] += addresses
+
+    def update_from_segment(self, records: Iterable[Record[dict]], stats: StatCounter):
+        """
+        Update from the output of one extracted segment. The per-host response counters are
+        removed from `stats`, so they don't end up in the segment's `.stats.json`.
+        """
+        for key in [k for k in stats if k.startswith(HOST_RESPONSE_PREFIX)]:
+            self.add(key.removeprefix(HOST_RESPONSE_PREFIX), responses=stats.pop(key))
+        for record in records:
+            if host := url_host(record["crawl_metadata"].get("url")):
+                self.add(host, addresses=1)
+
+    def merge(self, other: "HostYieldTable"):
+        for host, (responses, addresses) in other.items():
+            self.add(host, responses, addresses)
+
+    def save(self, outfile: Path):
+        with open(outfile, "w") as f:
+            json.dump(self, f)
+
+    @classmethod
+    def load(cls, infile: Path) -> "HostYieldTable":
+        with open(infile) as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_extract_dir(cls, extract_dir: Path) -> "HostYieldTable":
+        table = cls()
+        for host_file in Path(extract_dir).glob("**/*.hosts.json"):
+            table.merge(cls.load(host_file))
+        return table
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float = 0.001, bits: bytearray | None = None):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+@dataclass
+class SkipEstimate:
+    skipped_hosts: int
+    skipped_responses: int  # share of past html responses that would have been skipped
+    total_responses: int
+    lost_addresses: float  # expected addresses lost per crawl of the same size
+    total_addresses: int
+    seconds_saved: float
+
+    def __str__(self):
+        skipped_share = self.skipped_responses / max(self.total_responses, 1)
+        lost_share = self.lost_addresses / max(self.total_addresses, 1)
+        return (
+            f"skip {self.skipped_hosts} hosts ({skipped_share:.1%} of html responses, "
+            f"~{self.seconds_saved:.0f}s saved), "
+            f"expected loss {self.lost_addresses:.1f} addresses ({lost_share:.2%})"
+        )
+
+
+class HostSkipList:
+    """
+    Probabilistic set of hosts whose responses are skipped before the record body is read.
+    A deterministic `sample_rate` share of skipped responses is still scanned, so yields of
+    skipped hosts keep being observed and the table stays up to date.
+    """
+
+    def __init__(self, bloom: BloomFilter, sample_rate: float = 0.02):
+        self.bloom = bloom
+        self.sample_rate = sample_rate
+
+    def should_skip(self, url: str | None) -> bool:
+        host = url_host(url)
+        if host is None or host not in self.bloom:
+            return False
+        sample_hash = hashlib.blake2b(url.encode("utf-8"), digest_size=4).digest()  # pyright: ignore [reportOptionalMemberAccess]
+        return int.from_bytes(sample_hash, "little") / 2**32 >= self.sample_rate
+
+    def save(self, outfile: Path):
+        header = json.dumps(
+            {
+                "capacity": self.bloom.capacity,
+                "fp_rate": self.bloom.fp_rate,
+                "sample_rate": self.sample_rate,
+            }
+        )
+        with open(outfile, "wb") as f:
+            f.write(header.encode("utf-8") + b"\n")
+            f.write(self.bloom.bits)
+
+    @classmethod
+    def load(cls, infile: Path) -> "HostSkipList":
+        with open(infile, "rb") as f:
+            header = json.loads(f.readline())
+            bits = bytearray(f.read())
+        bloom = BloomFilter(header["capacity"], header["fp_rate"], bits=bits)
+        return cls(bloom, sample_rate=header["sample_rate"])
+
+
+def build_host_skip_list(
+    table: HostYieldTable,
+    recall: float = 0.99,
+    min_responses: int = 20,
+    fp_rate: float = 0.001,
+    sample_rate: float = 0.02,
+    seconds_per_response: float = 0.002,
+) -> tuple[HostSkipList, SkipEstimate]:
+    """
+    Select low-yield hosts to skip, such that the expected number of lost addresses stays
+    within `1 - recall` of all addresses observed.
+
+    The future yield of a host is estimated with add-one smoothing, (addresses + 1) /
+    (responses + 2), so a host that never yielded is still expected to lose some addresses.
+    Hosts with fewer than `min_responses` observed responses are never skipped. The
+    estimate also charges the bloom filter's false positives at the average yield.
+    """
+    total_responses = sum(r for r, _ in table.values())
+    total_addresses = sum(a for _, a in table.values())
+    mean_yield = total_addresses / max(total_responses, 1)
+    budget = (1 - recall) * total_addresses
+    # false positives skip non-listed hosts; charge them at the average yield
+    budget -= fp_rate * total_responses * mean_yield * (1 - sample_rate)
+
+    candidates = [
+        (host, responses, (addresses + 1) / (responses + 2))
+        for host, (responses, addresses) in table.items()
+        if responses >= min_responses
+    ]
+    candidates.sort(key=lambda c: c[2])
+
+    selected: list[str] = []
+    lost = 0.0
+    skipped_responses = 0
+    for host, responses, est_yield in candidates:
+        host_loss = est_yield * responses * (1 - sample_rate)
+        if lost + host_loss > budget:
+            break
+        selected.append(host)
+        lost += host_loss
+        skipped_responses += responses
+
+    bloom = BloomFilter(len(selected), fp_rate=fp_rate)
+    for host in selected:
+        bloom.add(host)
+    skipped_responses = int(skipped_responses * (1 - sample_rate))
+    estimate = SkipEstimate(
+        skipped_hosts=len(selected),
+        skipped_responses=skipped_responses,
+        total_responses=total_responses,
+        lost_addresses=lost + fp_rate * total_responses * mean_yield,
+        total_addresses=total_addresses,
+        seconds_saved=skipped_responses * seconds_per_response,
+    )
+    logger.info(f"Host skip list: {estimate}")
+    return HostSkipList(bloom, sample_rate=sample_rate), estimate
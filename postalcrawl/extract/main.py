@@ -1,67 +1,249 @@
+import hashlib
 import json
 import time
+from contextlib import nullcontext
 from pathlib import Path
 
 import joblib
 from loguru import logger
 
+from postalcrawl.coordination import LeaseCoordinator
+from postalcrawl.extract import checkpoint as checkpoint_module
+from postalcrawl.extract import extract as extract_module
+from postalcrawl.extract import host_skip, structured_data, warc_loaders
+from postalcrawl.extract import memo as memo_module
+from postalcrawl.extract import utils as extract_utils
+from postalcrawl.extract.cc_index import filter_index_entries, read_cdx_index
+from postalcrawl.extract.checkpoint import CHECKPOINT_SECONDS, SegmentCheckpoint
 from postalcrawl.extract.extract import (
     extract_pipeline,
 )
-from postalcrawl.extract.warc_loaders import download_record_generator
+from postalcrawl.extract.host_skip import HostSkipList, HostYieldTable, build_host_skip_list
+from postalcrawl.extract.memo import MEMO_SIZE, ParseMemo, log_memo_stats, process_memo
+from postalcrawl.extract.structured_data import DEFAULT_SYNTAXES
+from postalcrawl.extract.warc_loaders import (
+    CC_DATA_URL,
+    CC_PATHS_FILE,
+    download_record_generator,
+    range_record_generator,
+)
+from postalcrawl.manifest import StageManifest, code_version
+from postalcrawl.metrics import MetricsPusher
 from postalcrawl.stats import StatCounter
 from postalcrawl.utils import file_segment_info, project_root, write_to_jsongz
 
-CC_PATHS_FILE = project_root() / "warc_paths" / "2025-30.warc.paths"
 ADDRESS_OUT_DIR = project_root() / "data" / "extracted"
+# built from the `.hosts.json` files of previous runs with `build_skip_list`
+HOST_SKIP_FILE = project_root() / "data" / "host_skip.bin"
+
+
+def extract_version(skip_list: HostSkipList | None = None, **config) -> str:
+    if skip_list is not None:
+        config["skip_list"] = hashlib.blake2b(skip_list.bloom.bits, digest_size=16).hexdigest()
+    modules = (
+        extract_module,
+        extract_utils,
+        structured_data,
+        checkpoint_module,
+        memo_module,
+        host_skip,
+        warc_loaders,
+    )
+    return code_version(*modules, config=config)
 
 
-def extract_addresses_from_file_id(file_id: str, dest_dir: Path, skip_existing: bool = True):
+def write_extract_output(data: list, stats: StatCounter, out_path: Path) -> list[Path]:
+    write_to_jsongz(data, outfile=out_path)
+    stats_file = out_path.with_suffix("").with_suffix(".stats.json")
+    with open(stats_file, "w") as f:
+        json.dump(stats, f)
+    return [out_path, stats_file]
+
+
+def extract_addresses_from_file_id(
+    file_id: str,
+    dest_dir: Path,
+    skip_existing: bool = True,
+    skip_list: HostSkipList | None = None,
+    metrics_url: str | None = None,
+    n_threads: int = 0,
+    syntaxes: tuple[str, ...] = DEFAULT_SYNTAXES,
+    checkpoint_interval: float = CHECKPOINT_SECONDS,
+    memo_size: int = MEMO_SIZE,
+    persist_memo: bool = True,
+    raise_errors: bool = False,
+) -> list[Path]:
+    """
+    returns: the written (or up-to-date) output files, or the `.error` file of a failure
+    With a `metrics_url`, the live stats are pushed to a `MetricsAggregator` while running.
+    With `n_threads > 0`, records are processed on a thread pool, see `extract_pipeline`.
+    `syntaxes` selects the structured data syntaxes to extract, e.g. `ALL_SYNTAXES` to add
+    Microdata and RDFa to JSON-LD.
+    The serial pipeline checkpoints its progress every `checkpoint_interval` seconds. A failed
+    attempt is resumed from the last checkpoint, with the same result as a single run.
+    Parsed ld+json scripts are memoized in an LRU of `memo_size` entries (0 to disable). With
+    `persist_memo`, it is kept for the next segments of this process.
+    With `raise_errors`, a failure is raised after writing the `.error` file, e.g. for the
+    `LeaseCoordinator` to retry the segment.
+    """
     start_time = time.perf_counter()
     # io setup
     segment, seg_num = file_segment_info(file_id)
     out_path = Path(dest_dir) / segment / f"{seg_num}.json.gz"
-    if skip_existing and out_path.exists():
-        logger.info(f"Skipping existing file: {out_path}")
-        return
+    hosts_path = out_path.with_suffix("").with_suffix(".hosts.json")
+    manifest = StageManifest(out_path)
+    version = extract_version(skip_list, syntaxes=list(syntaxes))
+    if skip_existing and manifest.is_fresh(version, [file_id], [out_path, hosts_path]):
+        logger.info(f"Skipping up-to-date file: {out_path}")
+        return [out_path, hosts_path]
     else:
         logger.info(f"[{segment=} {seg_num=}] Starting...")
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
     # data processing
+    error_file = out_path.with_suffix(".error")
     try:
         stats = StatCounter()
+        checkpoint = SegmentCheckpoint(
+            out_path.with_suffix("").with_suffix(".partial"), version, stats, checkpoint_interval
+        )
+        if n_threads > 0:
+            checkpoint.clear()  # threads read ahead of the outputs: no record boundaries
+        elif checkpoint.resume():
+            logger.info(
+                f"[{segment=} {seg_num=}] Resuming at byte {checkpoint.offset}"
+                f" with {len(checkpoint.records)} tuples"
+            )
+        memo = None
+        if memo_size > 0:
+            memo = process_memo(memo_size) if persist_memo else ParseMemo(memo_size)
         # use offline_record_generator for processing local files
-        gen = download_record_generator(file_id, stats)
-        gen = extract_pipeline(gen, stats)
-
-        data = list(gen)
-        write_to_jsongz(data, outfile=out_path)
-        stats_file = out_path.with_suffix("").with_suffix(".stats.json")
-        with open(stats_file, "w") as f:
-            json.dump(stats, f)
+        gen = download_record_generator(file_id, stats, checkpoint if n_threads == 0 else None)
+        gen = extract_pipeline(
+            gen,
+            stats,
+            skip_list=skip_list,
+            track_hosts=True,
+            n_threads=n_threads,
+            syntaxes=syntaxes,
+            memo=memo,
+        )
+
+        data = checkpoint.records
+        with MetricsPusher(stats, metrics_url) if metrics_url else nullcontext():
+            for record in gen:
+                data.append(record)
+        host_yields = HostYieldTable()
+        host_yields.update_from_segment(data, stats)
+        host_yields.save(hosts_path)
         elapsed = time.perf_counter() - start_time
+        stats.inc("time/elapsed_s", round(elapsed))
+        outputs = write_extract_output(data, stats, out_path)
+        manifest.commit(version, [file_id], [*outputs, hosts_path])
+        checkpoint.clear()
+        error_file.unlink(missing_ok=True)
         logger.info(
             f"[segment={segment} number={seg_num}] Extracted {len(data)} tuples. Elapsed time: {elapsed:.2f}s."
         )
+        log_memo_stats(stats)
+        return [*outputs, hosts_path]
     except Exception as ex:
         logger.error(f"Error processing file {file_id}: {ex}")
-        error_file = out_path.with_suffix(".error")
         with open(error_file, "w") as f:
             f.write(str(ex))
-        return
+        if raise_errors:
+            raise
+        return [error_file]
 
 
-def main(source_paths_file: Path, output_dir: Path):
+def extract_addresses_from_index(
+    index_file: Path,
+    dest_dir: Path,
+    host_allowlist: set[str] | None = None,
+    base_url: str = CC_DATA_URL,
+    max_workers: int = 32,
+    skip_existing: bool = True,
+) -> Path | None:
+    """
+    Selective extraction: only fetch the HTML records listed in a CDX index file by range
+    requests, instead of downloading full WARC files.
+    """
+    start_time = time.perf_counter()
+    out_path = Path(dest_dir) / "index" / f"{index_file.name.split('.')[0]}.json.gz"
+    manifest = StageManifest(out_path)
+    version = extract_version(host_allowlist=sorted(host_allowlist or []))
+    if skip_existing and manifest.is_fresh(version, [index_file], [out_path]):
+        logger.info(f"Skipping up-to-date file: {out_path}")
+        return out_path
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    stats = StatCounter()
+    entries = filter_index_entries(read_cdx_index(index_file), stats, host_allowlist=host_allowlist)
+    gen = range_record_generator(entries, stats, base_url=base_url, max_workers=max_workers)
+    gen = extract_pipeline(gen, stats)
+    data = list(gen)
+    outputs = write_extract_output(data, stats, out_path)
+    manifest.commit(version, [index_file], outputs)
+    elapsed = time.perf_counter() - start_time
+    logger.info(
+        f"[index={index_file.name}] Extracted {len(data)} tuples from {stats['index/selected']}"
+        f" of {stats['index/entry']} records. Elapsed time: {elapsed:.2f}s."
+    )
+    return out_path
+
+
+def build_skip_list(extract_dir: Path, outfile: Path, recall: float = 0.99) -> HostSkipList:
+    """aggregate the per-segment host yields of previous runs into a host skip list"""
+    table = HostYieldTable.from_extract_dir(extract_dir)
+    elapsed = html_responses = 0
+    for stats_file in Path(extract_dir).glob("**/*.stats.json"):
+        with open(stats_file) as f:
+            stats = json.load(f)
+        elapsed += stats.get("time/elapsed_s", 0)
+        html_responses += stats.get("warc/html_response", 0)
+    seconds_per_response = elapsed / html_responses if elapsed and html_responses else 0.002
+    skip_list, _ = build_host_skip_list(
+        table, recall=recall, seconds_per_response=seconds_per_response
+    )
+    skip_list.save(outfile)
+    return skip_list
+
+
+def main(
+    source_paths_file: Path,
+    output_dir: Path,
+    coordination_dir: Path | None = None,
+    metrics_url: str | None = None,
+):
+    """
+    With a `coordination_dir` on shared storage, segments are distributed over all hosts
+    running this with the same directory, see `LeaseCoordinator`. With a `metrics_url`, workers
+    push live stats to a `MetricsAggregator` (`python -m postalcrawl.metrics`).
+    """
     assert source_paths_file.is_file(), f"{source_paths_file=} is not a file"
     assert output_dir.is_dir(), f"{output_dir=} is not a directory"
+    skip_list = HostSkipList.load(HOST_SKIP_FILE) if HOST_SKIP_FILE.is_file() else None
 
     with open(CC_PATHS_FILE, "r") as f:
         paths = [p.strip() for p in f.readlines()]
 
     def extract(file_id: str):
-        return extract_addresses_from_file_id(file_id, output_dir, True)
+        return extract_addresses_from_file_id(
+            file_id,
+            output_dir,
+            True,
+            skip_list=skip_list,
+            metrics_url=metrics_url,
+            raise_errors=coordination_dir is not None,  # failed segments are retried
+        )
+
+    if coordination_dir is not None:
 
+        def worker():
+            LeaseCoordinator(coordination_dir).run(paths, extract)
+
+        joblib.Parallel(n_jobs=6, verbose=20)(joblib.delayed(worker)() for _ in range(6))
+        return
     tasks = (joblib.delayed(extract)(p) for p in paths[:1])
     joblib.Parallel(n_jobs=6, verbose=20)(tasks)  # adjust n_jobs as needed
 
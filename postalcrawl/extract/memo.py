@@ -0,0 +1,84 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+from loguru import logger
+
+from postalcrawl.stats import StatCounter
+
+MEMO_SIZE = 16_384
+
+T = TypeVar("T")
+
+
+def content_key(text: str) -> bytes:
+    """hash of a script text, the same in all processes (unlike `hash`)"""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class ParseMemo:
+    """
+    LRU of parsed ld+json scripts, keyed on a hash of their text. Sites built from templates
+    repeat byte-identical scripts (organization footers, store addresses) on many pages, and
+    a repeat costs a hash and a lookup instead of a parse.
+
+    Parsed values are shared by the records of all repeats: later stages read them, but must
+    not modify them. Each entry keeps how long its parse took, counted as `memo/saved_us`
+    on hits. Thread-safe, shared by extraction threads.
+    """
+
+    def __init__(self, maxsize: int = MEMO_SIZE):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[bytes, tuple[Any, float]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, text: str, parse: Callable[[str], T], stats: StatCounter) -> T:
+        """`parse(text)`, or its memoized result for an earlier copy of the text"""
+        key = content_key(text)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is not None:
+            value, cost = entry
+            stats.inc("memo/hit")
+            stats.inc("memo/saved_us", round(cost * 1e6))
+            return value
+        start = time.perf_counter()
+        value = parse(text)
+        cost = time.perf_counter() - start
+        stats.inc("memo/miss")
+        with self.lock:
+            self.entries[key] = (value, cost)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                stats.inc("memo/eviction")
+        return value
+
+
+_process_memo: ParseMemo | None = None
+
+
+def process_memo(maxsize: int = MEMO_SIZE) -> ParseMemo:
+    """the memo of this process, kept across the segments it extracts"""
+    global _process_memo
+    if _process_memo is None or _process_memo.maxsize != maxsize:
+        _process_memo = ParseMemo(maxsize)
+    return _process_memo
+
+
+def log_memo_stats(stats: StatCounter):
+    lookups = stats["memo/hit"] + stats["memo/miss"]
+    if lookups == 0:
+        return
+    logger.info(
+        f"Parse memo: {stats['memo/hit']} of {lookups} scripts memoized"
+        f" ({stats['memo/hit'] / lookups:.0%}), {stats['memo/saved_us'] / 1e6:.2f}s parsing saved,"
+        f" {stats['memo/eviction']} evictions"
+    )
@@ -0,0 +1,177 @@
+import io
+import os
+import zlib
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO
+
+GZIP_MAGIC = b"\x1f\x8b\x08"
+BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def find_member_candidates(buf: bytes | memoryview, start: int = 0) -> list[int]:
+    """
+    Offsets of all possible gzip member headers in `buf`. Compressed data can contain the
+    magic bytes by chance, so these are only candidates and are verified on decompression.
+    """
+    data = bytes(buf) if isinstance(buf, memoryview) else buf
+    candidates = []
+    pos = data.find(GZIP_MAGIC, start)
+    while pos != -1:
+        # reserved flag bits must be zero
+        if pos + 3 >= len(data) or data[pos + 3] & 0xE0 == 0:
+            candidates.append(pos)
+        pos = data.find(GZIP_MAGIC, pos + 1)
+    return candidates
+
+
+def inflate_member(chunk: bytes) -> tuple[bytes, bool, bytes] | None:
+    """
+    Decompress a single gzip member from `chunk`.
+    Returns (data, reached end of member, unused trailing bytes) or None if `chunk` is not a
+    valid member start. zlib releases the GIL, so this runs in parallel on a thread pool.
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    try:
+        data = decompressor.decompress(chunk)
+    except zlib.error:
+        return None
+    return data, decompressor.eof, decompressor.unused_data
+
+
+def inflate_batch(
+    buf: bytes, bounds: list[tuple[int, int]]
+) -> list[tuple[bytes, bool, bytes] | None]:
+    return [inflate_member(buf[start:end]) for start, end in bounds]
+
+
+class ParallelGzipReader(io.RawIOBase):
+    """
+    Read-only stream over multi-member gzip data (such as .warc.gz), decompressing members on
+    a thread pool.
+
+    The input is read in blocks and split at candidate member headers. Candidate members are
+    inflated in parallel and verified in order: if a candidate turns out to be a false split
+    inside a member, the member is finished serially. Output is in order, with at most
+    `max_pending` batches of readahead.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        max_workers: int | None = None,
+        block_size: int = BLOCK_SIZE,
+        batch_size: int = 1024 * 1024,
+    ):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.batch_size = batch_size
+        self.max_workers = max_workers or os.cpu_count() or 4
+        self.max_pending = 2 * self.max_workers
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._chunks = self._decompressed_chunks()
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self):
+        if not self.closed:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+        super().close()
+
+    def _read_batches(self) -> Iterator[tuple[bytes, list[tuple[int, int]]]]:
+        """yield (buffer, member bounds) batches, cut at candidate member headers"""
+        tail = b""
+        while True:
+            block = self.fileobj.read(self.block_size)
+            buf = tail + block
+            if not buf:
+                return
+            candidates = find_member_candidates(buf)
+            if block:
+                if not candidates or candidates[-1] == 0:
+                    tail = buf
+                    continue
+                # the last candidate member may continue in the next block
+                cut = candidates.pop()
+                buf, tail = buf[:cut], buf[cut:]
+            else:
+                tail = b""
+            if not candidates or candidates[0] != 0:
+                candidates.insert(0, 0)
+            bounds = list(zip(candidates, candidates[1:] + [len(buf)]))
+
+            batch_start = 0
+            for i in range(len(bounds)):
+                is_last = i == len(bounds) - 1
+                if is_last or bounds[i][1] - bounds[batch_start][0] >= self.batch_size:
+                    first, last = bounds[batch_start][0], bounds[i][1]
+                    yield (
+                        buf[first:last],
+                        [(s - first, e - first) for s, e in bounds[batch_start : i + 1]],
+                    )
+                    batch_start = i + 1
+            if not block:
+                return
+
+    def _decompressed_chunks(self) -> Iterator[bytes]:
+        pending: deque[tuple[bytes, list[tuple[int, int]], Future]] = deque()
+        batches = self._read_batches()
+        # serial decompressor of a member that spans a false split, if any
+        open_member: zlib._Decompress | None = None
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < self.max_pending:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                buf, bounds = batch
+                pending.append((buf, bounds, self.pool.submit(inflate_batch, buf, bounds)))
+            if not pending:
+                break
+
+            buf, bounds, future = pending.popleft()
+            for (start, end), result in zip(bounds, future.result()):
+                if open_member is not None:
+                    # continuation of a member: the candidate at `start` was a false split
+                    yield open_member.decompress(buf[start:end])
+                    if open_member.eof:
+                        unused = open_member.unused_data
+                        open_member = None
+                        if unused:
+                            yield from self._inflate_serial(unused)
+                    continue
+                if result is None:
+                    raise zlib.error("Invalid gzip member in stream")
+                data, eof, unused = result
+                if eof:
+                    yield data
+                    if unused:
+                        yield from self._inflate_serial(unused)
+                else:
+                    # member continues after a false split: finish it serially
+                    open_member = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                    yield open_member.decompress(buf[start:end])
+        if open_member is not None:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+
+    @staticmethod
+    def _inflate_serial(data: bytes) -> Iterator[bytes]:
+        while data:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            yield decompressor.decompress(data)
+            data = decompressor.unused_data
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
@@ -0,0 +1,149 @@
+import re
+from collections.abc import Iterator
+
+import lxml.etree
+from parsel import Selector
+
+JSON_LD = "json-ld"
+MICRODATA = "microdata"
+RDFA = "rdfa"
+DEFAULT_SYNTAXES = (JSON_LD,)
+ALL_SYNTAXES = (JSON_LD, MICRODATA, RDFA)
+
+POSTAL_ADDRESS_MARKER = b"postaladdress"
+# inline markup is only parsed from pages that have these attributes (lowercased bytes)
+INLINE_MARKERS = {MICRODATA: b"itemscope", RDFA: b"typeof"}
+URL_ATTRIBUTES = {
+    "a": "href",
+    "area": "href",
+    "link": "href",
+    "audio": "src",
+    "embed": "src",
+    "iframe": "src",
+    "img": "src",
+    "source": "src",
+    "video": "src",
+    "object": "data",
+}
+WHITESPACE = re.compile(r"\s+")
+
+
+def needs_full_parse(lower_body: bytes, syntaxes: tuple[str, ...]) -> bool:
+    """
+    whether a (lowercased) body can contain inline PostalAddress markup. pages that can not
+    only need their ld+json scripts, which are cut out without parsing the page
+    """
+    return POSTAL_ADDRESS_MARKER in lower_body and any(
+        INLINE_MARKERS[s] in lower_body for s in syntaxes if s in INLINE_MARKERS
+    )
+
+
+def type_name(types: str | None) -> str | None:
+    """`https://schema.org/PostalAddress` or `schema:PostalAddress` -> `PostalAddress`"""
+    if not types or not types.split():
+        return None
+    return re.split(r"[/:#]", types.split()[0])[-1]
+
+
+def property_names(value: str) -> list[str]:
+    return [type_name(name) or name for name in value.split()]
+
+
+def element_value(element: lxml.etree._Element) -> str:
+    """the value of a property element, per the microdata spec (and its RDFa equivalent)"""
+    content = element.get("content")
+    if content is not None:
+        return content
+    url_attribute = URL_ATTRIBUTES.get(element.tag)
+    if url_attribute and element.get(url_attribute) is not None:
+        return element.get(url_attribute)
+    if element.tag == "time" and element.get("datetime") is not None:
+        return element.get("datetime")
+    if element.tag in ("data", "meter") and element.get("value") is not None:
+        return element.get("value")
+    return WHITESPACE.sub(" ", element.xpath("string()")).strip()
+
+
+def mentions_postal_address(value) -> bool:
+    if isinstance(value, dict):
+        return value.get("@type") == "PostalAddress" or any(
+            mentions_postal_address(v) for v in value.values()
+        )
+    if isinstance(value, list):
+        return any(mentions_postal_address(v) for v in value)
+    return False
+
+
+def add_property(item: dict, name: str, value):
+    if name not in item:
+        item[name] = value
+    elif isinstance(item[name], list):
+        item[name].append(value)
+    else:
+        item[name] = [item[name], value]
+
+
+class InlineItemReader:
+    """schema.org items of Microdata (itemscope/itemprop) or RDFa (typeof/property) markup"""
+
+    def __init__(self, scope: str, prop: str, type_attribute: str, syntax: str):
+        self.scope = scope
+        self.prop = prop
+        self.type_attribute = type_attribute
+        self.syntax = syntax
+
+    def is_item(self, element: lxml.etree._Element) -> bool:
+        return element.get(self.scope) is not None
+
+    def is_top_level(self, element: lxml.etree._Element) -> bool:
+        return self.is_item(element) and element.get(self.prop) is None
+
+    def item(self, element: lxml.etree._Element) -> dict:
+        item = {"@type": type_name(element.get(self.type_attribute))}
+        for child in element:
+            self._collect(child, item)
+        return item
+
+    def _collect(self, element: lxml.etree._Element, item: dict):
+        if not isinstance(element.tag, str):
+            return  # comments, processing instructions
+        prop = element.get(self.prop)
+        nested = self.is_item(element)
+        if prop:
+            value = self.item(element) if nested else element_value(element)
+            for name in property_names(prop):
+                add_property(item, name, value)
+        if nested:
+            return  # properties of nested and unrelated items are not ours
+        for child in element:
+            self._collect(child, item)
+
+
+MICRODATA_READER = InlineItemReader("itemscope", "itemprop", "itemtype", MICRODATA)
+RDFA_READER = InlineItemReader("typeof", "property", "typeof", RDFA)
+
+
+def page_items(
+    content: str, syntaxes: tuple[str, ...] = ALL_SYNTAXES
+) -> Iterator[tuple[str, str | dict]]:
+    """
+    All schema.org items of a page from one parse: the text of ld+json scripts, and top-level
+    Microdata and RDFa items as JSON-LD like dicts. The item roots of all syntaxes are found
+    by a single xpath union, in document order, without visiting each element in python.
+    raises ValueError if `content` can not be parsed as html.
+
+    yields: (syntax, ld+json text or item dict)
+    """
+    readers = [r for r in (MICRODATA_READER, RDFA_READER) if r.syntax in syntaxes]
+    queries = [f"//*[@{r.scope} and not(@{r.prop})]" for r in readers]
+    if JSON_LD in syntaxes:
+        queries.append("//script[contains(translate(@type, 'LDJSON', 'ldjson'), 'ld+json')]")
+    if not queries:
+        return
+    for element in Selector(text=content).root.xpath(" | ".join(queries)):
+        if element.tag == "script":
+            yield JSON_LD, element.text or ""
+            continue
+        for reader in readers:
+            if reader.is_top_level(element):
+                yield reader.syntax, reader.item(element)
@@ -1,9 +1,72 @@
+from functools import lru_cache
+from typing import Protocol
+
 from werkzeug.http import parse_options_header
 
 
+@lru_cache(maxsize=4096)  # few distinct headers. thread-safe, shared by extraction threads
 def parse_content_type(content_type: str | None) -> tuple[str, str | None]:
     media_type, options = parse_options_header(content_type)
     charset = options.get("charset")
     if charset:
         charset = charset.lower()
     return media_type, charset
+
+
+LD_JSON_MARKER = b"ld+json"
+SCRIPT_OPEN = b"<script"
+SCRIPT_CLOSE = b"</script"
+SCAN_WINDOW_SIZE = 64 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+
+class Readable(Protocol):
+    """a binary stream, e.g. the content stream of a warcio record"""
+
+    def read(self, size: int, /) -> bytes: ...
+
+
+def scan_ld_json_scripts(
+    stream: Readable, max_bytes: int = MAX_BODY_BYTES, window_size: int = SCAN_WINDOW_SIZE
+) -> tuple[bytes, bool]:
+    """
+    Read a response body in fixed windows and keep only its `<script ...ld+json...>` elements.
+    Unfinished tags at a window edge are carried over into the next window, so memory is
+    bounded by the window size plus the matched scripts. At most `max_bytes` are read.
+
+    returns: (concatenated script elements, whether the body was truncated)
+    """
+    regions = []
+    buf = b""
+    total = 0
+    while True:
+        window = stream.read(window_size)
+        if not window:
+            return b"".join(regions), False
+        total += len(window)
+        buf += window
+        lower = buf.lower()  # ascii-only lowering keeps byte offsets intact
+        pos = 0
+        while True:
+            start = lower.find(SCRIPT_OPEN, pos)
+            if start == -1:
+                # overlap, in case the open tag is split at the window edge
+                pos = max(pos, len(buf) - len(SCRIPT_OPEN) + 1)
+                break
+            tag_end = lower.find(b">", start)
+            if tag_end == -1:
+                pos = start
+                break
+            if LD_JSON_MARKER not in lower[start:tag_end]:
+                pos = tag_end + 1
+                continue
+            close = lower.find(SCRIPT_CLOSE, tag_end)
+            close_end = lower.find(b">", close) if close != -1 else -1
+            if close_end == -1:
+                pos = start
+                break
+            regions.append(buf[start : close_end + 1])
+            pos = close_end + 1
+        buf = buf[pos:]
+        if total >= max_bytes:
+            return b"".join(regions), bool(stream.read(1))
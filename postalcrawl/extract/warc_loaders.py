@@ -1,28 +1,154 @@
 import gzip
+import io
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterator
 
 import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
 from warcio import ArchiveIterator
 from warcio.recordloader import ArcWarcRecord
 
+from postalcrawl.extract.cc_index import IndexEntry
+from postalcrawl.extract.parallel_gzip import ParallelGzipReader
 from postalcrawl.stats import StatCounter
+from postalcrawl.utils import project_root
 
+CC_DATA_URL = "https://data.commoncrawl.org/"
+CC_PATHS_FILE = project_root() / "warc_paths" / "2025-30.warc.paths"
 
-def download_record_generator(file_id: str, stats: StatCounter) -> Iterator[ArcWarcRecord]:
-    url = "https://data.commoncrawl.org/" + file_id
-    data_stream = requests.get(url, stream=True)
-    data_stream.raise_for_status()
-    record_iter = ArchiveIterator(data_stream.raw, arc2warc=True)
+
+class RecordCursor:
+    """
+    Position of a record generator in its WARC file: the compressed byte offset of the next
+    record, advanced before the record is yielded. Generators that take a cursor start reading
+    at its offset, which has to be the start of a record (of a gzip member in a .warc.gz).
+    """
+
+    def __init__(self, offset: int = 0):
+        self.offset = offset
+
+    def advance(self, offset: int):
+        self.offset = offset
+
+
+def cursor_records(
+    stream, stats: StatCounter, cursor: RecordCursor | None = None
+) -> Iterator[ArcWarcRecord]:
+    """records of a (compressed) WARC stream that starts at the offset of `cursor`"""
+    record_iter = ArchiveIterator(stream, arc2warc=True)
+    # offsets count from the position of local files, but from 0 in http responses
+    base = cursor.offset - record_iter.offset if cursor is not None else 0
     for record in record_iter:
+        if cursor is not None:
+            # the start of the current record; `get_record_offset` would read it to the end
+            cursor.advance(base + record_iter.offset)
         stats.inc("warc/record")
         yield record
 
 
-def offline_record_generator(file_path: Path, stats: StatCounter) -> Iterator[ArcWarcRecord]:
+def download_record_generator(
+    file_id: str, stats: StatCounter, cursor: RecordCursor | None = None
+) -> Iterator[ArcWarcRecord]:
+    """with a `cursor`, the download resumes at its offset by a range request"""
+    url = CC_DATA_URL + file_id
+    offset = cursor.offset if cursor is not None else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else None
+    data_stream = requests.get(url, stream=True, headers=headers)
+    data_stream.raise_for_status()
+    if offset and data_stream.status_code != 206:
+        raise ValueError(f"Server ignored range request for {file_id}")
+    yield from cursor_records(data_stream.raw, stats, cursor)
+
+
+def offline_record_generator(
+    file_path: Path,
+    stats: StatCounter,
+    parallel_workers: int = 0,
+    cursor: RecordCursor | None = None,
+) -> Iterator[ArcWarcRecord]:
+    """
+    Read records of a local WARC file. With `parallel_workers > 0`, the gzip members of a
+    .warc.gz are decompressed on a thread pool of that size. With a `cursor`, reading starts
+    at its offset.
+    """
+    if cursor is not None:
+        with open(file_path, "rb") as raw:
+            raw.seek(cursor.offset)
+            yield from cursor_records(raw, stats, cursor)
+        return
+    if parallel_workers > 0 and file_path.suffix == ".gz":
+        with open(file_path, "rb") as raw:
+            reader = ParallelGzipReader(raw, max_workers=parallel_workers)
+            with io.BufferedReader(reader, buffer_size=1024 * 1024) as stream:
+                for record in ArchiveIterator(stream, arc2warc=True):
+                    stats.inc("warc/record")
+                    yield record
+        return
+
     # Support transparently reading gzip-compressed WARC files
     opener = gzip.open if file_path.suffix == ".gz" else open
     with opener(file_path, "rb") as stream:
         for record in ArchiveIterator(stream, arc2warc=True):
             stats.inc("warc/record")
             yield record
+
+
+def range_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504]),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_record_range(session: requests.Session, base_url: str, entry: IndexEntry) -> bytes:
+    headers = {"Range": f"bytes={entry.offset}-{entry.offset + entry.length - 1}"}
+    resp = session.get(base_url + entry.filename, headers=headers, timeout=60)
+    resp.raise_for_status()
+    if resp.status_code != 206:
+        raise ValueError(f"Server ignored range request for {entry.filename}")
+    return resp.content
+
+
+def range_record_generator(
+    entries: Iterable[IndexEntry],
+    stats: StatCounter,
+    base_url: str = CC_DATA_URL,
+    max_workers: int = 32,
+) -> Iterator[ArcWarcRecord]:
+    """
+    Fetch single WARC records by HTTP range requests, as listed in a (filtered) CC index.
+
+    Requests run in parallel over a pooled session; records are yielded in index order with
+    at most `2 * max_workers` requests in flight.
+    """
+    session = range_session(max_workers)
+    pending: deque[Future[bytes]] = deque()
+
+    def drain(future: Future[bytes]) -> Iterator[ArcWarcRecord]:
+        try:
+            data = future.result()
+        except (requests.RequestException, ValueError) as ex:
+            stats.inc("error/range_fetch")
+            logger.warning(f"Failed to fetch record range: {ex}")
+            return
+        stats.inc("warc/range_bytes", len(data))
+        for record in ArchiveIterator(io.BytesIO(data), arc2warc=True):
+            stats.inc("warc/record")
+            yield record
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for entry in entries:
+            pending.append(pool.submit(fetch_record_range, session, base_url, entry))
+            if len(pending) >= 2 * max_workers:
+                yield from drain(pending.popleft())
+        while pending:
+            yield from drain(pending.popleft())
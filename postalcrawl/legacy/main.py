@@ -17,7 +17,6 @@ import requests
 from geopy.extra.rate_limiter import AsyncRateLimiter
 from geopy.geocoders import Nominatim
 from loguru import logger
-from postal.parser import parse_address as postal_parse_address
 from tqdm.asyncio import tqdm
 from urllib3 import HTTPResponse
 
@@ -266,6 +265,9 @@ SplitStreetCallable = Callable[[str], tuple[str | None, str | None]]
 
 
 def postal_parse(lf: pl.LazyFrame) -> pl.LazyFrame:
+    # imported lazily, loading the libpostal models takes ~2GB and several seconds
+    from postal.parser import parse_address as postal_parse_address
+
     def split_street_number(street: str) -> tuple[str | None, str | None]:
         parsed: list[tuple[str, str]] = postal_parse_address(street)
         d = {field: value for value, field in parsed}
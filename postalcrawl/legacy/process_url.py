@@ -4,6 +4,7 @@ from warcio import ArchiveIterator
 
 LEFT_PADDING = 1600
 RIGHT_PADDING = 2400
+MAX_CONTENT_BYTES = 8 * 1024 * 1024
 
 
 def extract_charset(content: bytes) -> str | None:
@@ -16,8 +17,8 @@ def extract_charset(content: bytes) -> str | None:
     return None
 
 
-def extract_address_content(content: bytes) -> bytes:
-    lower = content.lower()
+def extract_address_content(content: bytes, lower: bytes | None = None) -> bytes:
+    lower = content.lower() if lower is None else lower
     text_start: int = lower.find(b'"address"')
     text_end: int = lower.rfind(b'"address"')
     text_start = max(text_start - LEFT_PADDING, 0)
@@ -42,13 +43,17 @@ def address_gen(stream, status_counter):
             continue
         status_counter["preprocess:xml_content_type"] += 1
 
-        content: bytes = record.content_stream().read()
-        if b'"address"' not in content.lower():
+        content_stream = record.content_stream()
+        content: bytes = content_stream.read(MAX_CONTENT_BYTES)
+        if content_stream.read(1):
+            status_counter["preprocess:truncated"] += 1
+        lower = content.lower()
+        if b'"address"' not in lower:
             continue
         status_counter["preprocess:contains_address"] += 1
 
         yield {
-            "content": extract_address_content(content),
+            "content": extract_address_content(content, lower),
             "url": record.rec_headers.get_header("WARC-Target-URI"),
             "content_charset": extract_charset(content),
             "offset": i,
@@ -0,0 +1,90 @@
+import hashlib
+import inspect
+import json
+from collections.abc import Iterable
+from pathlib import Path
+from types import ModuleType
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def code_version(*modules: ModuleType, config: dict | None = None) -> str:
+    """version of a stage: hash of the source of its modules and its configuration"""
+    h = hashlib.blake2b(digest_size=16)
+    for module in modules:
+        h.update(inspect.getsource(module).encode("utf-8"))
+    h.update(json.dumps(config or {}, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+
+
+def manifest_path(output: Path) -> Path:
+    return output.with_name(output.name + MANIFEST_SUFFIX)
+
+
+class StageManifest:
+    """
+    Sidecar manifest of one stage output partition (e.g. a segment or section). It records the
+    stage version and content hashes of inputs and outputs, so a partition is only rebuilt if
+    its inputs, the stage code/config or the outputs themselves changed.
+
+    Inputs are either files, identified by their content hash, or plain strings such as remote
+    file ids. File hashes are only recomputed if the size or mtime of a file changed.
+    """
+
+    def __init__(self, output: Path):
+        self.path = manifest_path(output)
+        self.data: dict = {}
+        if self.path.is_file():
+            with open(self.path) as f:
+                self.data = json.load(f)
+
+    @staticmethod
+    def _entry(item: Path | str, previous: dict | None = None) -> dict:
+        if isinstance(item, str):
+            return {"id": item}
+        stat = item.stat()
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if previous and {k: previous.get(k) for k in entry} == entry:
+            return previous  # unchanged file, reuse its recorded hash
+        return {**entry, "hash": file_digest(item)}
+
+    @staticmethod
+    def _matches(item: Path | str, recorded: dict | None) -> bool:
+        if recorded is None:
+            return False
+        if isinstance(item, str):
+            return recorded == {"id": item}
+        if not item.exists():
+            return False
+        return StageManifest._entry(item, recorded)["hash"] == recorded.get("hash")
+
+    def is_fresh(self, version: str, inputs: Iterable[Path | str], outputs: Iterable[Path]) -> bool:
+        if self.data.get("version") != version:
+            return False
+        recorded_inputs: dict = self.data.get("inputs", {})
+        recorded_outputs: dict = self.data.get("outputs", {})
+        inputs, outputs = list(inputs), list(outputs)
+        if {str(i) for i in inputs} != set(recorded_inputs):
+            return False
+        if not all(Path(o).exists() for o in recorded_outputs):
+            return False
+        return all(self._matches(i, recorded_inputs.get(str(i))) for i in inputs) and all(
+            self._matches(o, recorded_outputs.get(str(o))) for o in outputs
+        )
+
+    def commit(self, version: str, inputs: Iterable[Path | str], outputs: Iterable[Path]):
+        previous_inputs: dict = self.data.get("inputs", {})
+        self.data = {
+            "version": version,
+            "inputs": {str(i): self._entry(i, previous_inputs.get(str(i))) for i in inputs},
+            "outputs": {str(o): self._entry(o) for o in outputs},
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=2)
+        tmp_path.replace(self.path)
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+import re
+import socket
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from loguru import logger
+
+from postalcrawl.stats import StatCounter, snapshot_delta
+
+METRICS_PORT = 9464
+METRICS_URL = f"http://localhost:{METRICS_PORT}"
+PUSH_INTERVAL = 5.0
+RATE_WINDOW = 60.0
+# per host counters of the extraction, too many to export
+EXCLUDED_PREFIXES = ("host/",)
+DASHBOARD_KEYS = [
+    "warc/record",
+    "warc/html_response",
+    "host_skip/skipped",
+    "nominatim/request",
+    "nominatim/connection",
+    "offline/hit",
+    "offline/miss",
+]
+
+
+def metric_name(key: str) -> str:
+    return "postalcrawl_" + re.sub(r"[^a-zA-Z0-9_]", "_", key)
+
+
+class WorkerState:
+    def __init__(self, history: int):
+        self.stats = StatCounter()
+        self.last_push = 0.0
+        self.history: deque[tuple[float, dict[str, int]]] = deque(maxlen=history)
+
+    def rate(self, key: str, window: float = RATE_WINDOW) -> float:
+        """per second increase of a counter over the last `window` seconds"""
+        if not self.history:
+            return 0.0
+        now, latest = self.history[-1]
+        start, first = next(((t, c) for t, c in self.history if t >= now - window), (now, latest))
+        if now - start <= 0:
+            return 0.0
+        return (latest.get(key, 0) - first.get(key, 0)) / (now - start)
+
+
+class MetricsAggregator:
+    """
+    Collects the metric deltas that workers push (see `MetricsPusher`), and serves them as
+    Prometheus text on `/metrics` and as a plain text dashboard on `/`. Counters and
+    histograms are summed over workers, gauges are reported per worker.
+    """
+
+    def __init__(self, history: int = 256):
+        self.lock = threading.Lock()
+        self.history = history
+        self.workers: dict[str, WorkerState] = {}
+        self.started = time.time()
+
+    def push(self, worker: str, delta: dict):
+        with self.lock:
+            state = self.workers.get(worker)
+            if state is None:
+                state = self.workers[worker] = WorkerState(self.history)
+            state.stats.merge(delta)
+            state.last_push = time.time()
+            state.history.append((state.last_push, dict(state.stats)))
+
+    def totals(self) -> StatCounter:
+        totals = StatCounter()
+        with self.lock:
+            for state in self.workers.values():
+                snapshot = state.stats.snapshot()
+                snapshot["gauges"] = {}
+                totals.merge(snapshot)
+        return totals
+
+    def rate(self, key: str, window: float = RATE_WINDOW) -> float:
+        with self.lock:
+            return sum(state.rate(key, window) for state in self.workers.values())
+
+    def prometheus_text(self) -> str:
+        totals = self.totals()
+        lines = []
+        for key, value in sorted(totals.items()):
+            name = metric_name(key)
+            lines += [f"# TYPE {name} counter", f"{name}_total {value}"]
+        with self.lock:
+            workers = {w: (s.stats.gauges.copy(), s.last_push) for w, s in self.workers.items()}
+        gauge_keys = sorted({k for gauges, _ in workers.values() for k in gauges})
+        for key in gauge_keys:
+            name = metric_name(key)
+            lines.append(f"# TYPE {name} gauge")
+            for worker, (gauges, _) in sorted(workers.items()):
+                if key in gauges:
+                    lines.append(f'{name}{{worker="{worker}"}} {gauges[key]}')
+        for key, histogram in sorted(totals.histograms.items()):
+            name = metric_name(key)
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, n in zip(histogram.bounds, histogram.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {histogram.count}')
+            lines += [f"{name}_sum {histogram.sum}", f"{name}_count {histogram.count}"]
+        name = metric_name("worker/last_push_timestamp_seconds")
+        lines.append(f"# TYPE {name} gauge")
+        for worker, (_, last_push) in sorted(workers.items()):
+            lines.append(f'{name}{{worker="{worker}"}} {last_push}')
+        return "\n".join(lines) + "\n"
+
+    def dashboard(self, keys: list[str] = DASHBOARD_KEYS) -> str:
+        totals = self.totals()
+        now = time.time()
+        lines = [f"postalcrawl metrics, up {now - self.started:.0f}s", ""]
+        lines.append(f"{'metric':<28}{'total':>14}{'per sec':>12}")
+        for key in keys:
+            lines.append(f"{key:<28}{totals[key]:>14}{self.rate(key):>12.1f}")
+        for key, histogram in sorted(totals.histograms.items()):
+            mean = histogram.sum / histogram.count if histogram.count else 0.0
+            lines.append(
+                f"{key:<28}{histogram.count:>14} mean {mean:.3f} p50 <={histogram.quantile(0.5)}"
+                f" p99 <={histogram.quantile(0.99)}"
+            )
+        lines += ["", f"{'worker':<32}{'last push':>12}{'records/s':>12}{'requests/s':>12}"]
+        with self.lock:
+            for worker, state in sorted(self.workers.items()):
+                lines.append(
+                    f"{worker:<32}{now - state.last_push:>11.0f}s"
+                    f"{state.rate('warc/record'):>12.1f}{state.rate('nominatim/request'):>12.1f}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host: str = "0.0.0.0", port: int = METRICS_PORT) -> ThreadingHTTPServer:
+        """start the http endpoint in a background thread"""
+        aggregator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != "/push":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                aggregator.push(body["worker"], body["delta"])
+                self.send_response(204)
+                self.end_headers()
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    content, content_type = (
+                        aggregator.prometheus_text(),
+                        "text/plain; version=0.0.4",
+                    )
+                elif self.path == "/":
+                    content, content_type = aggregator.dashboard(), "text/plain"
+                else:
+                    self.send_error(404)
+                    return
+                data = content.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class MetricsPusher:
+    """
+    Pushes what changed in a `StatCounter` to a `MetricsAggregator` every `interval` seconds
+    from a background thread, and once more on exit. Failed pushes are retried with the next
+    delta, so the aggregator does not lose increments when it is briefly unavailable.
+    Also an async context manager, which pushes on exit without blocking the event loop.
+    """
+
+    def __init__(
+        self,
+        stats: StatCounter,
+        url: str = METRICS_URL,
+        worker: str | None = None,
+        interval: float = PUSH_INTERVAL,
+    ):
+        self.stats = stats
+        self.url = url.rstrip("/") + "/push"
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.interval = interval
+        self.last: dict = {}
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop.set()
+        self.thread.join()
+        self.push()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await asyncio.to_thread(self.__exit__, exc_type, exc_val, exc_tb)
+
+    def push(self) -> bool:
+        snapshot = self.stats.snapshot(exclude_prefixes=EXCLUDED_PREFIXES)
+        delta = snapshot_delta(snapshot, self.last)
+        try:
+            resp = requests.post(self.url, json={"worker": self.worker, "delta": delta}, timeout=5)
+            resp.raise_for_status()
+        except requests.RequestException as ex:
+            logger.debug(f"Metrics push to {self.url} failed: {ex}")
+            return False
+        self.last = snapshot
+        return True
+
+    def _run(self):
+        while not self.stop.wait(self.interval):
+            self.push()
+
+
+def run_dashboard(port: int = METRICS_PORT, refresh: float = PUSH_INTERVAL):
+    """serve the aggregator and redraw the dashboard in the terminal"""
+    aggregator = MetricsAggregator()
+    aggregator.serve(port=port)
+    logger.info(f"Metrics on http://localhost:{port}/metrics")
+    while True:
+        print("\x1b[2J\x1b[H" + aggregator.dashboard(), end="", flush=True)
+        time.sleep(refresh)
+
+
+if __name__ == "__main__":
+    run_dashboard()
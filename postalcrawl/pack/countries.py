@@ -0,0 +1,178 @@
+import gettext
+import os
+from pathlib import Path
+
+import polars as pl
+import pycountry
+from loguru import logger
+
+from postalcrawl.utils import project_root
+
+COUNTRY_INDEX_FILE = project_root() / "data" / "country_index.arrow"
+# Nominatim results carry the OSM country names, e.g. "België / Belgique / Belgien"
+OSM_VARIANTS_SOURCE = project_root() / "data" / "v1" / "24k" / "full.parquet"
+OSM_VARIANT_COLUMNS = ("target:country", "target:country_code")
+KEY = "_country_key"
+# common names and abbreviations that are neither iso names nor in the OSM data
+ABBREVIATIONS = {
+    "usa": "us",
+    "ee uu": "us",
+    "eeuu": "us",
+    "abd": "us",
+    "u s": "us",
+    "us of a": "us",
+    "america": "us",
+    "united states of america": "us",
+    "uk": "gb",
+    "great britain": "gb",
+    "britain": "gb",
+    "england": "gb",
+    "scotland": "gb",
+    "wales": "gb",
+    "northern ireland": "gb",
+    "uae": "ae",
+    "emirates": "ae",
+    "holland": "nl",
+    "the netherlands": "nl",
+    "south korea": "kr",
+    "korea": "kr",
+    "north korea": "kp",
+    "russia": "ru",
+    "czech republic": "cz",
+    "turkey": "tr",
+    "ivory coast": "ci",
+    "cape verde": "cv",
+    "swaziland": "sz",
+    "burma": "mm",
+    "macedonia": "mk",
+    "vatican": "va",
+    "prc": "cn",
+    "roc": "tw",
+    "drc": "cd",
+}
+
+
+def normalize_expr(expr: pl.Expr) -> pl.Expr:
+    """lowercase, accents and punctuation removed: "U.S.A." -> "usa", "Côte" -> "cote"."""
+    return (
+        expr.str.normalize("NFKD")
+        .str.replace_all(r"\p{M}", "")
+        .str.to_lowercase()
+        .str.replace_all(r"[.'’]", "")
+        .str.replace_all(r"[^\p{L}\p{N}]+", " ")
+        .str.strip_chars()
+    )
+
+
+def name_variants(name: str) -> list[str]:
+    """
+    also the reordered and the short forms of iso names:
+    "Korea, Republic of" -> "Republic of Korea", "Bolivia (Plurinational State of)" -> "Bolivia"
+    """
+    variants = [name]
+    if "(" in name:
+        variants.append(name.split("(")[0].strip())
+    if ", " in name:
+        head, tail = name.split(", ", 1)
+        variants.append(f"{tail} {head}")
+    return variants
+
+
+def iso_names() -> list[tuple[str, str]]:
+    """(name, alpha-2 code) of iso 3166 codes and names, in all languages of pycountry"""
+    translations = [gettext.NullTranslations()]
+    for lang in sorted(os.listdir(pycountry.LOCALES_DIR)):
+        try:
+            translations.append(
+                gettext.translation("iso3166-1", pycountry.LOCALES_DIR, languages=[lang])
+            )
+        except FileNotFoundError:
+            continue
+    names = []
+    for country in pycountry.countries:
+        code = country.alpha_2.lower()
+        names += [(country.alpha_2, code), (country.alpha_3, code)]
+        for attr in ("name", "official_name", "common_name"):
+            name = getattr(country, attr, None)
+            if name is None:
+                continue
+            for translation in translations:
+                for variant in name_variants(translation.gettext(name)):
+                    names.append((variant, code))
+    return names
+
+
+def osm_name_variants(source: Path, columns: tuple[str, str] = OSM_VARIANT_COLUMNS) -> pl.DataFrame:
+    """(name, code) of the country names in Nominatim results, split into their languages"""
+    name, code = columns
+    return (
+        pl.scan_parquet(source)
+        .select(pl.col(name).alias("name"), pl.col(code).str.to_lowercase().alias("code"))
+        .drop_nulls()
+        .unique()
+        .with_columns(pl.col("name").str.split(" / ").list.eval(pl.element().str.split(" - ")))
+        .explode("name")
+        .explode("name")
+        .collect()
+    )
+
+
+def build_country_index(osm_variants: pl.DataFrame | None = None) -> pl.DataFrame:
+    """
+    Normalized country name -> lowercase alpha-2 code. Names that normalize to the same key
+    for different countries are dropped, unless they are one of the `ABBREVIATIONS`.
+    """
+    names = pl.DataFrame(iso_names(), schema=["name", "code"], orient="row")
+    if osm_variants is not None:
+        names = pl.concat([names, osm_variants.select("name", "code")])
+    keys = names.select(normalize_expr(pl.col("name")).alias(KEY), "code").unique()
+    unambiguous = keys.filter(pl.len().over(KEY) == 1, pl.col(KEY) != "")
+    abbreviations = pl.DataFrame(
+        list(ABBREVIATIONS.items()), schema=[KEY, "code"], orient="row"
+    ).select(normalize_expr(pl.col(KEY)), "code")
+    ambiguous = keys.height - unambiguous.height
+    logger.debug(f"Country index: {keys.height} keys, {ambiguous} ambiguous dropped")
+    return (
+        pl.concat([unambiguous.join(abbreviations, on=KEY, how="anti"), abbreviations])
+        .unique(KEY, keep="last")
+        .sort(KEY)
+    )
+
+
+def load_country_index(
+    index_file: Path = COUNTRY_INDEX_FILE, osm_source: Path | None = OSM_VARIANTS_SOURCE
+) -> pl.DataFrame:
+    """
+    The country index, memory-mapped from an uncompressed Arrow file. Built on first use from
+    pycountry, plus the OSM name variants of `osm_source` if it exists.
+    """
+    if not index_file.is_file():
+        osm_variants = None
+        if osm_source is not None and osm_source.is_file():
+            osm_variants = osm_name_variants(osm_source)
+        index = build_country_index(osm_variants)
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_file.with_name(index_file.name + ".tmp")
+        index.write_ipc(tmp_path, compression="uncompressed")
+        tmp_path.replace(index_file)
+        logger.info(f"Built country index with {index.height} names: {index_file}")
+    return pl.read_ipc(index_file, memory_map=True)
+
+
+def add_country_codes(
+    df: pl.DataFrame, index: pl.DataFrame, source: str = "country", target: str = "countrycode"
+) -> pl.DataFrame:
+    """
+    Vectorized lookup of the country codes of free text country names. Only the distinct
+    values are normalized and joined with the index, then mapped back onto the column.
+    """
+    names = pl.col(source).cast(pl.String)  # all-null columns have no string dtype
+    distinct = df.select(names.unique().drop_nulls())
+    mapping = distinct.with_columns(normalize_expr(pl.col(source)).alias(KEY)).join(
+        index, on=KEY, how="inner"
+    )
+    return df.with_columns(
+        names.replace_strict(
+            mapping[source], mapping["code"], default=None, return_dtype=pl.String
+        ).alias(target)
+    )
@@ -0,0 +1,177 @@
+from collections.abc import Iterable
+
+import polars as pl
+
+from postalcrawl.abbreviations import STREET_ABBREVIATIONS
+from postalcrawl.stats import StatCounter
+
+# per column minimum jaccard similarity of character shingles for two rows to be duplicates
+DEFAULT_THRESHOLDS = {
+    "name": 0.6,
+    "street": 0.6,
+    "house": 1.0,
+    "city": 0.7,
+    "postalcode": 1.0,
+}
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+NUM_BANDS = 16  # 16 bands x 4 rows: candidate pairs from a combined similarity of ~0.5
+MAX_BUCKET_SIZE = 64
+BATCH_SIZE = 50_000
+# the column whose abbreviations are expanded: "dr" is a drive there, but a doctor in names
+STREET_COLUMN = "street"
+
+
+def normalize_expr(column: str) -> pl.Expr:
+    """casefold, drop punctuation and, in the street column, expand common abbreviations"""
+    expr = (
+        pl.col(column)
+        .str.to_lowercase()
+        .str.replace_all(r"['’]", "")
+        .str.replace_all(r"[^\p{L}\p{N}]+", " ")
+    )
+    if column == STREET_COLUMN:
+        for short, full in STREET_ABBREVIATIONS.items():
+            if len(short) > 1:  # single letters are too ambiguous, e.g. initials
+                expr = expr.str.replace_all(rf"\b{short}\b", full)
+    expr = expr.str.strip_chars()
+    return pl.when(expr.str.len_chars() > 0).then(expr).alias(column)
+
+
+def shingles(value: str) -> set[str]:
+    if len(value) <= SHINGLE_SIZE:
+        return {value}
+    return {value[i : i + SHINGLE_SIZE] for i in range(len(value) - SHINGLE_SIZE + 1)}
+
+
+def band_keys(texts: pl.Series, num_perm: int, num_bands: int, seed: int) -> pl.DataFrame:
+    """
+    MinHash signatures of the character shingles of `texts`, split into LSH band keys.
+    returns: a frame with the columns (row, band, key)
+    """
+    rows_per_band = num_perm // num_bands
+    n_shingles = pl.col("text").str.len_chars().cast(pl.Int64) - SHINGLE_SIZE + 1
+    signatures = (
+        pl.DataFrame({"text": texts.fill_null("")})
+        .with_row_index("row")
+        .with_columns(pl.int_ranges(0, pl.max_horizontal(n_shingles, 1)).alias("offset"))
+        .explode("offset")
+        .select("row", pl.col("text").str.slice(pl.col("offset"), SHINGLE_SIZE).alias("shingle"))
+        .group_by("row")
+        .agg(pl.col("shingle").hash(seed + i).min().alias(f"h{i}") for i in range(num_perm))
+    )
+    return signatures.select(
+        "row",
+        *(
+            pl.struct(f"h{i}" for i in range(b * rows_per_band, (b + 1) * rows_per_band))
+            .hash(seed)
+            .alias(str(b))
+            for b in range(num_bands)
+        ),
+    ).unpivot(index="row", variable_name="band", value_name="key")
+
+
+class NearDuplicateClusterer:
+    """
+    Streaming near-duplicate clustering with MinHash LSH.
+
+    Rows are assigned to the first cluster representative that they match on every column
+    (jaccard similarity of character shingles >= the column threshold, nulls only match nulls).
+    Candidate representatives come from LSH buckets over the concatenated columns, so each row
+    is only compared to a handful of representatives instead of to all previous rows. Rows
+    without a match become the representative of a new cluster; the cluster id is the row
+    number of its representative. Only representatives are kept in memory.
+    """
+
+    def __init__(
+        self,
+        thresholds: dict[str, float] = DEFAULT_THRESHOLDS,
+        num_perm: int = NUM_PERM,
+        num_bands: int = NUM_BANDS,
+        seed: int = 0,
+        stats: StatCounter | None = None,
+    ):
+        self.thresholds = thresholds
+        self.num_perm = num_perm
+        self.num_bands = num_bands
+        self.seed = seed
+        self.stats = stats if stats is not None else StatCounter()
+        self.reps: dict[int, list[tuple[str | None, set[str] | None]]] = {}
+        self.buckets: dict[tuple[str, int], list[int]] = {}
+        self.rows_seen = 0
+
+    def _matches(self, rep: int, values: list[tuple[str | None, set[str] | None]]) -> bool:
+        self.stats.inc("dedup/comparison")
+        for (value, value_shingles), (rep_value, rep_shingles), threshold in zip(
+            values, self.reps[rep], self.thresholds.values()
+        ):
+            if value == rep_value:
+                continue
+            if value_shingles is None or rep_shingles is None or threshold >= 1.0:
+                return False
+            similarity = len(value_shingles & rep_shingles) / len(value_shingles | rep_shingles)
+            if similarity < threshold:
+                return False
+        return True
+
+    def assign(self, batch: pl.DataFrame) -> pl.Series:
+        """cluster ids for the rows of `batch`, in order"""
+        columns = list(self.thresholds)
+        normalized = batch.select(normalize_expr(c) for c in columns)
+        text = normalized.select(pl.concat_str(columns, separator=" ", ignore_nulls=True))
+        keys = (
+            band_keys(text.to_series(), self.num_perm, self.num_bands, self.seed)
+            .group_by("row")
+            .agg("band", "key")
+            .sort("row")
+        )
+        cluster_ids = []
+        for (row, bands, keys_), values in zip(keys.iter_rows(), normalized.iter_rows()):
+            row_id = self.rows_seen + row
+            row_values = [(v, shingles(v) if v is not None else None) for v in values]
+            row_buckets = list(zip(bands, keys_))
+            candidates = sorted({rep for b in row_buckets for rep in self.buckets.get(b, [])})
+            cluster = next((rep for rep in candidates if self._matches(rep, row_values)), None)
+            if cluster is None:
+                cluster = row_id
+                self.reps[row_id] = row_values
+                for bucket in row_buckets:
+                    reps = self.buckets.setdefault(bucket, [])
+                    if len(reps) < MAX_BUCKET_SIZE:
+                        reps.append(row_id)
+                self.stats.inc("dedup/cluster")
+            else:
+                self.stats.inc("dedup/duplicate")
+            cluster_ids.append(cluster)
+        self.rows_seen += batch.height
+        return pl.Series("cluster_id", cluster_ids, dtype=pl.UInt64)
+
+
+def assign_clusters(
+    batches: Iterable[pl.DataFrame], clusterer: NearDuplicateClusterer | None = None
+) -> pl.DataFrame:
+    clusterer = clusterer or NearDuplicateClusterer()
+    out = []
+    for batch in batches:
+        out.append(batch.with_columns(clusterer.assign(batch)))
+    return pl.concat(out) if out else pl.DataFrame()
+
+
+def keep_representatives(
+    lf: pl.LazyFrame,
+    thresholds: dict[str, float] = DEFAULT_THRESHOLDS,
+    batch_size: int = BATCH_SIZE,
+    stats: StatCounter | None = None,
+) -> pl.LazyFrame:
+    """drop near-duplicate rows, keeping the first row of each cluster"""
+    clusterer = NearDuplicateClusterer(thresholds, stats=stats)
+    representatives = []
+    for batch in lf.collect_batches(chunk_size=batch_size):
+        first_row = clusterer.rows_seen
+        is_representative = clusterer.assign(batch) == pl.int_range(
+            first_row, first_row + batch.height, dtype=pl.UInt64, eager=True
+        )
+        representatives.append(batch.filter(is_representative))
+    if not representatives:
+        return lf
+    return pl.concat(representatives).lazy()
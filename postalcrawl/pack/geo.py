@@ -0,0 +1,238 @@
+import math
+from pathlib import Path
+
+import polars as pl
+
+from postalcrawl.pack.publish import PARTITION_COLUMN
+
+LAT_COLUMN = "target_lat"
+LON_COLUMN = "target_lon"
+GEO_COLUMNS = [LAT_COLUMN, LON_COLUMN]
+# z-order cell of the coordinates, the sort key within partitions
+CELL_COLUMN = "geo_cell"
+# geohash of the coarse cell, the geo partition column
+REGION_COLUMN = "geo_region"
+CELL_BITS = 26  # per axis: cells of about 0.6 x 0.3 m at the equator
+REGION_BITS = 5  # per axis: 2 character geohashes, 1024 regions of about 1250 x 625 km
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+MAX_RANGES = 64
+EARTH_RADIUS_M = 6_371_008.8
+
+
+def quantize(value: float, low: float, high: float, bits: int = CELL_BITS) -> int:
+    return min(int((value - low) / (high - low) * (1 << bits)), (1 << bits) - 1)
+
+
+def interleave(lon_q: int, lat_q: int, bits: int = CELL_BITS) -> int:
+    """bits of lon and lat in turns, lon first, as in geohashes"""
+    cell = 0
+    for i in range(bits):
+        cell |= ((lon_q >> i) & 1) << (2 * i + 1) | ((lat_q >> i) & 1) << (2 * i)
+    return cell
+
+
+def encode_cell(lat: float, lon: float) -> int:
+    return interleave(quantize(lon, -180.0, 180.0), quantize(lat, -90.0, 90.0))
+
+
+def geohash(cell: int, bits: int = 2 * REGION_BITS) -> str:
+    """the geohash of the top `bits` bits of a cell (a multiple of 5)"""
+    prefix = cell >> (2 * CELL_BITS - bits)
+    chars = [GEOHASH_ALPHABET[(prefix >> shift) & 31] for shift in range(bits - 5, -1, -5)]
+    return "".join(chars)
+
+
+def cell_expr(lat: pl.Expr, lon: pl.Expr) -> pl.Expr:
+    """`encode_cell` as a polars expression"""
+
+    def quantized(value: pl.Expr, low: float, high: float) -> pl.Expr:
+        scaled = ((value - low) / (high - low) * (1 << CELL_BITS)).floor()
+        return scaled.clip(0, (1 << CELL_BITS) - 1).cast(pl.UInt64)
+
+    lon_q, lat_q = quantized(lon, -180.0, 180.0), quantized(lat, -90.0, 90.0)
+    terms = [
+        (lon_q // (1 << i) % 2) * (1 << (2 * i + 1)) + (lat_q // (1 << i) % 2) * (1 << (2 * i))
+        for i in range(CELL_BITS)
+    ]
+    located = lat.is_not_null() & lon.is_not_null()  # sum_horizontal counts nulls as 0
+    return pl.when(located).then(pl.sum_horizontal(terms).cast(pl.UInt64))
+
+
+def region_expr(cell: pl.Expr) -> pl.Expr:
+    """`geohash` of the region of a cell, as a polars expression"""
+    prefix = cell // (1 << (2 * (CELL_BITS - REGION_BITS)))
+    chars = [
+        (prefix // (1 << shift) % 32).replace_strict(
+            list(range(32)), list(GEOHASH_ALPHABET), return_dtype=pl.String
+        )
+        for shift in range(2 * REGION_BITS - 5, -1, -5)
+    ]
+    return pl.concat_str(chars)
+
+
+def with_geo_cells(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """add the cell and region columns. rows without coordinates have neither"""
+    cell = cell_expr(pl.col(LAT_COLUMN), pl.col(LON_COLUMN))
+    return lf.with_columns(cell.alias(CELL_COLUMN)).with_columns(
+        region_expr(pl.col(CELL_COLUMN)).alias(REGION_COLUMN)
+    )
+
+
+def cell_range(prefix: int, level: int) -> tuple[int, int]:
+    """the cells below a quadtree node of `level` bits per axis"""
+    shift = 2 * (CELL_BITS - level)
+    return prefix << shift, ((prefix + 1) << shift) - 1
+
+
+def node_bounds(prefix: int, level: int) -> tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) of a quadtree node"""
+    lon_q = lat_q = 0
+    for i in range(level):
+        lon_q |= ((prefix >> (2 * i + 1)) & 1) << i
+        lat_q |= ((prefix >> (2 * i)) & 1) << i
+    lat_step, lon_step = 180.0 / (1 << level), 360.0 / (1 << level)
+    min_lat, min_lon = -90.0 + lat_q * lat_step, -180.0 + lon_q * lon_step
+    return min_lat, min_lon, min_lat + lat_step, min_lon + lon_step
+
+
+def cover_ranges(
+    bbox: tuple[float, float, float, float], max_ranges: int = MAX_RANGES
+) -> list[tuple[int, int]]:
+    """
+    Sorted, merged cell ranges that cover a (min_lat, min_lon, max_lat, max_lon) box, from a
+    quadtree descent: nodes inside the box are taken whole, nodes on its border are split
+    until there would be more than `max_ranges` of them. The ranges may cover more than the
+    box, so matches are filtered by their coordinates afterwards.
+    """
+    min_lat, min_lon, max_lat, max_lon = bbox
+    inside, border, level = [], [0], 0
+    while border and level < CELL_BITS:
+        children = []
+        for prefix in border:
+            for child in range(prefix << 2, (prefix << 2) + 4):
+                lat0, lon0, lat1, lon1 = node_bounds(child, level + 1)
+                if lat1 < min_lat or lat0 > max_lat or lon1 < min_lon or lon0 > max_lon:
+                    continue
+                if min_lat <= lat0 and lat1 <= max_lat and min_lon <= lon0 and lon1 <= max_lon:
+                    inside.append(cell_range(child, level + 1))
+                else:
+                    children.append(child)
+        if len(inside) + len(children) > max_ranges and level > 0:
+            break  # keep the border nodes of this level
+        border, level = children, level + 1
+    ranges = sorted(inside + [cell_range(prefix, level) for prefix in border])
+    merged: list[tuple[int, int]] = []
+    for low, high in ranges:
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(high, merged[-1][1]))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def region_cells(low: int, high: int) -> list[int]:
+    """one cell of each region that a cell range overlaps"""
+    step = 1 << (2 * (CELL_BITS - REGION_BITS))
+    return list(range(low - low % step, high + 1, step))
+
+
+def haversine_expr(lat: float, lon: float) -> pl.Expr:
+    """great-circle distance in meters of the coordinate columns to a point"""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = pl.col(LAT_COLUMN).radians(), pl.col(LON_COLUMN).radians()
+    a = ((lat2 - lat1) / 2).sin() ** 2
+    a += math.cos(lat1) * lat2.cos() * ((lon2 - lon1) / 2).sin() ** 2
+    return 2 * EARTH_RADIUS_M * a.sqrt().arcsin()
+
+
+class GeoIndex:
+    """
+    Bounding box and radius queries over the published dataset, which is partitioned by
+    country and `geo_region` and sorted by `geo_cell` within each partition. A query only
+    opens the files of the regions (and country) it touches, binary searches the sorted cells
+    of each file for the covering cell ranges, and reads just those row slices.
+    The cell column of a file is loaded once, on its first query.
+    """
+
+    def __init__(self, out_dir: Path):
+        # the hive keys of the files, as they are not in the files themselves
+        self.partitions: dict[Path, dict[str, str]] = {}
+        for file in sorted((out_dir / "dataset").glob(f"*/{REGION_COLUMN}=*/*.parquet")):
+            keys = (d.name.split("=", 1) for d in (file.parent.parent, file.parent))
+            self.partitions[file] = dict(keys)
+        self.cells: dict[Path, pl.Series] = {}
+
+    def file_cells(self, file: Path) -> pl.Series:
+        if file not in self.cells:
+            self.cells[file] = pl.read_parquet(file, columns=[CELL_COLUMN]).to_series()
+        return self.cells[file]
+
+    def scan_file(self, file: Path) -> pl.LazyFrame:
+        keys = self.partitions[file]
+        return pl.scan_parquet(file).with_columns(pl.lit(v).alias(k) for k, v in keys.items())
+
+    def scan_ranges(self, files: list[Path], ranges: list[tuple[int, int]]) -> list[pl.LazyFrame]:
+        """the row slices of the files with cells in the ranges"""
+        slices = []
+        for file in files:
+            cells = self.file_cells(file)
+            for low, high in ranges:
+                start = cells.search_sorted(low, side="left")
+                end = cells.search_sorted(high, side="right")
+                if end > start:
+                    slices.append(self.scan_file(file).slice(start, end - start))
+        return slices
+
+    def bbox(
+        self,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float,
+        countrycode: str | None = None,
+    ) -> pl.DataFrame:
+        """rows with coordinates in the box (which must not cross the antimeridian)"""
+        if min_lat > max_lat or min_lon > max_lon:
+            raise ValueError(f"Invalid bounding box: {(min_lat, min_lon, max_lat, max_lon)}")
+        if not self.partitions:
+            return pl.DataFrame()
+        ranges = cover_ranges((min_lat, min_lon, max_lat, max_lon))
+        regions = {geohash(cell) for low, high in ranges for cell in region_cells(low, high)}
+        files = [
+            file
+            for file, keys in self.partitions.items()
+            if keys[REGION_COLUMN] in regions and countrycode in (None, keys.get(PARTITION_COLUMN))
+        ]
+        # an empty slice keeps the columns of an empty result
+        slices = self.scan_ranges(files, ranges) or [
+            self.scan_file(next(iter(self.partitions))).head(0)
+        ]
+        return (
+            pl.concat(slices)
+            .filter(
+                pl.col(LAT_COLUMN).is_between(min_lat, max_lat),
+                pl.col(LON_COLUMN).is_between(min_lon, max_lon),
+            )
+            .collect()
+        )
+
+    def radius(
+        self, lat: float, lon: float, radius_m: float, countrycode: str | None = None
+    ) -> pl.DataFrame:
+        """rows within `radius_m` meters of a point, nearest first, with their `distance_m`"""
+        lat_delta = math.degrees(radius_m / EARTH_RADIUS_M)
+        lon_delta = lat_delta / max(math.cos(math.radians(lat)), 1e-6)
+        rows = self.bbox(
+            max(lat - lat_delta, -90.0),
+            max(lon - lon_delta, -180.0),
+            min(lat + lat_delta, 90.0),
+            min(lon + lon_delta, 180.0),
+            countrycode,
+        )
+        if rows.is_empty():
+            return rows
+        return (
+            rows.with_columns(haversine_expr(lat, lon).alias("distance_m"))
+            .filter(pl.col("distance_m") <= radius_m)
+            .sort("distance_m")
+        )
@@ -1,12 +1,28 @@
-import re
+import sys
+from collections.abc import Iterable, Iterator
 from pathlib import Path
-from typing import Iterable, Iterator
 
 import polars as pl
-from postal.parser import parse_address as postal_parse_address
+from loguru import logger
 from tqdm import tqdm
 
+from postalcrawl import abbreviations, postal_service
+from postalcrawl.manifest import StageManifest, code_version
+from postalcrawl.pack import countries, dedup, geo, publish, sample
+from postalcrawl.pack.countries import add_country_codes, load_country_index
+from postalcrawl.pack.dedup import keep_representatives
+from postalcrawl.pack.geo import CELL_COLUMN, GEO_COLUMNS, REGION_COLUMN, with_geo_cells
+from postalcrawl.pack.publish import (
+    PARTITION_COLUMN,
+    publish_dataset,
+    published_files,
+    scan_dataset,
+)
+from postalcrawl.pack.sample import sample_variants, variant_files
+from postalcrawl.postal_service import BATCH_SIZE, PostalParserPool, load_parser
+from postalcrawl.stats import StatCounter
 from postalcrawl.utils import project_root, read_from_jsongz
+from postalcrawl.validate import osm_validator, refine
 from postalcrawl.validate.refine import ensure_string
 
 VALIDATED_ROOT = project_root() / "data" / "validated"
@@ -33,23 +49,26 @@ def generate_address_rows(records: Iterable[dict]) -> Iterator[dict]:
         target_data = record["osm"]["properties"]["geocoding"]
         assert target_data is not None
         assert query_data is not None
-        row = dict(
-            name=query_data.get("name"),
-            street=query_data.get("street"),
-            city=query_data.get("city"),
-            state=query_data.get("state"),
-            country=query_data.get("country"),
-            postalcode=query_data.get("postalcode"),
-            target_name=target_data.get("name"),
-            target_street=target_data.get("street"),
-            target_house=target_data.get("housenumber"),
-            target_city=target_data.get("city"),
-            target_state=target_data.get("state"),
-            target_country=target_data.get("country"),
-            target_postalcode=target_data.get("postcode"),
-            target_countrycode=target_data.get("country_code"),
-        )
+        row = {
+            "name": query_data.get("name"),
+            "street": query_data.get("street"),
+            "city": query_data.get("city"),
+            "state": query_data.get("state"),
+            "country": query_data.get("country"),
+            "postalcode": query_data.get("postalcode"),
+            "target_name": target_data.get("name"),
+            "target_street": target_data.get("street"),
+            "target_house": target_data.get("housenumber"),
+            "target_city": target_data.get("city"),
+            "target_state": target_data.get("state"),
+            "target_country": target_data.get("country"),
+            "target_postalcode": target_data.get("postcode"),
+            "target_countrycode": target_data.get("country_code"),
+        }
         row = {k: ensure_string(v) for k, v in row.items()}
+        # geojson order; offline geocoder results without coordinates have no geometry
+        lon, lat = (record["osm"].get("geometry") or {}).get("coordinates") or (None, None)
+        row.update(target_lat=lat, target_lon=lon)
         yield row
 
 
@@ -61,9 +80,15 @@ def generate_section_rows(section_dir: Path) -> Iterator[dict]:
         yield from generate_address_rows(file_records)
 
 
-def split_street_number_field(records: Iterable[dict]) -> Iterator[dict]:
-    def split_street_number(street: str) -> tuple[str | None, str | None]:
-        parsed: list[tuple[str, str]] = postal_parse_address(street)
+def split_street_number_field(
+    records: Iterable[dict], parser_pool: PostalParserPool | None = None
+) -> Iterator[dict]:
+    """
+    Split the street field into road and house number with libpostal. With a `parser_pool`,
+    streets are parsed in batches by the pool workers instead of in this process.
+    """
+
+    def road_and_house(parsed: list[tuple[str, str]]) -> tuple[str | None, str | None]:
         d = {field: value for value, field in parsed}
         road = d.get("road")
         road = road.title() if road else None
@@ -71,68 +96,139 @@ def split_street_number_field(records: Iterable[dict]) -> Iterator[dict]:
         house_number = house_number.title() if house_number else None
         return road, house_number
 
-    for record in records:
-        if record.get("street") is None:
-            record["street"] = None
-            record["house"] = None
+    def parse_batch(batch: list[dict]) -> Iterator[dict]:
+        streets = [r["street"] for r in batch if r.get("street") is not None]
+        if parser_pool is not None:
+            parsed_streets = parser_pool.parse(streets)
         else:
-            street, house = split_street_number(record["street"])
-            record["street"] = street
-            record["house"] = house
-        yield record
-
-
-def add_country_code(records: Iterable[dict]) -> Iterator[dict]:
+            parse_address = load_parser()
+            parsed_streets = (parse_address(s) for s in streets)
+        for record in batch:
+            if record.get("street") is None:
+                record["street"] = None
+                record["house"] = None
+            else:
+                record["street"], record["house"] = road_and_house(next(parsed_streets))
+            yield record
+
+    batch = []
     for record in records:
-        country = record.get("country")
-        if country and re.match(r"^[A-Za-z]{2}$", country):
-            record["countrycode"] = country.lower()
-        else:
-            record["countrycode"] = None
-        yield record
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE * (parser_pool.n_workers if parser_pool else 1):
+            yield from parse_batch(batch)
+            batch = []
+    yield from parse_batch(batch)
+
+
+def address_frame(rows: Iterable[dict], country_index: pl.DataFrame) -> pl.DataFrame:
+    """distinct rows with a street, city or postal code, in the dataset columns"""
+    schema: dict[str, type[pl.DataType]] = {
+        col: pl.String for col in [*COLUMNS, *TARGET_COLUMNS] if col != "countrycode"
+    }
+    schema.update({col: pl.Float64 for col in GEO_COLUMNS})
+    located = [r for r in rows if any(r[c] is not None for c in ["street", "city", "postalcode"])]
+    df = pl.DataFrame(located, schema=schema)
+    df = add_country_codes(df, country_index)
+    df = df.unique(maintain_order=True)
+    return df.select([*COLUMNS, *TARGET_COLUMNS, *GEO_COLUMNS])
+
+
+def pack_version(**config) -> str:
+    modules = (
+        sys.modules[__name__],
+        abbreviations,
+        countries,
+        dedup,
+        geo,
+        publish,
+        sample,
+        # the shape of validated records, and how their fields are parsed into columns
+        osm_validator,
+        refine,
+        postal_service,
+    )
+    return code_version(*modules, config=dict(columns=COLUMNS, **config))
 
 
-def create_section_datasets():
-    for section_dir in VALIDATED_ROOT.iterdir():
-        outfile = section_dir / "addresses.parquet"
-        # if outfile.exists():
-        #     print(f"Section dataset already exists: {outfile}. Skipping...")
-        #     continue
-        row_gen = generate_section_rows(section_dir)
-        row_gen = split_street_number_field(row_gen)
-        row_gen = add_country_code(row_gen)
-        row_gen = (
-            row
-            for row in row_gen
-            if any(row[c] is not None for c in ["street", "city", "postalcode"])
-        )
-        df = pl.DataFrame(list(row_gen))
-        df = df.unique()
-        df = df.select([*COLUMNS, *TARGET_COLUMNS])
+def section_inputs(section_dir: Path) -> list[Path]:
+    return sorted(section_dir.glob("*.json.gz"))
 
-        df.write_parquet(outfile, compression="brotli")
 
+def stale_sections(version: str) -> list[Path]:
+    """sections whose validated files or the pack code changed since they were last packed"""
+    return [
+        section_dir
+        for section_dir in sorted(VALIDATED_ROOT.iterdir())
+        if section_dir.is_dir()
+        and not StageManifest(section_dir / "addresses.parquet").is_fresh(
+            version, section_inputs(section_dir), [section_dir / "addresses.parquet"]
+        )
+    ]
 
-def create_csvs(parquet_file: Path):
-    df = pl.read_parquet(parquet_file)
-    df.select(COLUMNS).write_csv(DATASET_DIR / "values.csv")
-    (
-        df.select(TARGET_COLUMNS)
-        .rename(dict(zip(TARGET_COLUMNS, COLUMNS)))
-        .write_csv(DATASET_DIR / "targets.csv")
-    )
 
+def create_section_datasets(
+    section_dirs: Iterable[Path], version: str, parser_pool: PostalParserPool | None = None
+):
+    country_index = load_country_index()
+    for section_dir in section_dirs:
+        outfile = section_dir / "addresses.parquet"
+        inputs = section_inputs(section_dir)
+        row_gen = generate_section_rows(section_dir)
+        row_gen = split_street_number_field(row_gen, parser_pool)
+        df = address_frame(row_gen, country_index)
+        df.write_parquet(outfile, compression="brotli")
+        StageManifest(outfile).commit(version, inputs, [outfile])
 
-def main():
-    create_section_datasets()
 
-    section_datasets = list(VALIDATED_ROOT.glob("*/addresses.parquet"))
+def dataset_rows(section_datasets: list[Path], drop_near_duplicates: bool = False) -> pl.LazyFrame:
+    """
+    the distinct rows of the section datasets with all targets, in the order of the sections,
+    so that near-duplicate clustering keeps the same representatives on every run
+    """
     df = pl.scan_parquet(section_datasets)
-
-    df = df.unique()
+    df = df.unique(maintain_order=True)
     df = df.drop_nulls(subset=TARGET_COLUMNS)
-    df.sink_parquet(DATASET_DIR / "dataset.parquet", compression="brotli")
-    create_csvs(DATASET_DIR / "dataset.parquet")
+    if drop_near_duplicates:
+        stats = StatCounter()
+        df = keep_representatives(df, stats=stats)
+        logger.info(
+            f"Near-duplicates: {stats['dedup/duplicate']} rows dropped, "
+            f"{stats['dedup/cluster']} kept, {stats['dedup/comparison']} comparisons"
+        )
+    return df
+
+
+def main(n_parser_workers: int = 8, compression: str = "zstd", drop_near_duplicates: bool = False):
+    version = pack_version()
+    stale = stale_sections(version)
+    logger.info(f"{len(stale)} sections to (re)build")
+    if stale:
+        with PostalParserPool(n_parser_workers) as parser_pool:
+            parser_pool.log_report()
+            create_section_datasets(stale, version, parser_pool)
+
+    section_datasets = sorted(VALIDATED_ROOT.glob("*/addresses.parquet"))
+    manifest = StageManifest(DATASET_DIR / "dataset")
+    dataset_version = pack_version(
+        compression=compression, drop_near_duplicates=drop_near_duplicates
+    )
+    outputs = published_files(DATASET_DIR) + variant_files(DATASET_DIR)
+    if manifest.is_fresh(dataset_version, section_datasets, outputs):
+        logger.info(f"Dataset is up to date: {DATASET_DIR}")
+        return
+    df = dataset_rows(section_datasets, drop_near_duplicates)
+    outputs = publish_dataset(
+        with_geo_cells(df),
+        DATASET_DIR,
+        COLUMNS,
+        TARGET_COLUMNS,
+        compression=compression,
+        partition_by=[PARTITION_COLUMN, REGION_COLUMN],
+        sort_by=CELL_COLUMN,
+    )
+    sample_variants(scan_dataset(DATASET_DIR), DATASET_DIR)
+    outputs += variant_files(DATASET_DIR)
+    manifest.commit(dataset_version, section_datasets, outputs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,88 @@
+import shutil
+from collections.abc import Sequence
+from pathlib import Path
+
+import polars as pl
+
+PARTITION_COLUMN = "target_countrycode"
+ROW_GROUP_SIZE = 100_000
+
+
+def sink_csvs(
+    lf: pl.LazyFrame, out_dir: Path, columns: list[str], target_columns: list[str]
+) -> list[pl.LazyFrame]:
+    """lazy sinks of the `values.csv` / `targets.csv` split"""
+    return [
+        lf.select(columns).sink_csv(out_dir / "values.csv", lazy=True, mkdir=True),
+        lf.select(target_columns)
+        .rename(dict(zip(target_columns, columns)))
+        .sink_csv(out_dir / "targets.csv", lazy=True, mkdir=True),
+    ]
+
+
+def publish_dataset(
+    lf: pl.LazyFrame,
+    out_dir: Path,
+    columns: list[str],
+    target_columns: list[str],
+    compression: str = "zstd",
+    compression_level: int | None = None,
+    row_group_size: int = ROW_GROUP_SIZE,
+    partition_by: Sequence[str] = (PARTITION_COLUMN,),
+    sort_by: str | None = None,
+) -> list[Path]:
+    """
+    Write the packed dataset in one pass over `lf`:
+    - `dataset/`: hive-partitioned by `partition_by` (the target country code), with column
+      statistics so `pl.scan_parquet(..., hive_partitioning=True).filter(...)` prunes files
+      and row groups, and each partition sorted by `sort_by`
+    - `values.csv` / `targets.csv`: streamed from the same plan
+
+    The partitions are written to a temporary directory that replaces `dataset/` once they
+    are complete, so partitions of an earlier run that are gone from `lf` do not remain.
+
+    Size variants are sampled from the partitioned dataset with `sample.sample_variants`.
+
+    returns: the written files
+    """
+    dataset_dir = out_dir / "dataset"
+    tmp_dir, old_dir = out_dir / "dataset.tmp", out_dir / "dataset.old"
+    for leftover in (tmp_dir, old_dir):  # of an interrupted run
+        shutil.rmtree(leftover, ignore_errors=True)
+    sinks = [
+        lf.sink_parquet(
+            pl.PartitionByKey(
+                tmp_dir,
+                by=list(partition_by),
+                include_key=False,
+                per_partition_sort_by=sort_by,
+            ),
+            compression=compression,
+            compression_level=compression_level,
+            statistics=True,
+            row_group_size=row_group_size,
+            mkdir=True,
+            lazy=True,
+        ),
+        *sink_csvs(lf, out_dir, columns, target_columns),
+    ]
+    pl.collect_all(sinks)
+    if dataset_dir.exists():
+        dataset_dir.rename(old_dir)
+    tmp_dir.rename(dataset_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return published_files(out_dir)
+
+
+def published_files(out_dir: Path) -> list[Path]:
+    files = sorted((out_dir / "dataset").rglob("*.parquet"))
+    return files + [out_dir / "values.csv", out_dir / "targets.csv"]
+
+
+def scan_dataset(out_dir: Path) -> pl.LazyFrame:
+    return pl.scan_parquet(out_dir / "dataset", hive_partitioning=True)
+
+
+def scan_country(out_dir: Path, countrycode: str) -> pl.LazyFrame:
+    """scan only the partition of one country"""
+    return scan_dataset(out_dir).filter(pl.col(PARTITION_COLUMN) == countrycode)
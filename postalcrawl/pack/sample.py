@@ -0,0 +1,167 @@
+import math
+from dataclasses import dataclass
+from pathlib import Path
+
+import polars as pl
+from loguru import logger
+
+SAMPLE_KEY = "_sample_key"
+STRATUM_COLUMNS = ["target_countrycode", "has_name"]
+BATCH_SIZE = 100_000
+
+
+@dataclass(frozen=True, slots=True)
+class Variant:
+    name: str
+    size: int
+    named_only: bool = True  # only sample rows with a name
+    drop_name: bool = False  # exclude the name columns from the output
+
+
+# dataset size variants, see data/v1/README.md. ordered by size, each one contains the previous
+VARIANTS = [
+    Variant("2k", 2_400),
+    Variant("24k", 24_000),
+    Variant("240k", 240_000),
+    Variant("2m-named", 2_400_000),
+    Variant("9m-noname", 9_500_000, named_only=False, drop_name=True),
+]
+
+
+def allocate(counts: dict[tuple, int], size: int) -> dict[tuple, int]:
+    """proportional allocation of `size` rows over strata (largest remainder method)"""
+    total = sum(counts.values())
+    if total <= size:
+        return dict(counts)
+    quotas = {s: size * n / total for s, n in counts.items()}
+    alloc = {s: math.floor(q) for s, q in quotas.items()}
+    remainder = size - sum(alloc.values())
+    for s in sorted(quotas, key=lambda s: (alloc[s] - quotas[s], s))[:remainder]:
+        alloc[s] += 1
+    return alloc
+
+
+def stratum_counts(lf: pl.LazyFrame) -> dict[tuple, int]:
+    """rows per stratum. only reads the country code and the validity of the name column"""
+    counts = (
+        lf.select(
+            pl.col("target_countrycode"), pl.col("target_name").is_not_null().alias("has_name")
+        )
+        .group_by(STRATUM_COLUMNS)
+        .len()
+        .collect()
+    )
+    return {(cc, has_name): n for cc, has_name, n in counts.iter_rows()}
+
+
+def variant_allocations(counts: dict[tuple, int], variants: list[Variant]) -> dict[str, dict]:
+    """
+    per variant allocation over strata. allocations are never smaller than the allocation of a
+    smaller variant, so that variants are nested. the rows this adds (e.g. to the named strata
+    of a variant that also samples unnamed rows) are taken from the strata above their floor,
+    in proportion to what they have above it, so a variant keeps its size.
+    """
+    allocations = {}
+    previous: dict[tuple, int] = {}
+    for variant in sorted(variants, key=lambda v: v.size):
+        eligible = {s: n for s, n in counts.items() if s[1] or not variant.named_only}
+        alloc = allocate(eligible, variant.size)
+        alloc = {s: max(k, previous.get(s, 0)) for s, k in alloc.items()}
+        above_floor = {s: k - previous.get(s, 0) for s, k in alloc.items()}
+        excess = sum(alloc.values()) - variant.size
+        if excess > sum(above_floor.values()):
+            logger.warning(
+                f"Variant {variant.name} has {excess - sum(above_floor.values())} rows more than"
+                f" its size {variant.size} to contain the smaller variants"
+            )
+        if excess > 0:
+            for s, cut in allocate(above_floor, excess).items():
+                alloc[s] -= min(cut, above_floor[s])
+        allocations[variant.name] = alloc
+        previous = alloc
+    return allocations
+
+
+def bottom_k_per_stratum(df: pl.DataFrame, alloc_df: pl.DataFrame) -> pl.DataFrame:
+    """rows with the smallest keys of each stratum, as many as allocated"""
+    return (
+        df.join(alloc_df, on=STRATUM_COLUMNS, nulls_equal=True)
+        .filter(pl.col(SAMPLE_KEY).rank("ordinal").over(STRATUM_COLUMNS) <= pl.col("_alloc"))
+        .drop("_alloc")
+    )
+
+
+def sample_variants(
+    lf: pl.LazyFrame,
+    out_dir: Path,
+    variants: list[Variant] = VARIANTS,
+    seed: int = 0,
+    batch_size: int = BATCH_SIZE,
+) -> dict[str, pl.DataFrame]:
+    """
+    Stratified, nested sampling of all dataset variants in one streaming pass over `lf`.
+
+    Every row gets a seeded hash key. Within each stratum (country code x name present) a
+    variant takes the rows with the smallest keys, i.e. a seeded reservoir sample of the
+    stratum, with allocations proportional to the stratum sizes. Stratum sizes are counted
+    upfront from two cheap columns. During the pass, each stratum keeps only its candidates
+    for the largest allocation, so memory is bounded by the largest variant, not by the
+    dataset. Variants are nested and reruns with the same seed are deterministic.
+    """
+    counts = stratum_counts(lf)
+    allocations = variant_allocations(counts, variants)
+    schema = {"target_countrycode": pl.String, "has_name": pl.Boolean, "_alloc": pl.UInt32}
+
+    def alloc_frame(alloc: dict[tuple, int]) -> pl.DataFrame:
+        return pl.DataFrame([(*s, k) for s, k in alloc.items()], schema=schema, orient="row")
+
+    max_alloc: dict[tuple, int] = {}
+    for alloc in allocations.values():
+        for s, k in alloc.items():
+            max_alloc[s] = max(k, max_alloc.get(s, 0))
+    max_alloc_df = alloc_frame(max_alloc)
+    max_retained = 2 * sum(max_alloc.values()) + batch_size
+
+    keyed = lf.with_columns(
+        pl.col("target_countrycode").cast(pl.String),
+        pl.col("target_name").is_not_null().alias("has_name"),
+        pl.struct(pl.all()).hash(seed).alias(SAMPLE_KEY),
+    )
+    retained = pl.DataFrame()
+    for batch in keyed.collect_batches(chunk_size=batch_size):
+        retained = pl.concat([retained, batch]) if retained.height else batch
+        if retained.height > max_retained:
+            retained = bottom_k_per_stratum(retained, max_alloc_df)
+    sample = bottom_k_per_stratum(retained, max_alloc_df) if retained.height else retained
+
+    out: dict[str, pl.DataFrame] = {}
+    for variant in variants:
+        alloc = allocations[variant.name]
+        if not sample.height:
+            break
+        df = bottom_k_per_stratum(sample, alloc_frame(alloc))
+        df = df.sort(SAMPLE_KEY).drop(SAMPLE_KEY, "has_name")
+        if df.height < min(variant.size, sum(alloc.values())):
+            logger.warning(f"Variant {variant.name} is short: {df.height} of {variant.size} rows")
+        if variant.drop_name:
+            df = df.drop("name", "target_name")
+        out[variant.name] = df
+        write_variant(df, out_dir / variant.name)
+    return out
+
+
+def variant_files(out_dir: Path, variants: list[Variant] = VARIANTS) -> list[Path]:
+    files = ("full.parquet", "values.csv", "targets.csv")
+    return [out_dir / variant.name / f for variant in variants for f in files]
+
+
+def write_variant(df: pl.DataFrame, variant_dir: Path):
+    variant_dir.mkdir(parents=True, exist_ok=True)
+    df.write_parquet(variant_dir / "full.parquet", compression="zstd", statistics=True)
+    # the csv split pairs query and target columns; coordinates stay in the parquet file
+    columns = [c for c in df.columns if f"target_{c}" in df.columns]
+    target_columns = [f"target_{c}" for c in columns]
+    df.select(columns).write_csv(variant_dir / "values.csv")
+    df.select(target_columns).rename(dict(zip(target_columns, columns))).write_csv(
+        variant_dir / "targets.csv"
+    )
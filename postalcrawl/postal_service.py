@@ -0,0 +1,121 @@
+import importlib
+import importlib.util
+import multiprocessing
+import os
+import time
+from collections.abc import Callable, Iterable, Iterator
+
+from loguru import logger
+
+# "<module>:<function>" of the address parser. Importing `postal.parser` loads ~2GB of models.
+POSTAL_PARSER = "postal.parser:parse_address"
+BATCH_SIZE = 1024
+
+ParsedAddress = list[tuple[str, str]]
+
+_parse: Callable[[str], ParsedAddress] | None = None
+
+
+def load_parser(spec: str = POSTAL_PARSER) -> Callable[[str], ParsedAddress]:
+    module_name, func_name = spec.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def find_parser_module(spec: str) -> str:
+    """
+    the module name of a parser spec, checked without importing it. workers that fail to load
+    their parser are respawned by the pool forever, so a missing module is raised here instead
+    """
+    module_name = spec.split(":")[0]
+    if importlib.util.find_spec(module_name) is None:
+        raise ModuleNotFoundError(f"parser module {module_name!r} not found", name=module_name)
+    return module_name
+
+
+def _init_worker(spec: str):
+    global _parse
+    _parse = load_parser(spec)
+
+
+def _parse_batch(batch: list[str]) -> list[ParsedAddress]:
+    assert _parse is not None, "worker not initialized"
+    return [_parse(s) for s in batch]
+
+
+def process_rss(pid: int) -> tuple[int, int]:
+    """(resident, private) memory of a process in kB. shared copy-on-write pages are not private"""
+    rss = private = 0
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Rss:"):
+                rss = int(line.split()[1])
+            elif line.startswith(("Private_Clean:", "Private_Dirty:")):
+                private += int(line.split()[1])
+    return rss, private
+
+
+class PostalParserPool:
+    """
+    Long-lived pool of address parser workers.
+
+    The parser module is preloaded once in a fork server, and workers are forked from it, so
+    the libpostal models are loaded a single time and shared copy-on-write between workers.
+    Strings are sent in batches to keep IPC overhead low.
+    """
+
+    def __init__(self, n_workers: int | None = None, parser: str = POSTAL_PARSER):
+        start = time.perf_counter()
+        module_name = find_parser_module(parser)
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([module_name])
+        self.n_workers = n_workers or os.cpu_count() or 4
+        self.pool = ctx.Pool(self.n_workers, initializer=_init_worker, initargs=(parser,))
+        # wait until all workers are up, so the startup time includes the model load
+        self.pool.map(_parse_batch, [[] for _ in range(self.n_workers)], chunksize=1)
+        self.startup_seconds = time.perf_counter() - start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def parse(
+        self, addresses: Iterable[str], batch_size: int = BATCH_SIZE
+    ) -> Iterator[ParsedAddress]:
+        """parse addresses in order. batches are processed in parallel"""
+
+        def batches() -> Iterator[list[str]]:
+            batch = []
+            for address in addresses:
+                batch.append(address)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        for parsed_batch in self.pool.imap(_parse_batch, batches()):
+            yield from parsed_batch
+
+    def worker_rss(self) -> dict[int, tuple[int, int]]:
+        """pid -> (rss, private rss) in kB for the pool workers"""
+        pids = {p.pid for p in self.pool._pool}  # pyright: ignore [reportAttributeAccessIssue]
+        found: dict[int, tuple[int, int]] = {}
+        for pid in pids:
+            if pid is not None:
+                found[pid] = process_rss(pid)
+        return found
+
+    def log_report(self):
+        rss = self.worker_rss()
+        mean_rss = sum(r for r, _ in rss.values()) / max(len(rss), 1)
+        mean_private = sum(p for _, p in rss.values()) / max(len(rss), 1)
+        logger.info(
+            f"Parser pool: {self.n_workers} workers started in {self.startup_seconds:.2f}s, "
+            f"mean worker RSS {mean_rss / 1024:.0f}MB ({mean_private / 1024:.0f}MB private)"
+        )
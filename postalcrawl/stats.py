@@ -1,15 +1,123 @@
+from bisect import bisect_left
 from collections import defaultdict
+from collections.abc import Iterable
+
+# upper bucket bounds of histograms, e.g. latencies in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Iterable[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket: > max bound
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def merge(self, other: "Histogram"):
+        assert self.bounds == other.bounds, "histograms with different buckets"
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+
+    def minus(self, other: "Histogram") -> "Histogram":
+        delta = Histogram(self.bounds)
+        delta.counts = [a - b for a, b in zip(self.counts, other.counts)]
+        delta.sum = self.sum - other.sum
+        return delta
+
+    def quantile(self, q: float) -> float:
+        """upper bound of the bucket that contains the q-quantile"""
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> dict:
+        return {"bounds": list(self.bounds), "counts": list(self.counts), "sum": self.sum}
+
+    @staticmethod
+    def from_dict(data: dict) -> "Histogram":
+        histogram = Histogram(data["bounds"])
+        histogram.counts = list(data["counts"])
+        histogram.sum = data["sum"]
+        return histogram
 
 
 class StatCounter(defaultdict):
+    """
+    Counters, as a json-serializable dict of ints, plus gauges and histograms. Snapshots of
+    different workers are mergeable, see `postalcrawl.metrics` for live aggregation.
+    """
+
     def __init__(self):
         super().__init__(int)
+        self.gauges: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = {}
 
     def inc(self, key: str, value: int = 1):
         self[key] += value
 
+    def set(self, key: str, value: float):
+        self.gauges[key] = value
+
+    def observe(self, key: str, value: float, bounds: Iterable[float] = DEFAULT_BUCKETS):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(bounds)
+        histogram.observe(value)
+
     def filter(self, prefix_filter: str) -> dict:
         return {k: v for k, v in self.items() if k.startswith(prefix_filter)}
 
     def sum_prefix(self, prefix: str) -> int:
         return sum(v for k, v in self.items() if k.startswith(prefix))
+
+    def snapshot(self, exclude_prefixes: tuple[str, ...] = ()) -> dict:
+        counters = dict(self)
+        if exclude_prefixes:
+            counters = {k: v for k, v in counters.items() if not k.startswith(exclude_prefixes)}
+        return {
+            "counters": counters,
+            "gauges": dict(self.gauges),
+            "histograms": {k: h.to_dict() for k, h in list(self.histograms.items())},
+        }
+
+    def merge(self, snapshot: dict):
+        """add the counters and histograms of a snapshot (or delta). gauges are overwritten"""
+        for key, value in snapshot.get("counters", {}).items():
+            self[key] += value
+        self.gauges.update(snapshot.get("gauges", {}))
+        for key, data in snapshot.get("histograms", {}).items():
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                self.histograms[key] = Histogram.from_dict(data)
+            else:
+                histogram.merge(Histogram.from_dict(data))
+
+
+def snapshot_delta(current: dict, previous: dict) -> dict:
+    """what changed between two snapshots of the same `StatCounter`"""
+    prev_counters = previous.get("counters", {})
+    counters = {
+        k: v - prev_counters.get(k, 0)
+        for k, v in current["counters"].items()
+        if v != prev_counters.get(k, 0)
+    }
+    histograms = {}
+    for key, data in current["histograms"].items():
+        histogram = Histogram.from_dict(data)
+        if key in previous.get("histograms", {}):
+            histogram = histogram.minus(Histogram.from_dict(previous["histograms"][key]))
+        if histogram.count:
+            histograms[key] = histogram.to_dict()
+    return {"counters": counters, "gauges": current["gauges"], "histograms": histograms}
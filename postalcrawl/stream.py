@@ -0,0 +1,341 @@
+import asyncio
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import nullcontext
+from functools import partial
+from pathlib import Path
+
+import polars as pl
+import pyarrow.parquet as pq
+from loguru import logger
+
+from postalcrawl.extract.extract import extract_pipeline
+from postalcrawl.extract.host_skip import HostSkipList
+from postalcrawl.extract.main import extract_version
+from postalcrawl.extract.memo import ParseMemo, log_memo_stats
+from postalcrawl.extract.structured_data import DEFAULT_SYNTAXES
+from postalcrawl.extract.warc_loaders import CC_PATHS_FILE, download_record_generator
+from postalcrawl.manifest import StageManifest
+from postalcrawl.metrics import MetricsPusher
+from postalcrawl.pack.countries import load_country_index
+from postalcrawl.pack.main import address_frame, generate_address_rows, split_street_number_field
+from postalcrawl.postal_service import PostalParserPool
+from postalcrawl.record import Record
+from postalcrawl.stats import StatCounter
+from postalcrawl.utils import file_segment_info, project_root, read_from_jsongz, write_to_jsongz
+from postalcrawl.validate import main as validate_main
+from postalcrawl.validate.main import dict_contains_address, iterate_nested_dicts
+from postalcrawl.validate.offline_geocoder import log_offline_stats
+from postalcrawl.validate.osm_validator import OsmValidator, Transport, log_transport_stats
+from postalcrawl.validate.query_plan import log_plan_stats
+
+STREAM_OUT_FILE = project_root() / "data" / "stream" / "addresses.parquet"
+QUEUE_SIZE = 1024
+ROW_GROUP_ROWS = 10_000
+# the longest time validated records wait for their row group, bounds the time to first row
+FLUSH_SECONDS = 5.0
+DRAIN_SECONDS = 0.01
+
+RecordSource = Callable[[str, StatCounter], Iterator]
+
+
+def segment_records(
+    file_id: str,
+    stats: StatCounter,
+    record_source: RecordSource = download_record_generator,
+    checkpoint_dir: Path | None = None,
+    skip_list: HostSkipList | None = None,
+    syntaxes: tuple[str, ...] = DEFAULT_SYNTAXES,
+    memo: ParseMemo | None = None,
+) -> Iterator[Record[dict]]:
+    """
+    The extracted records of a WARC file, as they are extracted. With a `checkpoint_dir`,
+    they are written there once the file is done (in the layout of `data/extracted`), and
+    a fresh checkpoint is read back instead of extracting the file again.
+    """
+
+    def extracted() -> Iterator[Record[dict]]:
+        records = record_source(file_id, stats)
+        return extract_pipeline(records, stats, skip_list, syntaxes=syntaxes, memo=memo)
+
+    if checkpoint_dir is None:
+        yield from extracted()
+        return
+    segment, seg_num = file_segment_info(file_id)
+    checkpoint = checkpoint_dir / segment / f"{seg_num}.json.gz"
+    manifest = StageManifest(checkpoint)
+    version = extract_version(skip_list, syntaxes=list(syntaxes))
+    if manifest.is_fresh(version, [file_id], [checkpoint]):
+        stats.inc("stream/checkpoint_read")
+        yield from read_from_jsongz(checkpoint)
+        return
+    records = []
+    for record in extracted():
+        records.append(record)
+        yield record
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    write_to_jsongz(records, checkpoint)
+    manifest.commit(version, [file_id], [checkpoint])
+    stats.inc("stream/checkpoint_write")
+
+
+def extract_worker(
+    file_ids: queue.SimpleQueue,
+    extract: Callable[[str, StatCounter], Iterator[Record[dict]]],
+    feed: Callable[[Record[dict]], None],
+    merge_stats: Callable[[dict], None],
+    stop: threading.Event,
+):
+    """extractor thread: feeds the address candidates of the files it takes from `file_ids`"""
+    while not stop.is_set():
+        try:
+            file_id = file_ids.get_nowait()
+        except queue.Empty:
+            return
+        stats = StatCounter()
+        for record in extract(file_id, stats):
+            for candidate in iterate_nested_dicts([record]):
+                if dict_contains_address(candidate):
+                    feed(candidate)
+            if stop.is_set():
+                return
+        merge_stats(stats.snapshot())
+
+
+class StreamingParquetWriter:
+    """
+    Appends validated records to a Parquet file as row groups of the pack stage columns.
+    Rows are distinct within a row group; across row groups, the dataset step deduplicates.
+    The file is moved into place on `close`.
+    """
+
+    def __init__(
+        self, out_file: Path, stats: StatCounter, parser_pool: PostalParserPool | None = None
+    ):
+        self.out_file = out_file
+        self.tmp_path = out_file.with_name(out_file.name + ".tmp")
+        self.stats = stats
+        self.parser_pool = parser_pool
+        self.country_index = load_country_index()
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        schema = address_frame([], self.country_index).to_arrow().schema
+        self.writer = pq.ParquetWriter(self.tmp_path, schema, compression="zstd")
+        self.start = time.perf_counter()
+
+    def write(self, results: list[dict]) -> int:
+        rows = split_street_number_field(generate_address_rows(results), self.parser_pool)
+        df = address_frame(rows, self.country_index)
+        if df.height == 0:
+            return 0
+        self.writer.write_table(df.to_arrow())
+        if "stream/first_row_s" not in self.stats.gauges:
+            self.stats.set("stream/first_row_s", time.perf_counter() - self.start)
+        self.stats.inc("stream/row", df.height)
+        self.stats.inc("stream/row_group")
+        return df.height
+
+    def close(self):
+        self.writer.close()
+        self.tmp_path.replace(self.out_file)
+
+
+async def validate_candidates(
+    validator: OsmValidator, candidates: asyncio.Queue, results: asyncio.Queue
+):
+    while (candidate := await candidates.get()) is not None:
+        await results.put(await validator.record_query_validator(candidate))
+
+
+async def write_results(
+    results: asyncio.Queue,
+    writer: StreamingParquetWriter,
+    row_group_rows: int = ROW_GROUP_ROWS,
+    flush_seconds: float = FLUSH_SECONDS,
+):
+    """
+    Collects validated records into row groups, written once `row_group_rows` records or
+    `flush_seconds` passed. Writes run in a thread; while they do, the queue fills up and
+    the validators wait.
+    """
+    batch: list[dict] = []
+    last_flush = time.monotonic()
+    done = False
+    while not done:
+        try:
+            timeout = max(0.0, last_flush + flush_seconds - time.monotonic())
+            result = await asyncio.wait_for(results.get(), timeout)
+            done = result is None
+            if result is not None and result["osm"] is not None:
+                batch.append(result)
+        except TimeoutError:
+            pass
+        if done or len(batch) >= row_group_rows or time.monotonic() >= last_flush + flush_seconds:
+            if batch:
+                await asyncio.to_thread(writer.write, batch)
+            batch = []
+            last_flush = time.monotonic()
+
+
+async def stream(
+    file_ids: list[str],
+    out_file: Path = STREAM_OUT_FILE,
+    record_source: RecordSource = download_record_generator,
+    checkpoint_dir: Path | None = None,
+    n_extractors: int = 2,
+    concurrency: int = validate_main.MAX_CONCURRENT,
+    parser_pool: PostalParserPool | None = None,
+    skip_list: HostSkipList | None = None,
+    syntaxes: tuple[str, ...] = DEFAULT_SYNTAXES,
+    use_offline_index: bool = False,
+    transport: Transport | None = None,
+    queue_size: int = QUEUE_SIZE,
+    row_group_rows: int = ROW_GROUP_ROWS,
+    flush_seconds: float = FLUSH_SECONDS,
+    metrics_url: str | None = None,
+) -> StatCounter:
+    """
+    Extract, validate and pack in one streaming pipeline, without intermediate files:
+    `n_extractors` threads extract WARC files and feed address candidates into a bounded
+    queue, `concurrency` validator tasks query Nominatim and feed a second bounded queue, and
+    the validated records are appended to `out_file` as Parquet row groups. Full queues
+    block their producers, so a slow writer or Nominatim slows down extraction instead of
+    buffering records in memory. Extracted records are checkpointed to `checkpoint_dir`.
+    returns: the stats of all stages
+    """
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    candidates: asyncio.Queue = asyncio.Queue(queue_size)
+    results: asyncio.Queue = asyncio.Queue(queue_size)
+    pending = queue.SimpleQueue()
+    for file_id in file_ids:
+        pending.put(file_id)
+    stop = threading.Event()
+
+    def feed(candidate: Record[dict]):
+        asyncio.run_coroutine_threadsafe(candidates.put(candidate), loop).result()
+
+    async with (
+        OsmValidator(
+            validate_main.NOMINATIM_URL,
+            max_concurrent=concurrency,
+            offline_geocoder=validate_main.load_offline_geocoder(use_offline_index),
+            transport=transport,
+        ) as validator,
+        MetricsPusher(validator.stats, metrics_url) if metrics_url else nullcontext(),
+    ):
+        stats = validator.stats
+        extract = partial(
+            segment_records,
+            record_source=record_source,
+            checkpoint_dir=checkpoint_dir,
+            skip_list=skip_list,
+            syntaxes=syntaxes,
+            memo=ParseMemo(),  # shared by the extractor threads
+        )
+
+        def merge_stats(snapshot: dict):
+            loop.call_soon_threadsafe(stats.merge, snapshot)
+
+        def run_extractor(done: asyncio.Future):
+            """an extractor thread, which hands its outcome to the loop through `done`"""
+
+            def settle(outcome: BaseException | None):
+                if done.done():  # cancelled
+                    return
+                if outcome is None:
+                    done.set_result(None)
+                else:
+                    done.set_exception(outcome)
+
+            try:
+                extract_worker(pending, extract, feed, merge_stats, stop)
+            except Exception as ex:
+                loop.call_soon_threadsafe(settle, ex)
+            except BaseException as ex:  # e.g. SystemExit: still wake the loop, then propagate
+                loop.call_soon_threadsafe(settle, ex)
+                raise
+            else:
+                loop.call_soon_threadsafe(settle, None)
+
+        extracted = [loop.create_future() for _ in range(n_extractors)]
+        extractors = [
+            threading.Thread(target=run_extractor, args=(done,), name=f"extract-{i}")
+            for i, done in enumerate(extracted)
+        ]
+
+        async def extract_all():
+            for thread in extractors:
+                thread.start()
+            # a failed extractor fails the stream, rather than leaving an incomplete file
+            await asyncio.gather(*extracted)
+            for _ in range(concurrency):
+                await candidates.put(None)
+
+        async def validate_all():
+            await asyncio.gather(
+                *(validate_candidates(validator, candidates, results) for _ in range(concurrency))
+            )
+            await results.put(None)
+
+        writer = StreamingParquetWriter(out_file, stats, parser_pool)
+        try:
+            async with asyncio.TaskGroup() as tasks:  # a failing stage cancels the others
+                tasks.create_task(extract_all())
+                tasks.create_task(validate_all())
+                tasks.create_task(write_results(results, writer, row_group_rows, flush_seconds))
+            writer.close()
+        finally:
+            # extractors that wait for room in the queue see the stop once they get it
+            stop.set()
+            while any(thread.is_alive() for thread in extractors):
+                while not candidates.empty():
+                    candidates.get_nowait()
+                await asyncio.sleep(DRAIN_SECONDS)
+        await asyncio.sleep(0)  # the stats of the last files, merged on the loop
+        stats.set("time/wall_s", time.perf_counter() - start)
+    return stats
+
+
+def log_stream_stats(stats: StatCounter):
+    first_row = stats.gauges.get("stream/first_row_s")
+    logger.info(
+        f"Stream: {stats['warc/record']} WARC records, {stats['nominatim/request']} queries,"
+        f" {stats['stream/row']} rows in {stats['stream/row_group']} row groups,"
+        f" first row after {first_row or 0:.1f}s, total {stats.gauges['time/wall_s']:.1f}s"
+    )
+    log_memo_stats(stats)
+    log_offline_stats(stats)
+    log_plan_stats(stats)
+    log_transport_stats(stats)
+
+
+def main(
+    source_paths_file: Path = CC_PATHS_FILE,
+    out_file: Path = STREAM_OUT_FILE,
+    n_segments: int | None = None,
+    checkpoint_dir: Path | None = None,
+    n_parser_workers: int = 8,
+    metrics_url: str | None = None,
+):
+    """streaming alternative to running the extract, validate and pack stages one by one"""
+    with open(source_paths_file) as f:
+        file_ids = [p.strip() for p in f if p.strip()][:n_segments]
+    with PostalParserPool(n_parser_workers) as parser_pool:
+        stats = asyncio.run(
+            stream(
+                file_ids,
+                out_file,
+                checkpoint_dir=checkpoint_dir,
+                parser_pool=parser_pool,
+                metrics_url=metrics_url,
+            )
+        )
+    log_stream_stats(stats)
+    rows = pl.scan_parquet(out_file).select(pl.len()).collect().item()
+    logger.info(f"Wrote {rows} rows to {out_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,9 +28,12 @@ def project_root() -> Path:
     return Path(__file__).parent.parent
 
 
-def write_to_jsongz(data: dict, outfile: Path):
-    with gzip.open(outfile, "wt", encoding="utf-8") as zipfile:
+def write_to_jsongz(data: dict | list, outfile: Path):
+    # write to a temporary file first, so readers never see a partially written file
+    tmp_path = outfile.with_name(outfile.name + ".tmp")
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as zipfile:
         json.dump(data, zipfile, indent=2)
+    tmp_path.replace(outfile)
 
 
 def read_from_jsongz(infile: Path) -> dict | list:
@@ -1,18 +1,34 @@
 import asyncio
-from typing import Iterable, Iterator
+import sys
+from collections.abc import Iterable, Iterator
+from contextlib import nullcontext
+from pathlib import Path
 
 from loguru import logger
 from tqdm import tqdm
 
+from postalcrawl.coordination import LeaseCoordinator
+from postalcrawl.manifest import StageManifest, code_version
+from postalcrawl.metrics import MetricsPusher
 from postalcrawl.record import Record
 from postalcrawl.utils import project_root, read_from_jsongz, write_to_jsongz
-from postalcrawl.validate.osm_validator import OsmValidator
+from postalcrawl.validate import osm_validator, query_plan
+from postalcrawl.validate import projection as projection_module
+from postalcrawl.validate.offline_geocoder import OfflineGeocoder, log_offline_stats
+from postalcrawl.validate.osm_validator import OsmValidator, Transport, log_transport_stats
+from postalcrawl.validate.projection import DOWNSTREAM_FIELDS, Projection
+from postalcrawl.validate.query_plan import log_plan_stats
 
 EXTRACT_ROOT = project_root() / "data" / "extracted"
 VALIDATE_ROOT = EXTRACT_ROOT.parent / "validated"
+# optional sidecar with the full validated records, outside of the inputs of the later stages
+VALIDATE_FULL_ROOT = EXTRACT_ROOT.parent / "validated_full"
 NOMINATIM_URL = "http://localhost:9020"
 # NOMINATIM_URL = "https://nominatim.openstreetmap.org"
 MAX_CONCURRENT = 512
+# previously validated dataset used as offline fast-path before querying nominatim. off by
+# default: the published data is an output of this pipeline and has no coordinates
+OFFLINE_INDEX_SOURCE = project_root() / "data" / "v1" / "24k" / "full.parquet"
 
 
 def iterate_nested_dicts(records: Iterable[Record[dict]]) -> Iterator[Record[dict]]:
@@ -45,27 +61,144 @@ def dict_contains_address(record: Record[dict]) -> bool:
     return True
 
 
-async def main(skip_existing: bool = False):
+def validate_version(
+    use_offline_index: bool, projection: Projection | None = None, full_sidecar: bool = False
+) -> str:
+    config = {
+        "nominatim_url": NOMINATIM_URL,
+        "use_offline_index": use_offline_index,
+        "fields": projection.fields if projection is not None else None,
+        "full_sidecar": full_sidecar,
+    }
+    modules = (sys.modules[__name__], osm_validator, projection_module, query_plan)
+    return code_version(*modules, config=config)
+
+
+async def validate_file(
+    validator: OsmValidator,
+    extract_file: Path,
+    version: str,
+    skip_existing: bool = False,
+    projection: Projection | None = None,
+    full_sidecar: bool = False,
+) -> list[Path]:
+    """
+    With a `projection`, only the fields that the later stages read are written. The full
+    records then optionally go to a sidecar file under `VALIDATE_FULL_ROOT`.
+    """
+    outfile = VALIDATE_ROOT / extract_file.relative_to(EXTRACT_ROOT)
+    outfile.parent.mkdir(parents=True, exist_ok=True)
+    full_file = None
+    if projection is not None and full_sidecar:
+        full_file = VALIDATE_FULL_ROOT / extract_file.relative_to(EXTRACT_ROOT)
+        full_file.parent.mkdir(parents=True, exist_ok=True)
+    outputs = [outfile, full_file] if full_file is not None else [outfile]
+    manifest = StageManifest(outfile)
+    if skip_existing and manifest.is_fresh(version, [extract_file], outputs):
+        print(f"Skipping up-to-date file: {outfile}")
+        return outputs
+    logger.info(f"Validating {extract_file} -> {outfile}")
+
+    records: list[Record[dict]] = read_from_jsongz(extract_file)
+    gen = (rec for rec in records)
+    gen = iterate_nested_dicts(gen)
+    gen = (rec for rec in gen if dict_contains_address(rec))
+    gen = (validator.record_query_validator(rec) for rec in gen)
+    tasks = list(gen)
+    results = await asyncio.gather(*tasks)
+    results = [res for res in results if res is not None]
+    if full_file is not None:
+        write_to_jsongz(results, outfile=full_file)
+    if projection is not None:
+        results = [projection(res) for res in results]
+    write_to_jsongz(results, outfile=outfile)
+    manifest.commit(version, [extract_file], outputs)
+    return outputs
+
+
+async def validate_files(
+    validator: OsmValidator,
+    extract_files: Iterable[Path],
+    version: str,
+    skip_existing: bool = False,
+    projection: Projection | None = None,
+    full_sidecar: bool = False,
+    coordination_dir: Path | None = None,
+):
+    if coordination_dir is None:
+        for extract_file in extract_files:
+            await validate_file(
+                validator, extract_file, version, skip_existing, projection, full_sidecar
+            )
+        return
+    coordinator = LeaseCoordinator(coordination_dir)
+    for lease in coordinator.claimed(str(f) for f in extract_files):
+        with coordinator.heartbeat(lease):
+            outputs, error = [], None
+            try:
+                outputs = await validate_file(
+                    validator, Path(lease.task), version, skip_existing, projection, full_sidecar
+                )
+            except Exception as ex:
+                logger.error(f"Error validating {lease.task}: {ex}")
+                error = str(ex)
+        if error is None:
+            coordinator.commit(lease, outputs)
+        else:
+            coordinator.fail(lease, error)
+
+
+def load_offline_geocoder(use_offline_index: bool) -> OfflineGeocoder | None:
+    if not (use_offline_index and OFFLINE_INDEX_SOURCE.is_file()):
+        return None
+    offline_geocoder = OfflineGeocoder.from_dataset(OFFLINE_INDEX_SOURCE)
+    logger.info(f"Loaded offline geocoder with {len(offline_geocoder)} addresses")
+    return offline_geocoder
+
+
+async def main(
+    skip_existing: bool = False,
+    use_offline_index: bool = False,
+    coordination_dir: Path | None = None,
+    metrics_url: str | None = None,
+    transport: Transport | None = None,
+    fields: list[str] | None = DOWNSTREAM_FIELDS,
+    full_sidecar: bool = False,
+):
+    """
+    With a `coordination_dir` on shared storage, extract files are distributed over all hosts
+    running this with the same directory, see `LeaseCoordinator`. With a `metrics_url`, query
+    stats are pushed to a `MetricsAggregator` (`python -m postalcrawl.metrics`).
+    `transport` configures the connections to Nominatim, e.g. `Transport(h2c=True)` when it
+    is served over HTTP/2 without TLS. Validated files only keep `fields` (all fields with
+    None), the full records are kept in a sidecar with `full_sidecar`.
+    """
     all_files = list(EXTRACT_ROOT.glob("**/*.json.gz"))
     print(all_files[:10])
-    async with OsmValidator(NOMINATIM_URL, max_concurrent=MAX_CONCURRENT) as validator:
-        for extract_file in tqdm(all_files):
-            outfile = VALIDATE_ROOT / extract_file.relative_to(EXTRACT_ROOT)
-            outfile.parent.mkdir(parents=True, exist_ok=True)
-            if skip_existing and outfile.exists():
-                print(f"Skipping existing file: {outfile}")
-                continue
-            logger.info(f"Validating {extract_file} -> {outfile}")
-
-            records: list[Record[dict]] = read_from_jsongz(extract_file)
-            gen = (rec for rec in records)
-            gen = iterate_nested_dicts(gen)
-            gen = (rec for rec in gen if dict_contains_address(rec))
-            gen = (validator.record_query_validator(rec) for rec in gen)
-            tasks = list(gen)
-            results = await asyncio.gather(*tasks)
-            results = [res for res in results if res is not None]
-            write_to_jsongz(results, outfile=outfile)
+    projection = Projection(fields) if fields is not None else None
+    version = validate_version(use_offline_index, projection, full_sidecar)
+    offline_geocoder = load_offline_geocoder(use_offline_index)
+    async with (
+        OsmValidator(
+            NOMINATIM_URL,
+            max_concurrent=MAX_CONCURRENT,
+            offline_geocoder=offline_geocoder,
+            transport=transport,
+        ) as validator,
+        MetricsPusher(validator.stats, metrics_url) if metrics_url else nullcontext(),
+    ):
+        await validate_files(
+            validator,
+            tqdm(all_files) if coordination_dir is None else all_files,
+            version,
+            skip_existing,
+            projection,
+            full_sidecar,
+            coordination_dir,
+        )
+        log_offline_stats(validator.stats)
+        log_plan_stats(validator.stats)
+        log_transport_stats(validator.stats)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,269 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+from postalcrawl.metrics import MetricsPusher
+from postalcrawl.stats import StatCounter
+from postalcrawl.validate import main as validate_main
+from postalcrawl.validate.offline_geocoder import log_offline_stats
+from postalcrawl.validate.osm_validator import OsmValidator, Transport, log_transport_stats
+from postalcrawl.validate.projection import DOWNSTREAM_FIELDS, Projection
+from postalcrawl.validate.query_plan import log_plan_stats
+
+# module settings of `validate.main` that workers take over from the parent process
+SHARED_SETTINGS = (
+    "EXTRACT_ROOT",
+    "VALIDATE_ROOT",
+    "VALIDATE_FULL_ROOT",
+    "NOMINATIM_URL",
+    "OFFLINE_INDEX_SOURCE",
+)
+# workers busier than this are the bottleneck, rather than Nominatim
+CPU_BOUND_UTILIZATION = 0.9
+RESULT_POLL_SECONDS = 5.0
+
+
+class SharedBudget:
+    """
+    Concurrency limit shared by the event loops of several processes, as a semaphore in
+    shared memory. A free permit is taken without blocking; otherwise the task waits for one
+    in a single thread per process, so the event loop keeps running meanwhile.
+    """
+
+    def __init__(self, semaphore):
+        self.semaphore = semaphore
+        self.waiter: ThreadPoolExecutor | None = None
+
+    async def __aenter__(self):
+        if self.semaphore.acquire(block=False):
+            return
+        if self.waiter is None:
+            self.waiter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="budget")
+        acquire = asyncio.get_running_loop().run_in_executor(self.waiter, self.semaphore.acquire)
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            acquire.add_done_callback(lambda _: self.semaphore.release())  # the permit it gets
+            raise
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.semaphore.release()
+
+    def close(self):
+        if self.waiter is not None:
+            self.waiter.shutdown(wait=False)
+
+
+@dataclass(frozen=True, slots=True)
+class WorkerResult:
+    worker: int
+    files: int
+    cpu_s: float
+    wall_s: float
+    stats: dict  # `StatCounter.snapshot`
+
+
+def queued_files(files: "multiprocessing.Queue") -> Iterator[Path]:
+    """the files of the shared queue, up to the end marker (None)"""
+    return iter(files.get, None)
+
+
+async def run_worker(
+    worker: int,
+    extract_files: Iterable[Path],
+    budget: SharedBudget,
+    version: str,
+    config: dict,
+) -> WorkerResult:
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    projection = Projection(config["fields"]) if config["fields"] is not None else None
+    offline_geocoder = validate_main.load_offline_geocoder(config["use_offline_index"])
+    n_files = 0
+
+    def counted(files: Iterable[Path]) -> Iterator[Path]:
+        nonlocal n_files
+        for extract_file in files:
+            n_files += 1
+            yield extract_file
+
+    async with (
+        OsmValidator(
+            validate_main.NOMINATIM_URL,
+            offline_geocoder=offline_geocoder,
+            transport=config["transport"],
+            concurrency=budget,
+        ) as validator,
+        MetricsPusher(validator.stats, config["metrics_url"])
+        if config["metrics_url"]
+        else nullcontext(),
+    ):
+        await validate_main.validate_files(
+            validator,
+            counted(extract_files),
+            version,
+            config["skip_existing"],
+            projection,
+            config["full_sidecar"],
+            config["coordination_dir"],
+        )
+    budget.close()
+    return WorkerResult(
+        worker=worker,
+        files=n_files,
+        cpu_s=time.process_time() - start_cpu,
+        wall_s=time.perf_counter() - start_wall,
+        stats=validator.stats.snapshot(),
+    )
+
+
+def _worker_main(
+    worker: int,
+    files: "multiprocessing.Queue | list[Path]",
+    results: "multiprocessing.Queue",
+    semaphore,
+    version: str,
+    config: dict,
+    settings: dict,
+):
+    for name, value in settings.items():
+        setattr(validate_main, name, value)
+    # with leases, every worker claims from all files; otherwise they take files from a queue
+    extract_files = files if isinstance(files, list) else queued_files(files)
+    budget = SharedBudget(semaphore)
+    result = asyncio.run(run_worker(worker, extract_files, budget, version, config))
+    results.put(result)
+
+
+def cpu_report(results: list[WorkerResult], budget: int) -> dict:
+    """
+    Request throughput against the CPU use of the workers. Busy workers mean more workers
+    help; a budget that is always used up means Nominatim (or the budget) is the limit.
+    Rates are over the time the workers ran, without the process startup.
+    """
+    wall_s = max((r.wall_s for r in results), default=0.0)
+    stats = StatCounter()
+    for result in results:
+        stats.merge(result.stats)
+    requests = stats["nominatim/request"]
+    cpu_s = sum(r.cpu_s for r in results)
+    utilization = [r.cpu_s / r.wall_s for r in results if r.wall_s > 0]
+    latency = stats.histograms.get("nominatim/latency_s")
+    in_flight = latency.sum / wall_s if latency is not None and wall_s > 0 else 0.0
+    max_utilization = max(utilization, default=0.0)
+    if max_utilization >= CPU_BOUND_UTILIZATION:
+        bottleneck = "workers"
+    elif in_flight >= CPU_BOUND_UTILIZATION * budget:
+        bottleneck = "budget"
+    else:
+        bottleneck = "nominatim"
+    return {
+        "workers": len(results),
+        "files": sum(r.files for r in results),
+        "requests": requests,
+        "requests_per_s": requests / wall_s if wall_s > 0 else 0.0,
+        "cpu_s": cpu_s,
+        "cpu_ms_per_request": cpu_s / requests * 1e3 if requests else 0.0,
+        "max_cpu_utilization": max_utilization,
+        "mean_cpu_utilization": sum(utilization) / len(utilization) if utilization else 0.0,
+        "mean_in_flight": in_flight,
+        "budget": budget,
+        "bottleneck": bottleneck,
+        "stats": stats,
+    }
+
+
+def log_cpu_report(report: dict):
+    logger.info(
+        f"{report['workers']} workers, {report['files']} files: {report['requests']} requests,"
+        f" {report['requests_per_s']:.1f}/s, {report['cpu_ms_per_request']:.2f}ms cpu/request,"
+        f" cpu utilization {report['mean_cpu_utilization']:.0%} mean"
+        f" / {report['max_cpu_utilization']:.0%} max, {report['mean_in_flight']:.1f} of"
+        f" {report['budget']} requests in flight on average -> bottleneck: {report['bottleneck']}"
+    )
+    log_offline_stats(report["stats"])
+    log_plan_stats(report["stats"])
+    log_transport_stats(report["stats"])
+
+
+def validate_multicore(
+    extract_files: list[Path],
+    n_workers: int,
+    budget: int = validate_main.MAX_CONCURRENT,
+    skip_existing: bool = False,
+    use_offline_index: bool = False,
+    coordination_dir: Path | None = None,
+    metrics_url: str | None = None,
+    transport: Transport | None = None,
+    fields: list[str] | None = DOWNSTREAM_FIELDS,
+    full_sidecar: bool = False,
+) -> dict:
+    """
+    Validate files in `n_workers` processes, each with its own event loop and session. Files
+    are handed out from a shared queue, so the workers stay busy until all files are taken;
+    all workers together keep at most `budget` requests in flight.
+    returns: the `cpu_report` of the run
+    """
+    projection = Projection(fields) if fields is not None else None
+    version = validate_main.validate_version(use_offline_index, projection, full_sidecar)
+    config = {
+        "skip_existing": skip_existing,
+        "use_offline_index": use_offline_index,
+        "coordination_dir": coordination_dir,
+        "metrics_url": metrics_url,
+        "transport": transport,
+        "fields": fields,
+        "full_sidecar": full_sidecar,
+    }
+    settings = {name: getattr(validate_main, name) for name in SHARED_SETTINGS}
+    ctx = multiprocessing.get_context("forkserver")
+    semaphore = ctx.BoundedSemaphore(budget)
+    results = ctx.Queue()
+    files = list(extract_files)
+    if coordination_dir is None:
+        files = ctx.Queue()
+        for extract_file in [*extract_files, *[None] * n_workers]:
+            files.put(extract_file)
+    processes = [
+        ctx.Process(
+            target=_worker_main,
+            args=(i, files, results, semaphore, version, config, settings),
+            name=f"validate-{i}",
+        )
+        for i in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    collected: list[WorkerResult] = []
+    while len(collected) < n_workers:
+        try:
+            collected.append(results.get(timeout=RESULT_POLL_SECONDS))
+        except queue.Empty:
+            failed = [p for p in processes if p.exitcode not in (None, 0)]
+            if failed:
+                for process in processes:
+                    process.kill()
+                raise RuntimeError(f"Validate workers failed: {[p.name for p in failed]}")
+    for process in processes:
+        process.join()
+    report = cpu_report(collected, budget)
+    log_cpu_report(report)
+    return report
+
+
+def main(n_workers: int | None = None, **kwargs) -> dict:
+    """multi-core `validate.main.main`, see `validate_multicore` for the arguments"""
+    extract_files = sorted(validate_main.EXTRACT_ROOT.glob("**/*.json.gz"))
+    return validate_multicore(extract_files, n_workers or os.cpu_count() or 4, **kwargs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import bisect
+import re
+import time
+import unicodedata
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import polars as pl
+from loguru import logger
+from rapidfuzz import fuzz
+from rapidfuzz.distance import Levenshtein
+from rapidfuzz.utils import default_process
+
+from postalcrawl.abbreviations import STREET_ABBREVIATIONS
+from postalcrawl.stats import StatCounter
+from postalcrawl.utils import read_from_jsongz
+
+KEY_SEP = "\x1f"
+GEOCODING_FIELDS = [
+    "name",
+    "housenumber",
+    "street",
+    "postcode",
+    "city",
+    "state",
+    "country",
+    "country_code",
+]
+# WGS84 coordinates of an entry, optional
+COORDINATE_FIELDS = ["lat", "lon"]
+# columns of the published dataset variants (e.g. data/v1/24k/full.parquet)
+DATASET_TARGET_COLUMNS = {
+    "target:name": "name",
+    "target:house_number": "housenumber",
+    "target:road": "street",
+    "target:postcode": "postcode",
+    "target:locality": "city",
+    "target:region": "state",
+    "target:country": "country",
+    "target:country_code": "country_code",
+}
+NEAR_MATCH_MAX_DISTANCE = 0.15
+# token set similarity (0-100) of the queried name and the name of an entry: "Holiday Inn"
+# matches "Holiday Inn Express & Suites", another business at the address does not
+NAME_MATCH_MIN_RATIO = 80
+
+
+def strip_accents(s: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", s)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_street(street: str | None) -> str:
+    if not street:
+        return ""
+    s = street.casefold()
+    s = s.replace("ß", "ss").replace("strasse", " strasse ")
+    s = strip_accents(s)
+    tokens: list[str] = re.findall(r"\w+", s)
+    return " ".join(STREET_ABBREVIATIONS.get(t, t) for t in tokens)
+
+
+def normalize_postcode(postcode: str | None) -> str:
+    if not postcode:
+        return ""
+    return re.sub(r"[\s\-]", "", postcode).upper()
+
+
+def normalize_housenumber(housenumber: str | None) -> str:
+    if not housenumber:
+        return ""
+    return re.sub(r"\s", "", housenumber).lower()
+
+
+def split_housenumber(street: str) -> tuple[str, str | None]:
+    """Split a schema.org streetAddress into (street, housenumber) without libpostal."""
+    street = street.strip()
+    if match := re.match(r"^(\d+[a-zA-Z]?)[\s,]+(.+)$", street):
+        return match.group(2), match.group(1)
+    if match := re.match(r"^(.+?)[\s,]+(\d+\s?[a-zA-Z]?)$", street):
+        return match.group(1), match.group(2)
+    return street, None
+
+
+def names_match(name: str, candidate: str) -> bool:
+    ratio = fuzz.token_set_ratio(
+        strip_accents(name), strip_accents(candidate), processor=default_process
+    )
+    return ratio >= NAME_MATCH_MIN_RATIO
+
+
+def make_key(countrycode: str, postcode: str, street: str, housenumber: str) -> str:
+    return KEY_SEP.join((countrycode, postcode, street, housenumber))
+
+
+def entry_coordinates(entry: dict) -> tuple[float, float] | None:
+    """(lon, lat) of an entry in geojson order, if known"""
+    if entry.get("lat") is None or entry.get("lon") is None:
+        return None
+    return entry["lon"], entry["lat"]
+
+
+class OfflineGeocoder:
+    """
+    In-process lookup of validated addresses, used as a fast-path before querying Nominatim.
+
+    Entries are kept in a sorted key array keyed on (countrycode, postcode, normalized street,
+    housenumber) with parallel arrays of geocodejson `properties.geocoding` dicts and of
+    (lon, lat) coordinates. Exact matches are a single bisect; near-exact matches scan the
+    (countrycode, postcode) range.
+    """
+
+    def __init__(self, entries: Iterable[dict]):
+        """entries: `GEOCODING_FIELDS`, and the `COORDINATE_FIELDS` if known"""
+        keyed: dict[str, dict] = {}
+        for geocoding in entries:
+            countrycode = (geocoding.get("country_code") or "").lower()
+            postcode = normalize_postcode(geocoding.get("postcode"))
+            street = normalize_street(geocoding.get("street"))
+            if not (countrycode and postcode and street):
+                continue
+            key = make_key(
+                countrycode, postcode, street, normalize_housenumber(geocoding.get("housenumber"))
+            )
+            keyed.setdefault(key, geocoding)
+        self.keys: list[str] = sorted(keyed)
+        self.values: list[dict] = [
+            {f: keyed[k].get(f) for f in GEOCODING_FIELDS} for k in self.keys
+        ]
+        self.coordinates = [entry_coordinates(keyed[k]) for k in self.keys]
+        # postcode -> countrycodes, to resolve lookups without a countrycode
+        self.postcode_countries: dict[str, list[str]] = {}
+        for key in self.keys:
+            countrycode, postcode, _ = key.split(KEY_SEP, 2)
+            countries = self.postcode_countries.setdefault(postcode, [])
+            if countrycode not in countries:
+                countries.append(countrycode)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def from_dataset(cls, parquet_file: Path) -> "OfflineGeocoder":
+        """
+        build from a published dataset variant, e.g. `data/v1/24k/full.parquet`.
+        the v1 variants have no coordinates, so their hits have no geometry
+        """
+        df = (
+            pl.read_parquet(parquet_file, columns=list(DATASET_TARGET_COLUMNS))
+            .rename(DATASET_TARGET_COLUMNS)
+            .unique()
+        )
+        return cls(df.iter_rows(named=True))
+
+    @classmethod
+    def from_validated(cls, validated_root: Path) -> "OfflineGeocoder":
+        """build from the `.json.gz` output files of the validate stage"""
+
+        def geocodings() -> Iterator[dict]:
+            for file_path in Path(validated_root).glob("**/*.json.gz"):
+                for record in read_from_jsongz(file_path):
+                    if record.get("osm") is not None:
+                        geometry = record["osm"].get("geometry") or {}
+                        lon, lat = geometry.get("coordinates") or (None, None)
+                        yield {**record["osm"]["properties"]["geocoding"], "lat": lat, "lon": lon}
+
+        return cls(geocodings())
+
+    @classmethod
+    def from_osm_pbf(cls, pbf_file: Path) -> "OfflineGeocoder":
+        """build from `addr:*` tags of a (regional) OSM extract. requires `osmium`"""
+        try:
+            import osmium
+        except ImportError as e:
+            raise ImportError("building from a PBF file requires `pip install osmium`") from e
+
+        def geocodings() -> Iterator[dict]:
+            for obj in osmium.FileProcessor(str(pbf_file)).with_filter(
+                osmium.filter.KeyFilter("addr:housenumber")
+            ):
+                tags = obj.tags
+                # ways and relations would need a location index for their centroid
+                location = obj.location if obj.is_node() else None
+                yield {
+                    "name": tags.get("name"),
+                    "housenumber": tags.get("addr:housenumber"),
+                    "street": tags.get("addr:street"),
+                    "postcode": tags.get("addr:postcode"),
+                    "city": tags.get("addr:city"),
+                    "state": tags.get("addr:state"),
+                    "country": None,
+                    "country_code": tags.get("addr:country"),
+                    "lat": location.lat if location is not None else None,
+                    "lon": location.lon if location is not None else None,
+                }
+
+        return cls(geocodings())
+
+    def save(self, outfile: Path):
+        schema = {f: pl.String for f in GEOCODING_FIELDS} | {
+            f: pl.Float64 for f in COORDINATE_FIELDS
+        }
+        entries = [
+            {**geocoding, "lon": lon, "lat": lat}
+            for geocoding, (lon, lat) in zip(
+                self.values, (c or (None, None) for c in self.coordinates), strict=True
+            )
+        ]
+        pl.DataFrame(entries, schema=schema).write_parquet(outfile, compression="zstd")
+
+    @classmethod
+    def load(cls, infile: Path) -> "OfflineGeocoder":
+        return cls(pl.read_parquet(infile).iter_rows(named=True))
+
+    def _range(self, prefix: str) -> Iterator[int]:
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            yield i
+            i += 1
+
+    def _lookup_country(
+        self, countrycode: str, postcode: str, street: str, housenumber: str
+    ) -> int | None:
+        key = make_key(countrycode, postcode, street, housenumber)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+
+        # near-exact: same postcode and housenumber, street within a small edit distance
+        for i in self._range(make_key(countrycode, postcode, "", "")[:-1]):
+            _, _, cand_street, cand_house = self.keys[i].split(KEY_SEP)
+            if cand_house != housenumber:
+                continue
+            if Levenshtein.normalized_distance(street, cand_street) <= NEAR_MATCH_MAX_DISTANCE:
+                return i
+        return None
+
+    def _lookup_index(
+        self,
+        street: str | None,
+        postcode: str | None,
+        countrycode: str | None = None,
+        housenumber: str | None = None,
+    ) -> int | None:
+        if not street or not postcode:
+            return None
+        if housenumber is None:
+            street, housenumber = split_housenumber(street)
+        norm_street = normalize_street(street)
+        norm_postcode = normalize_postcode(postcode)
+        norm_house = normalize_housenumber(housenumber)
+        if countrycode:
+            countrycodes = [countrycode.lower()]
+        else:
+            countrycodes = self.postcode_countries.get(norm_postcode, [])
+        for cc in countrycodes:
+            i = self._lookup_country(cc, norm_postcode, norm_street, norm_house)
+            if i is not None:
+                return i
+        return None
+
+    def lookup(
+        self,
+        street: str | None,
+        postcode: str | None,
+        countrycode: str | None = None,
+        housenumber: str | None = None,
+    ) -> dict | None:
+        """
+        Return the `properties.geocoding` dict of an exact or near-exact match, or None.
+        If no housenumber is given, it is split from the street. Without a countrycode all
+        countries of the index are probed.
+        """
+        i = self._lookup_index(street, postcode, countrycode, housenumber)
+        return self.values[i] if i is not None else None
+
+    def lookup_feature(self, stats: StatCounter, name: str | None = None, **query) -> dict | None:
+        """
+        lookup wrapped as geocodejson feature. tracks hit rate and latency in `stats`.
+        the index has one entry per address, so with a `name`, an entry with another name
+        (a different business at the same address) is a miss. hits of entries with
+        coordinates carry a point geometry
+        """
+        start = time.perf_counter_ns()
+        i = self._lookup_index(**query)
+        geocoding = self.values[i] if i is not None else None
+        mismatch = (
+            geocoding is not None
+            and name is not None
+            and geocoding.get("name") is not None
+            and not names_match(name, geocoding["name"])
+        )
+        stats.inc("offline/lookup_ns", time.perf_counter_ns() - start)
+        stats.inc("offline/lookup")
+        if mismatch:
+            stats.inc("offline/name_mismatch")
+        if i is None or geocoding is None or mismatch:
+            stats.inc("offline/miss")
+            return None
+        stats.inc("offline/hit")
+        feature: dict = {
+            "type": "Feature",
+            "properties": {"geocoding": {**geocoding, "source": "offline"}},
+        }
+        if (coordinates := self.coordinates[i]) is not None:
+            feature["geometry"] = {"type": "Point", "coordinates": list(coordinates)}
+        return feature
+
+
+def log_offline_stats(stats: StatCounter):
+    lookups = stats["offline/lookup"]
+    if not lookups:
+        return
+    hit_rate = stats["offline/hit"] / lookups
+    mean_us = stats["offline/lookup_ns"] / lookups / 1000
+    logger.info(
+        f"Offline geocoder: {lookups} lookups, hit rate {hit_rate:.1%}, mean latency {mean_us:.1f}µs"
+    )
@@ -1,17 +1,119 @@
 import asyncio
+import re
+import time
+from contextlib import AbstractAsyncContextManager
+from dataclasses import dataclass
 
 import yarl
 from loguru import logger
-from niquests import AsyncSession, HTTPError
+from niquests import AsyncSession, ConnectionError, HTTPError, Timeout
+from niquests.packages.urllib3.contrib.resolver._async.system import SystemResolver
+from niquests.packages.urllib3.exceptions import TimeoutError as Urllib3TimeoutError
 from urllib3 import Retry
 
 from postalcrawl.record import Record
+from postalcrawl.stats import StatCounter
+from postalcrawl.validate.offline_geocoder import OfflineGeocoder
+from postalcrawl.validate.query_plan import QueryPlanner
+
+
+@dataclass(frozen=True, slots=True)
+class Transport:
+    """connection settings of the Nominatim session"""
+
+    http2: bool = True  # negotiated with ALPN on https
+    h2c: bool = False  # http2 with prior knowledge on plain http, the server must support it
+    pool_connections: int = 4  # number of hosts to keep pools for
+    pool_maxsize: int = 32  # keep-alive connections per host. http2 multiplexes over each
+    timeout: float = 30.0  # per request attempt, retries come on top
+    retries: int = 5
+    backoff_factor: float = 1.0
+    dns_ttl: float = 300.0
+
+
+class CachingResolver(SystemResolver):
+    """
+    System DNS lookups, cached for `ttl` seconds; concurrent lookups of the same name share
+    one query. Lookups only happen when the pool opens a connection, so they also count the
+    connections (and TLS handshakes) of the session.
+    """
+
+    def __init__(self, stats: StatCounter, ttl: float):
+        super().__init__()
+        self.stats = stats
+        self.ttl = ttl
+        self.cache: dict[tuple, tuple[float, asyncio.Future]] = {}
+
+    async def getaddrinfo(self, host, port, family, type, proto=0, flags=0, **kwargs):
+        self.stats.inc("nominatim/connection")
+        key = (host, port, family, type, proto, flags)
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self.stats.inc("nominatim/dns_cache_hit")
+            return await asyncio.shield(cached[1])
+        lookup = asyncio.ensure_future(
+            super().getaddrinfo(host, port, family, type, proto, flags, **kwargs)
+        )
+        self.cache[key] = (time.monotonic() + self.ttl, lookup)
+        try:
+            return await asyncio.shield(lookup)
+        except OSError:
+            self.cache.pop(key, None)
+            raise
+
+
+def is_timeout(error: Exception) -> bool:
+    """timeouts surface as connection errors once the retries are used up"""
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, Timeout) or isinstance(reason, Urllib3TimeoutError)
+
+
+def create_session(transport: Transport, stats: StatCounter) -> AsyncSession:
+    return AsyncSession(
+        resolver=CachingResolver(stats, transport.dns_ttl),
+        retries=Retry(total=transport.retries, backoff_factor=transport.backoff_factor),
+        disable_http1=transport.h2c,
+        disable_http2=not transport.http2,
+        disable_http3=True,
+        pool_connections=transport.pool_connections,
+        pool_maxsize=transport.pool_maxsize,
+        timeout=transport.timeout,
+    )
+
+
+def log_transport_stats(stats: StatCounter):
+    requests, connections = stats["nominatim/request"], stats["nominatim/connection"]
+    if requests:
+        versions = {k.rsplit("/", 1)[1]: v for k, v in stats.filter("nominatim/http/").items()}
+        logger.info(
+            f"Nominatim: {requests} requests over {connections} connections"
+            f" ({1 - connections / requests:.1%} reused), http versions {versions},"
+            f" {stats['nominatim/timeout']} timeouts,"
+            f" {stats['nominatim/connection_error']} connection errors"
+        )
 
 
 class OsmValidator:
-    def __init__(self, nominatim_url: str, max_concurrent: int = 200):
-        self.semaphore = asyncio.Semaphore(max_concurrent)
-        self.session = AsyncSession(retries=Retry(total=5, backoff_factor=1))
+    def __init__(
+        self,
+        nominatim_url: str,
+        max_concurrent: int = 200,
+        offline_geocoder: OfflineGeocoder | None = None,
+        transport: Transport | None = None,
+        concurrency: AbstractAsyncContextManager | None = None,
+        planner: QueryPlanner | None = None,
+    ):
+        """
+        `concurrency` limits the requests in flight instead of `max_concurrent`, e.g. the
+        budget that the processes of `validate.multicore` share. `planner` decides which
+        queries are sent for a record, see `QueryPlanner`
+        """
+        self.semaphore = concurrency or asyncio.Semaphore(max_concurrent)
+        self.planner = planner or QueryPlanner()
+        self.offline_geocoder = offline_geocoder
+        self.stats = StatCounter()
+        self.in_flight = 0
+        self.session = create_session(transport or Transport(), self.stats)
         self.endpoint: yarl.URL = (
             yarl.URL(nominatim_url)
             .with_path("/search")
@@ -52,8 +154,27 @@ class OsmValidator:
 
     # async def query_validator(self, query_address: PostalAddress) -> dict | None:
     async def query_validator(
-        self, name: str, street: str, city: str, state: str, country: str, postalcode: str
+        self,
+        name: str | None,
+        street: str | None,
+        city: str | None,
+        state: str | None,
+        country: str | None,
+        postalcode: str | None,
     ) -> dict | None:
+        feature, _ = await self.locate(name, street, city, state, country, postalcode)
+        return feature
+
+    async def locate(
+        self,
+        name: str | None,
+        street: str | None,
+        city: str | None,
+        state: str | None,
+        country: str | None,
+        postalcode: str | None,
+    ) -> tuple[dict | None, str | None]:
+        """the feature of an address and the strategy that found it ("offline" for the index)"""
         query_params = {
             "amenity": name,
             "street": street,
@@ -66,15 +187,54 @@ class OsmValidator:
         query_params = {k: OsmValidator.ensure_string(v) for k, v in query_params.items()}
         query_params = {k: v for k, v in query_params.items() if v}
         if len(query_params) == 0:
-            return None
+            return None, None
+        if self.offline_geocoder is not None:
+            countrycode = query_params.get("country")
+            if countrycode and not re.match(r"^[A-Za-z]{2}$", countrycode):
+                countrycode = None  # a country name
+            feature = self.offline_geocoder.lookup_feature(
+                self.stats,
+                name=query_params.get("amenity"),
+                street=query_params.get("street"),
+                postcode=query_params.get("postalcode"),
+                countrycode=countrycode,
+            )
+            if feature is not None:
+                return feature, "offline"
+        for strategy, params in self.planner.plan(query_params, self.stats):
+            features = await self.search(params)
+            if features is None:
+                return None, None  # failed requests: the next tiers would fail as well
+            if features and self.planner.accept(strategy, features[0], query_params, self.stats):
+                return features[0], strategy.name
+        return None, None
+
+    async def search(self, params: dict[str, str]) -> list[dict] | None:
+        """the features of a Nominatim search, None if the request failed"""
         try:
-            url = self.endpoint.update_query(**query_params)
+            url = self.endpoint.update_query(**params)
         except ValueError:
-            logger.warning(f"Invalid URL for query params: {query_params}")
+            logger.warning(f"Invalid URL for query params: {params}")
             return None
         async with self.semaphore:
             logger.info(f"Sending query to OSM: {url}")
-            resp = await self.session.get(str(url))
+            self.in_flight += 1
+            self.stats.set("nominatim/in_flight", self.in_flight)
+            start = time.perf_counter()
+            try:
+                resp = await self.session.get(str(url))
+            except (Timeout, ConnectionError) as e:
+                if is_timeout(e):
+                    self.stats.inc("nominatim/timeout")
+                else:
+                    self.stats.inc("nominatim/connection_error")
+                logger.warning(f"Request failed for URL: {url}: {e}")
+                return None
+            finally:
+                self.in_flight -= 1
+            self.stats.observe("nominatim/latency_s", time.perf_counter() - start)
+        self.stats.inc("nominatim/request")
+        self.stats.inc(f"nominatim/http/{resp.http_version}")
 
         try:
             resp.raise_for_status()
@@ -83,25 +243,22 @@ class OsmValidator:
             return None
 
         response_data = resp.json()
-        if response_data:
-            if response_data.get("features"):
-                return response_data["features"][0]
-        return None
+        return (response_data or {}).get("features") or []
 
     async def record_query_validator(self, record: Record[dict]) -> dict | None:
         data = record["data"]
         address = data["address"]
-        query_params = dict(
-            name=data.get("name") or data.get("legalName"),
-            street=address.get("streetAddress"),
-            city=address.get("addressLocality"),
-            postalcode=address.get("postalCode"),
-            country=address.get("addressCountry"),
-            state=address.get("addressRegion"),
-        )
-        result = await self.query_validator(**query_params)
+        query_params = {
+            "name": data.get("name") or data.get("legalName"),
+            "street": address.get("streetAddress"),
+            "city": address.get("addressLocality"),
+            "postalcode": address.get("postalCode"),
+            "country": address.get("addressCountry"),
+            "state": address.get("addressRegion"),
+        }
+        result, strategy = await self.locate(**query_params)
         return {
             "osm": result,
             "crawl": record,
-            "address_query": query_params,
+            "address_query": {**query_params, "strategy": strategy},
         }
@@ -0,0 +1,43 @@
+from collections.abc import Iterable
+
+from postalcrawl.validate.offline_geocoder import GEOCODING_FIELDS
+
+# fields of validated records that the downstream stages read, as dotted paths:
+# `pack.main.generate_address_rows` and `OfflineGeocoder.from_validated`
+DOWNSTREAM_FIELDS = [
+    "address_query",
+    *(f"osm.properties.geocoding.{field}" for field in GEOCODING_FIELDS),
+    "osm.geometry",
+]
+
+
+def field_tree(fields: Iterable[str]) -> dict:
+    """dotted paths -> nested dict of path segments. an empty dict selects a whole subtree"""
+    tree: dict = {}
+    for field in fields:
+        node = tree
+        *parents, leaf = field.split(".")
+        for part in parents:
+            if part in node and not node[part]:
+                break  # a prefix of this path is already selected as a whole
+            node = node.setdefault(part, {})
+        else:
+            node[leaf] = {}  # also replaces narrower selections below `leaf`
+    return tree
+
+
+def project_value(value, tree: dict):
+    if not tree or not isinstance(value, dict):
+        return value  # selected subtree, or a leaf / null on the path (e.g. "osm": null)
+    return {key: project_value(value[key], sub) for key, sub in tree.items() if key in value}
+
+
+class Projection:
+    """keeps only the selected fields of validated records, in their nested structure"""
+
+    def __init__(self, fields: Iterable[str] = DOWNSTREAM_FIELDS):
+        self.fields = sorted(fields)
+        self.tree = field_tree(self.fields)
+
+    def __call__(self, record: dict) -> dict:
+        return project_value(record, self.tree)
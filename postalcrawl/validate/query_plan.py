@@ -0,0 +1,166 @@
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from loguru import logger
+
+from postalcrawl.stats import StatCounter
+
+# query fields that narrow a result down to an address, rather than a region
+LOCATING_FIELDS = ("street", "postalcode", "city")
+# geocodejson types of results at the level of an address, rather than a region
+ADDRESS_TYPES = ("house", "street")
+MAX_REQUESTS_PER_RECORD = 3
+
+
+@dataclass(frozen=True, slots=True)
+class QueryStrategy:
+    """
+    A Nominatim query from a subset of the query fields: structured, or the fields joined into
+    one free-form `q`. Results of strategies that `verify` only count as a match if they are
+    an address and agree with the query on the postcode, or else the city, see `agrees`.
+    """
+
+    name: str
+    fields: tuple[str, ...]
+    free_form: bool = False
+    verify: bool = True
+
+    def values(self, query: dict[str, str]) -> dict[str, str]:
+        return {k: query[k] for k in self.fields if query.get(k)}
+
+    def params(self, query: dict[str, str]) -> dict[str, str]:
+        values = self.values(query)
+        if self.free_form and values:
+            return {"q": ", ".join(values.values())}
+        return values
+
+
+# most selective first: a structured query with all fields only matches if all of them do
+DEFAULT_STRATEGIES = (
+    QueryStrategy(
+        "full", ("amenity", "street", "city", "state", "country", "postalcode"), verify=False
+    ),
+    QueryStrategy("no_amenity", ("street", "city", "state", "country", "postalcode")),
+    QueryStrategy("no_region", ("street", "city", "country", "postalcode")),
+    QueryStrategy("free_form", ("street", "postalcode", "city", "country"), free_form=True),
+)
+
+
+def postcode_key(value: str) -> str:
+    return re.sub(r"[\s-]", "", value).casefold()
+
+
+def is_address(geocoding: dict) -> bool:
+    """whether a result is an address or a street, rather than a postcode area or a city"""
+    return bool(
+        geocoding.get("street")
+        or geocoding.get("housenumber")
+        or geocoding.get("type") in ADDRESS_TYPES
+    )
+
+
+def agrees(feature: dict, query: dict[str, str]) -> bool:
+    """
+    whether a result is an address with the postcode of the query, or if either has none,
+    its city. relaxed queries also find the postcode area or the city itself, which agree
+    with the query but locate nothing
+    """
+    geocoding = feature.get("properties", {}).get("geocoding", {})
+    if not is_address(geocoding):
+        return False
+    if query.get("postalcode") and geocoding.get("postcode"):
+        return postcode_key(query["postalcode"]) == postcode_key(geocoding["postcode"])
+    if query.get("city") and geocoding.get("city"):
+        city, result_city = query["city"].casefold().strip(), geocoding["city"].casefold()
+        return city in result_city or result_city in city  # "Berlin" and "Berlin-Mitte"
+    return False
+
+
+class QueryPlanner:
+    """
+    Tiers of query strategies for one record, tried in order until one gives a match: the
+    strict query first, then less strict ones, which need their results to agree with the
+    query. A tier is skipped without a request if it would send the same query as an earlier
+    one (e.g. there is no amenity to drop), or, after the first, no longer has a locating
+    field. At most `max_requests` tiers are sent per record.
+
+    Counts requests, matches and rejected results per strategy in `plan/<strategy>/...`,
+    see `plan_report`.
+    """
+
+    def __init__(
+        self,
+        strategies: tuple[QueryStrategy, ...] = DEFAULT_STRATEGIES,
+        max_requests: int = MAX_REQUESTS_PER_RECORD,
+    ):
+        self.strategies = strategies
+        self.max_requests = max_requests
+
+    def plan(
+        self, query: dict[str, str], stats: StatCounter
+    ) -> Iterator[tuple[QueryStrategy, dict[str, str]]]:
+        """(strategy, request params) of the tiers to try, until the caller stops"""
+        stats.inc("plan/record")
+        sent: list[dict[str, str]] = []
+        for i, strategy in enumerate(self.strategies):
+            params = strategy.params(query)
+            locating = any(k in LOCATING_FIELDS for k in strategy.values(query))
+            if not params or params in sent or (i > 0 and not locating):
+                stats.inc("plan/skipped")
+                continue
+            if len(sent) == self.max_requests:
+                stats.inc("plan/budget_exhausted")
+                return
+            sent.append(params)
+            stats.inc(f"plan/{strategy.name}/request")
+            yield strategy, params
+
+    def accept(
+        self, strategy: QueryStrategy, feature: dict, query: dict[str, str], stats: StatCounter
+    ) -> bool:
+        if strategy.verify and not agrees(feature, query):
+            stats.inc(f"plan/{strategy.name}/rejected")
+            return False
+        stats.inc(f"plan/{strategy.name}/match")
+        stats.inc("plan/validated")
+        return True
+
+
+def plan_report(
+    stats: StatCounter, strategies: tuple[QueryStrategy, ...] = DEFAULT_STRATEGIES
+) -> dict:
+    """yield per request of each strategy, and the requests per validated row of all"""
+    per_strategy = {}
+    for strategy in strategies:
+        requests = stats.get(f"plan/{strategy.name}/request", 0)
+        matches = stats.get(f"plan/{strategy.name}/match", 0)
+        per_strategy[strategy.name] = {
+            "requests": requests,
+            "matches": matches,
+            "rejected": stats.get(f"plan/{strategy.name}/rejected", 0),
+            "yield_per_request": matches / requests if requests else 0.0,
+        }
+    requests = sum(s["requests"] for s in per_strategy.values())
+    validated = stats.get("plan/validated", 0)
+    return {
+        "strategies": per_strategy,
+        "records": stats.get("plan/record", 0),
+        "requests": requests,
+        "validated": validated,
+        "requests_per_validated": requests / validated if validated else 0.0,
+    }
+
+
+def log_plan_stats(stats: StatCounter, strategies: tuple[QueryStrategy, ...] = DEFAULT_STRATEGIES):
+    report = plan_report(stats, strategies)
+    if not report["requests"]:
+        return
+    tiers = ", ".join(
+        f"{name} {s['matches']}/{s['requests']}" for name, s in report["strategies"].items()
+    )
+    logger.info(
+        f"Query plan: {report['validated']} of {report['records']} records validated with"
+        f" {report['requests']} requests ({report['requests_per_validated']:.2f} per row),"
+        f" matches/requests per strategy: {tiers}"
+    )
@@ -0,0 +1,242 @@
+import asyncio
+import io
+import json
+import re
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+from jh2.config import H2Configuration
+from jh2.connection import H2Connection
+from jh2.events import RequestReceived
+from warcio.archiveiterator import ArchiveIterator
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from postalcrawl.metrics import MetricsAggregator
+
+RESOURCES = Path(__file__).parent / "resources"
+
+
+def address_page(name: str, street: str) -> str:
+    ld_json = {
+        "@context": "https://schema.org",
+        "@type": "Organization",
+        "name": name,
+        "address": {
+            "@type": "PostalAddress",
+            "streetAddress": street,
+            "addressLocality": "Berlin",
+            "postalCode": "10115",
+            "addressCountry": "DE",
+        },
+    }
+    return (
+        "<html><head><title>test</title>"
+        f'<script type="application/ld+json">{json.dumps(ld_json)}</script>'
+        "</head><body><p>hello</p></body></html>"
+    )
+
+
+def write_warc(path: Path, pages: list[tuple[str, str, str]]) -> Path:
+    """write a gzipped WARC with one request + response record per (url, content_type, body)"""
+    with open(path, "wb") as f:
+        writer = WARCWriter(f, gzip=True)
+        for url, content_type, body in pages:
+            request_headers = StatusAndHeaders(
+                "GET / HTTP/1.1", [("Host", url.split("/")[2])], is_http_request=True
+            )
+            request = writer.create_warc_record(
+                url, "request", payload=io.BytesIO(b""), http_headers=request_headers
+            )
+            writer.write_record(request)
+            http_headers = StatusAndHeaders(
+                "200 OK", [("Content-Type", content_type)], protocol="HTTP/1.1"
+            )
+            response = writer.create_warc_record(
+                url, "response", payload=io.BytesIO(body.encode()), http_headers=http_headers
+            )
+            writer.write_record(response)
+    return path
+
+
+def warc_record_offsets(path: Path) -> list[tuple[str, str, int, int]]:
+    """(url, rec_type, offset, length) of every record in a WARC file"""
+    with open(path, "rb") as f:
+        it = ArchiveIterator(f)
+        out = []
+        for record in it:
+            url = record.rec_headers.get_header("WARC-Target-URI")
+            rec_type = record.rec_type
+            it.read_to_end()
+            out.append((url, rec_type, it.get_record_offset(), it.get_record_length()))
+    return out
+
+
+@pytest.fixture
+def synthetic_pages() -> list[tuple[str, str, str]]:
+    pages = []
+    for i in range(20):
+        if i % 4 == 0:
+            pages.append((f"https://shop{i}.example.com/", "text/html", address_page(f"Shop {i}", f"Hauptstr. {i}")))  # fmt: skip
+        elif i % 4 == 1:
+            pages.append((f"https://img{i}.example.com/a.png", "image/png", "\x89PNG" * 100))
+        else:
+            pages.append((f"https://blog{i}.example.com/", "text/html; charset=utf-8", "<html><body>no address</body></html>"))  # fmt: skip
+    return pages
+
+
+@pytest.fixture
+def synthetic_warc(tmp_path, synthetic_pages) -> Path:
+    return write_warc(tmp_path / "synthetic-00000.warc.gz", synthetic_pages)
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """static file handler with single-range `Range: bytes=a-b` support"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        match = re.match(r"bytes=(\d+)-(\d*)", range_header or "")
+        path = Path(self.translate_path(self.path))
+        if match is None or not path.is_file():
+            return super().do_GET()
+        data = path.read_bytes()
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else len(data) - 1
+        body = data[start : end + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def range_server(tmp_path):
+    """local stand-in for data.commoncrawl.org serving files from `tmp_path`"""
+    handler = partial(RangeRequestHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+
+class NominatimStub:
+    """
+    local stand-in for a Nominatim server: answers every request with `respond(path)` after
+    `delay` seconds. speaks HTTP/1.1 with keep-alive and HTTP/2 with prior knowledge (h2c),
+    and counts the connections and requests it served, and the most requests at once
+    """
+
+    def __init__(self, delay: float = 0.005, respond=None):
+        self.delay = delay
+        self.respond = respond or (lambda path: {"type": "FeatureCollection", "features": []})
+        self.connections = 0
+        self.requests: list[str] = []
+        self.in_flight = self.max_in_flight = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self) -> "NominatimStub":
+        self.thread.start()
+        server = asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.server = asyncio.run_coroutine_threadsafe(server, self.loop).result()
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        return self
+
+    def stop(self):
+        async def shutdown():
+            self.server.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def response_body(self, path: str) -> bytes:
+        self.requests.append(path)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return json.dumps(self.respond(path)).encode()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            head = await reader.readexactly(len(H2_PREFACE))
+            if head == H2_PREFACE:
+                await self.handle_h2(head, reader, writer)
+            else:
+                await self.handle_h1(head, reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    async def handle_h1(self, buf: bytes, reader: asyncio.StreamReader, writer):
+        while True:
+            while b"\r\n\r\n" not in buf:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                buf += chunk
+            request, buf = buf.split(b"\r\n\r\n", 1)
+            body = await self.response_body(request.split(b" ")[1].decode())
+            header = f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"  # fmt: skip
+            writer.write(header.encode() + body)
+            await writer.drain()
+
+    async def handle_h2(self, data: bytes, reader: asyncio.StreamReader, writer):
+        conn = H2Connection(H2Configuration(client_side=False))
+        conn.initiate_connection()
+        streams: set[asyncio.Task] = set()
+
+        async def respond(stream_id: int, path: str):
+            body = await self.response_body(path)
+            headers = [(":status", "200"), ("content-type", "application/json"), ("content-length", str(len(body)))]  # fmt: skip
+            conn.send_headers(stream_id, headers)
+            conn.send_data(stream_id, body, end_stream=True)
+            writer.write(conn.data_to_send())
+
+        while data:
+            for event in conn.receive_data(data):
+                if isinstance(event, RequestReceived):
+                    assert event.stream_id is not None and event.headers is not None
+                    path = dict(event.headers)[b":path"].decode()
+                    task = asyncio.create_task(respond(event.stream_id, path))
+                    streams.add(task)
+                    task.add_done_callback(streams.discard)
+            writer.write(conn.data_to_send())
+            await writer.drain()
+            data = await reader.read(65536)
+
+
+@pytest.fixture
+def nominatim_stub():
+    stub = NominatimStub().start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def metrics_aggregator():
+    """(aggregator, url) of an aggregator on a free port"""
+    aggregator = MetricsAggregator()
+    server = aggregator.serve(host="127.0.0.1", port=0)
+    yield aggregator, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
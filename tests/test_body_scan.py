@@ -0,0 +1,26 @@
+import io
+
+from parsel import Selector
+
+from postalcrawl.extract.utils import scan_ld_json_scripts
+from tests.conftest import RESOURCES
+
+LD_JSON_XPATH = "//script[@type='application/ld+json']/text()"
+
+
+def test_scan_matches_full_parse():
+    for resource in ("index.html", "response.1.html"):
+        raw = (RESOURCES / resource).read_bytes()
+        expected = Selector(text=raw.decode()).xpath(LD_JSON_XPATH).getall()
+        for window_size in (7, 1000, 64 * 1024):  # tiny windows split tags at the edges
+            scripts, truncated = scan_ld_json_scripts(io.BytesIO(raw), window_size=window_size)
+            assert not truncated
+            assert Selector(text=scripts.decode()).xpath(LD_JSON_XPATH).getall() == expected
+
+
+def test_scan_caps_huge_bodies():
+    script = b'<script type="application/ld+json">{"@type": "PostalAddress"}</script>'
+    body = script + b"<p>" + b"x" * 50_000_000 + b"</p>" + script
+    scripts, truncated = scan_ld_json_scripts(io.BytesIO(body), max_bytes=1024 * 1024)
+    assert truncated
+    assert scripts == script
@@ -0,0 +1,47 @@
+import json
+
+from postalcrawl.extract.cc_index import filter_index_entries, read_cdx_index
+from postalcrawl.extract.extract import extract_pipeline
+from postalcrawl.extract.main import extract_addresses_from_index
+from postalcrawl.extract.warc_loaders import offline_record_generator, range_record_generator
+from postalcrawl.stats import StatCounter
+from postalcrawl.utils import read_from_jsongz
+from tests.conftest import warc_record_offsets
+
+
+def write_cdx(tmp_path, warc_file, synthetic_pages):
+    mimes = {url: content_type.split(";")[0] for url, content_type, _ in synthetic_pages}
+    index_file = tmp_path / "cdx-00000.cdxj"
+    with open(index_file, "w") as f:
+        for url, rec_type, offset, length in warc_record_offsets(warc_file):
+            if rec_type != "response":
+                continue
+            fields = {"url": url, "mime": mimes[url], "filename": warc_file.name,
+                      "offset": offset, "length": length}  # fmt: skip
+            f.write(f"com,example)/ 20250612112840 {json.dumps(fields)}\n")
+    return index_file
+
+
+def test_range_fetch_matches_full_read(tmp_path, synthetic_warc, synthetic_pages, range_server):
+    index_file = write_cdx(tmp_path, synthetic_warc, synthetic_pages)
+    stats = StatCounter()
+    entries = filter_index_entries(read_cdx_index(index_file), stats)
+    gen = range_record_generator(entries, stats, base_url=range_server, max_workers=4)
+    selective = list(extract_pipeline(gen, stats))
+
+    full_stats = StatCounter()
+    full = list(extract_pipeline(offline_record_generator(synthetic_warc, full_stats), full_stats))
+    assert selective == full
+    assert len(selective) == 5
+    assert stats["index/selected"] == 15  # png records are never fetched
+    assert stats["warc/range_bytes"] < synthetic_warc.stat().st_size
+
+
+def test_host_allowlist(tmp_path, synthetic_warc, synthetic_pages, range_server):
+    index_file = write_cdx(tmp_path, synthetic_warc, synthetic_pages)
+    out_path = extract_addresses_from_index(
+        index_file, tmp_path / "out", host_allowlist={"shop0.example.com"}, base_url=range_server
+    )
+    assert out_path is not None
+    data = read_from_jsongz(out_path)
+    assert [rec["crawl_metadata"]["url"] for rec in data] == ["https://shop0.example.com/"]
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+import requests
+
+from postalcrawl.extract import main as extract_main
+from postalcrawl.extract import warc_loaders
+from postalcrawl.extract.warc_loaders import RecordCursor, offline_record_generator
+from postalcrawl.stats import StatCounter
+from postalcrawl.utils import read_from_jsongz
+from tests.conftest import address_page, warc_record_offsets, write_warc
+
+FILE_ID = (
+    "crawl-data/CC-MAIN-2025-30/segments/1751905933612.63/warc/"
+    "CC-MAIN-20250707183638-20250707213638-00000.warc.gz"
+)
+
+
+@pytest.fixture
+def segment_file(tmp_path, synthetic_pages):
+    pages = synthetic_pages + [
+        (f"https://more{i}.example.com/", "text/html", address_page(f"More {i}", f"Weg {i}"))
+        for i in range(20)
+    ]
+    path = tmp_path / "cc" / FILE_ID
+    path.parent.mkdir(parents=True)
+    return write_warc(path, pages)
+
+
+def test_cursor_resumes_at_record(segment_file):
+    offsets = [offset for _, _, offset, _ in warc_record_offsets(segment_file)]
+    cursor = RecordCursor()
+    records = offline_record_generator(segment_file, StatCounter(), cursor=cursor)
+    urls = []
+    for record in records:
+        assert cursor.offset == offsets[len(urls)]
+        urls.append(record.rec_headers.get_header("WARC-Target-URI"))
+
+    cursor = RecordCursor(offsets[31])
+    resumed = offline_record_generator(segment_file, StatCounter(), cursor=cursor)
+    assert [r.rec_headers.get_header("WARC-Target-URI") for r in resumed] == urls[31:]
+    assert cursor.offset == offsets[-1]
+
+
+def test_extract_resumes_from_checkpoint(tmp_path, segment_file, range_server, monkeypatch):
+    monkeypatch.setattr(warc_loaders, "CC_DATA_URL", f"{range_server}cc/")
+    download = extract_main.download_record_generator
+    attempts = []
+
+    def flaky_download(file_id, stats, cursor=None):
+        """drops the connection after 25 records in the first attempt"""
+        attempts.append(cursor.offset if cursor is not None else None)
+        for i, record in enumerate(download(file_id, stats, cursor)):
+            if len(attempts) == 1 and i == 25:
+                raise requests.ConnectionError("connection dropped")
+            yield record
+
+    def extract(dest_dir, **kwargs):
+        return extract_main.extract_addresses_from_file_id(
+            FILE_ID, dest_dir, checkpoint_interval=0, **kwargs
+        )
+
+    expected = extract(tmp_path / "single")
+    monkeypatch.setattr(extract_main, "download_record_generator", flaky_download)
+    (error_file,) = extract(tmp_path / "resumed")
+    assert error_file.suffix == ".error"
+    outputs = extract(tmp_path / "resumed")
+    assert attempts[0] == 0 and attempts[1] > 0
+    assert not error_file.exists() and not any((tmp_path / "resumed").glob("**/*.partial"))
+
+    out, stats_file, hosts_file = outputs
+    assert read_from_jsongz(out) == read_from_jsongz(expected[0])
+    assert len(read_from_jsongz(out)) == 25
+    stats, single_stats = (json.loads(p.read_text()) for p in (stats_file, expected[1]))
+    assert stats.pop("time/elapsed_s") >= 0 and single_stats.pop("time/elapsed_s") >= 0
+
+    def without_memo(stats: dict) -> dict:
+        # memo hits depend on what the process parsed before
+        return {k: v for k, v in stats.items() if not k.startswith("memo/")}
+
+    assert without_memo(stats) == without_memo(single_stats)
+    assert hosts_file.read_bytes() == expected[2].read_bytes()
@@ -0,0 +1,120 @@
+import json
+import multiprocessing
+import os
+import time
+from functools import partial
+from pathlib import Path
+
+from postalcrawl.coordination import LeaseCoordinator
+from postalcrawl.validate.main import validate_files
+from postalcrawl.validate.osm_validator import OsmValidator
+
+TASKS = [f"crawl-data/segment/{i:05d}.warc.gz" for i in range(24)]
+
+
+def slow_work(shared: Path, task: str) -> list[Path]:
+    time.sleep(0.02)
+    with open(shared / "executions.log", "a") as f:
+        f.write(f"{task}\n")
+    out_path = shared / "out" / f"{task.split('/')[-1]}.txt"
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    tmp_path.write_text(f"{task} by {os.getpid()}")
+    tmp_path.replace(out_path)
+    return [out_path]
+
+
+def run_worker(shared: Path):
+    coordinator = LeaseCoordinator(
+        shared / "coord", lease_seconds=5, clock_margin=1, poll_seconds=0.05
+    )
+    coordinator.run(TASKS, lambda task: slow_work(shared, task))
+
+
+def test_workers_share_tasks(tmp_path):
+    (tmp_path / "out").mkdir()
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=run_worker, args=(tmp_path,)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(timeout=60)
+        assert w.exitcode == 0
+
+    executions = (tmp_path / "executions.log").read_text().splitlines()
+    assert sorted(executions) == sorted(TASKS)  # every task exactly once
+    owners = {p.read_text().split(" by ")[1] for p in (tmp_path / "out").iterdir()}
+    assert len(owners) > 1
+    coordinator = LeaseCoordinator(tmp_path / "coord", lease_seconds=5, clock_margin=1)
+    assert all(coordinator.is_done(t) for t in TASKS)
+    assert not list(coordinator.lease_dir.iterdir())
+
+
+def test_dead_worker_lease_is_reclaimed(tmp_path):
+    coordinator = partial(
+        LeaseCoordinator, tmp_path, lease_seconds=0.3, clock_margin=0.05, poll_seconds=0.05
+    )
+    dead = coordinator(worker_id="dead")
+    alive = coordinator(worker_id="alive")
+    lease = dead.claim(TASKS[0])
+    assert lease is not None
+    assert alive.claim(TASKS[0]) is None  # still leased
+
+    done = []
+    alive.run(TASKS[:2], lambda task: done.append(task) or [])
+    assert sorted(done) == TASKS[:2]
+    # the dead worker comes back, its lease was taken over
+    assert not dead.commit(lease, [])
+    assert lease.lost.is_set()
+
+
+def test_heartbeat_keeps_lease(tmp_path):
+    owner = LeaseCoordinator(tmp_path, lease_seconds=0.3, clock_margin=0.05)
+    other = LeaseCoordinator(tmp_path, lease_seconds=0.3, clock_margin=0.05)
+    lease = owner.claim(TASKS[0])
+    assert lease is not None
+    with owner.heartbeat(lease, interval=0.05):
+        time.sleep(0.8)
+        assert other.claim(TASKS[0]) is None
+    assert owner.commit(lease, [tmp_path / "output"])
+    assert other.claim(TASKS[0]) is None  # done
+
+
+def test_failed_task_is_retried(tmp_path):
+    coordinator = LeaseCoordinator(tmp_path, lease_seconds=5, clock_margin=1, poll_seconds=0.01)
+    attempts = []
+
+    def work(task: str) -> list[Path]:
+        attempts.append(task)
+        if task == TASKS[0] and attempts.count(task) < 2:
+            raise OSError("connection reset")  # transient
+        if task == TASKS[1]:
+            raise ValueError("corrupt segment")  # permanent
+        return []
+
+    coordinator.run(TASKS[:3], work)
+    assert [attempts.count(task) for task in TASKS[:3]] == [2, 3, 1]
+    assert all(coordinator.is_done(task) for task in TASKS[:3])
+    assert not list(coordinator.lease_dir.iterdir())
+    marker = json.loads(coordinator.done_path(TASKS[1]).read_text())
+    assert marker["error"] == "corrupt segment" and marker["outputs"] == []
+    assert json.loads(coordinator.done_path(TASKS[0]).read_text())["error"] is None
+    failures = json.loads(coordinator.failed_path(TASKS[1]).read_text())
+    assert [f["error"] for f in failures["errors"]] == ["corrupt segment"] * 3
+
+
+async def test_failed_validation_is_recorded(tmp_path):
+    outside_extract_root = tmp_path / "segment.json.gz"
+    task = str(outside_extract_root)
+    coordinator = LeaseCoordinator(tmp_path / "coord")
+    for _ in range(coordinator.max_attempts - 1):  # so the last attempt does not wait to retry
+        lease = coordinator.claim(task)
+        assert lease is not None and not coordinator.fail(lease, "earlier attempt")
+
+    async with OsmValidator("http://127.0.0.1:9") as validator:
+        await validate_files(
+            validator, [outside_extract_root], "v", coordination_dir=coordinator.root
+        )
+    assert coordinator.is_done(task)
+    errors = [f["error"] for f in json.loads(coordinator.failed_path(task).read_text())["errors"]]
+    assert errors[:-1] == ["earlier attempt"] * (coordinator.max_attempts - 1)
+    assert "is not in the subpath" in errors[-1]
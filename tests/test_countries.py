@@ -0,0 +1,72 @@
+import time
+
+import polars as pl
+import pytest
+
+from postalcrawl.pack.countries import (
+    add_country_codes,
+    build_country_index,
+    load_country_index,
+    normalize_expr,
+    osm_name_variants,
+)
+from postalcrawl.utils import project_root
+
+VALUES_24K = project_root() / "data" / "v1" / "24k" / "values.csv"
+
+
+@pytest.fixture(scope="module")
+def country_index(tmp_path_factory) -> pl.DataFrame:
+    return load_country_index(tmp_path_factory.mktemp("countries") / "index.arrow", None)
+
+
+def codes(values: list[str | None], index: pl.DataFrame) -> list[str | None]:
+    return add_country_codes(pl.DataFrame({"country": values}), index)["countrycode"].to_list()
+
+
+def test_normalize():
+    names = pl.Series(["U.S.A.", " Österreich ", "Côte d'Ivoire", "Bosnia-Herzegovina"])
+    assert pl.select(normalize_expr(pl.lit(names))).to_series().to_list() == [
+        "usa", "osterreich", "cote divoire", "bosnia herzegovina"
+    ]  # fmt: skip
+
+
+def test_country_codes(country_index):
+    values = ["Spojené státy", "Österreich", "U.S.A.", "Deutschland", "gb", "DEU", "UK",
+              "Korea, Republic of", "Republic of Korea", "Bolivia", "Italien", "ZZ", "Atlantis",
+              "", None]  # fmt: skip
+    assert codes(values, country_index) == ["us", "at", "us", "de", "gb", "de", "gb",
+                                            "kr", "kr", "bo", "it", None, None,
+                                            None, None]  # fmt: skip
+    assert codes([None, None], country_index) == [None, None]
+
+
+def test_osm_variants(tmp_path):
+    source = tmp_path / "full.parquet"
+    pl.DataFrame(
+        {
+            "target:country": ["België / Belgique / Belgien", "Κύπρος - Kıbrıs"],
+            "target:country_code": ["BE", "cy"],
+        }
+    ).write_parquet(source)
+    variants = osm_name_variants(source)
+    assert sorted(variants.rows()) == [("Belgien", "be"), ("Belgique", "be"), ("België", "be"),
+                                       ("Kıbrıs", "cy"), ("Κύπρος", "cy")]  # fmt: skip
+    index = build_country_index(variants)
+    assert codes(["BELGIE", "kibris"], index) == ["be", "cy"]
+    # a name of two countries is dropped rather than guessed
+    conflicting = pl.DataFrame({"name": ["Belgique"], "code": ["fr"]})
+    assert codes(["Belgique"], build_country_index(pl.concat([variants, conflicting]))) == [None]
+
+
+@pytest.mark.dev
+def test_country_code_benchmark(country_index):
+    values = pl.read_csv(VALUES_24K, infer_schema=False)["country"]
+    df = pl.DataFrame({"country": values.sample(5_000_000, with_replacement=True, seed=0)})
+    start = time.perf_counter()
+    out = add_country_codes(df, country_index)
+    elapsed = time.perf_counter() - start
+    print(
+        f"\n{df.height / elapsed / 1e6:.1f}M rows/s,"
+        f" {out['countrycode'].is_not_null().mean():.1%} with a country code"
+    )
@@ -0,0 +1,83 @@
+import time
+
+import polars as pl
+import pytest
+
+from postalcrawl.pack.dedup import (
+    NearDuplicateClusterer,
+    assign_clusters,
+    keep_representatives,
+    normalize_expr,
+)
+from postalcrawl.pack.main import COLUMNS, TARGET_COLUMNS, dataset_rows
+from postalcrawl.stats import StatCounter
+from tests.test_publish import packed_lazyframe
+
+ROWS = pl.DataFrame(
+    {
+        "name": ["Joe's Pizza", "JOES PIZZA", "Joe's Pizza", "Other Place", None, None],
+        "street": ["Main St.", "Main Street", "Main St", "Main St", "Elm Rd", "Elm Road"],
+        "house": ["1", "1", "2", "1", "5", "5"],
+        "city": ["Springfield", "springfield", "Springfield", "Springfield", "Shelbyville", None],
+        "postalcode": ["12345", "12345", "12345", "12345", "54321", "54321"],
+    }
+)
+
+
+def test_assign_clusters():
+    out = assign_clusters([ROWS[:3], ROWS[3:]])
+    # casing, punctuation and abbreviations match; house numbers and nulls must be equal
+    assert out["cluster_id"].to_list() == [0, 0, 2, 3, 4, 5]
+
+
+def test_column_thresholds():
+    typo = pl.DataFrame(
+        {"name": ["Joe's Pizza Downtown", "Joes Pizza Dowtown"], "city": ["A", "A"]}
+    )
+    lenient = NearDuplicateClusterer({"name": 0.6, "city": 1.0})
+    strict = NearDuplicateClusterer({"name": 0.9, "city": 1.0})
+    assert assign_clusters([typo], lenient)["cluster_id"].to_list() == [0, 0]
+    assert assign_clusters([typo], strict)["cluster_id"].to_list() == [0, 1]
+
+
+def test_keep_representatives():
+    stats = StatCounter()
+    kept = keep_representatives(ROWS.lazy(), batch_size=2, stats=stats).collect()
+    assert kept.equals(ROWS[[0, 2, 3, 4, 5]])
+    assert stats["dedup/duplicate"] == 1 and stats["dedup/cluster"] == 5
+
+
+def test_abbreviations_only_in_streets():
+    df = pl.DataFrame({"name": ["Dr. Miller"], "street": ["Miller Dr."], "city": ["St. Louis"]})
+    normalized = df.select(normalize_expr(c) for c in df.columns)
+    assert normalized.row(0) == ("dr miller", "miller drive", "st louis")
+
+
+def test_dataset_rows_reproducible(tmp_path):
+    """the same representatives on every run, though unique() is parallel and unordered"""
+    sections = []
+    for s in range(2):
+        values = [f"Shop {(s * 1000 + i) % 3000}" for i in range(12_000)]
+        df = pl.DataFrame({col: values for col in [*COLUMNS, *TARGET_COLUMNS]})
+        sections.append(tmp_path / f"{s}.parquet")
+        df.write_parquet(sections[-1])
+    runs = [dataset_rows(sections, drop_near_duplicates=True).collect() for _ in range(3)]
+    assert all(run.equals(runs[0]) for run in runs)
+    assert runs[0]["name"][:2].to_list() == ["Shop 0", "Shop 1"]
+
+
+@pytest.mark.dev
+def test_benchmark_dedup():
+    lf = packed_lazyframe()
+    n_total = lf.select(pl.len()).collect().item()
+    for n in [n_total // 8, n_total // 4, n_total // 2, n_total]:
+        stats = StatCounter()
+        start = time.perf_counter()
+        out = assign_clusters(
+            lf.head(n).collect().iter_slices(5000), NearDuplicateClusterer(stats=stats)
+        )
+        elapsed = time.perf_counter() - start
+        print(
+            f"{n} rows: {elapsed:.2f}s, {out['cluster_id'].n_unique()} clusters, "
+            f"{stats['dedup/comparison']} comparisons vs {n * (n - 1) // 2} pairs"
+        )
@@ -0,0 +1,115 @@
+import random
+
+from postalcrawl.extract.estimate import (
+    SegmentSample,
+    estimate_yield,
+    extrapolate,
+    probe_windows,
+    t_quantile,
+    window_records,
+)
+from postalcrawl.stats import StatCounter
+from tests.conftest import address_page, warc_record_offsets, write_warc
+
+
+def test_window_records_at_arbitrary_offsets(synthetic_warc):
+    data = synthetic_warc.read_bytes()
+    offsets = warc_record_offsets(synthetic_warc)
+    rng = random.Random(0)
+    for _ in range(20):
+        start = rng.randrange(len(data) // 2)
+        stats = StatCounter()
+        records, covered = window_records(data[start : start + len(data) // 3], stats)
+        # exactly the records that start and end inside the window
+        inside = [
+            length
+            for _, _, offset, length in offsets
+            if offset >= start and offset + length <= start + len(data) // 3
+        ]
+        assert covered == sum(inside)
+        assert records.count(b"WARC/1.") >= len(inside)
+
+
+def test_extrapolate_without_sampling_error():
+    stats = StatCounter()
+    stats.inc("warc/record", 10)
+    samples = [SegmentSample(f"s{i}", 100, 60, 50, 1.0, 1.0, stats) for i in range(3)]
+    # all segments sampled: no finite population left to extrapolate to
+    estimate = extrapolate(samples, n_segments=3)["warc/record"]
+    assert estimate.total == estimate.low == estimate.high == 60
+
+    samples[2] = SegmentSample("s", 100, 100, 100, 1.0, 1.0, stats)
+    estimate = extrapolate(samples, n_segments=30)["warc/record"]
+    assert estimate.low < round(estimate.total) == 500 < estimate.high
+
+
+def test_t_quantile():
+    assert abs(t_quantile(0.975, 4) - 2.776) < 0.01
+    assert abs(t_quantile(0.975, 30) - 2.042) < 0.001
+
+
+def test_estimate_yield(tmp_path, range_server):
+    paths = []
+    for segment in range(6):
+        pages = [
+            (f"https://shop{segment}-{i}.example.com/", "text/html", address_page(f"S{i}", "X 1"))
+            if i % (segment + 2) == 0
+            else (f"https://blog{segment}-{i}.example.com/", "text/html", "<html>nothing</html>")
+            for i in range(40)
+        ]
+        write_warc(tmp_path / f"segment-{segment}.warc.gz", pages)
+        paths.append(f"segment-{segment}.warc.gz")
+    expected = sum(len(range(0, 40, segment + 2)) for segment in range(6))
+
+    estimates = estimate_yield(paths, n_segments=6, base_url=range_server, n_workers=2)
+    addresses = estimates["extract/address"]
+    assert round(addresses.total) == round(addresses.low) == round(addresses.high) == expected
+    assert round(estimates["warc/html_response"].total) == 6 * 40
+    assert estimates["time/wall_s"].total == estimates["time/segment_s"].total / 2
+
+    estimates = estimate_yield(paths, n_segments=3, base_url=range_server, seed=1)
+    addresses = estimates["extract/address"]
+    assert addresses.low <= expected <= addresses.high
+    assert addresses.high > addresses.low
+
+
+def test_probe_windows(tmp_path, range_server):
+    pages = [
+        (f"https://a{i}.example.com/", "text/html", address_page(f"A {i}", "X 1"))
+        for i in range(400)
+    ]
+    for name in ["a.warc.gz", "b.warc.gz"]:
+        size = write_warc(tmp_path / name, pages).stat().st_size
+    estimates = estimate_yield(
+        ["a.warc.gz", "b.warc.gz"],
+        n_segments=2,
+        n_probes=4,
+        probe_bytes=size // 10,
+        base_url=range_server,
+    )
+    # uniform records: extrapolating from 4 windows of 1/10 of each file is close to exact
+    assert abs(estimates["extract/address"].total - 800) < 80
+
+
+def test_small_segment_is_read_whole(tmp_path, range_server):
+    mib = 1024 * 1024
+    rng = random.Random(0)
+    assert probe_windows(10 * mib, 8, 2 * mib, rng) == [(0, 10 * mib)]
+    windows = probe_windows(100 * mib, 8, 2 * mib, rng)
+    assert len(windows) == 8 and all(n == 2 * mib for _, n in windows)
+
+    pages = [
+        (f"https://a{i}.example.com/", "text/html", address_page(f"A {i}", "X 1"))
+        for i in range(400)
+    ]
+    for name in ["a.warc.gz", "b.warc.gz"]:
+        size = write_warc(tmp_path / name, pages).stat().st_size
+    # 4 strata are smaller than a probe, a probe from the start would cover a third
+    estimates = estimate_yield(
+        ["a.warc.gz", "b.warc.gz"],
+        n_segments=2,
+        n_probes=4,
+        probe_bytes=size // 3,
+        base_url=range_server,
+    )
+    assert round(estimates["extract/address"].total) == 800
@@ -0,0 +1,90 @@
+import json
+import sys
+import types
+
+import polars as pl
+
+from postalcrawl.evaluate.errors import classify_errors, error_breakdown
+from postalcrawl.evaluate.metrics import apply_cells, evaluate_repair, read_cells, scan_table
+
+DIRTY = pl.DataFrame({"road": ["Main St", "Elm", None, "Oak Rd"], "city": ["X", "y", "Z", None]})
+TRUTH = pl.DataFrame(
+    {"road": ["Main Street", "Elm", "Pine", "Oak Rd"], "city": ["X", "Y", "Z", "W"]}
+)
+
+
+def test_apply_cells_and_scores(tmp_path):
+    cells = [
+        {"row": 0, "col": 0, "value": "Main Street"},  # correct repair of an error
+        {"row": 1, "col": 0, "value": "Elm St"},  # breaks a correct cell
+        {"row": 2, "col": 0, "value": "Pine"},  # fills a missing value
+        {"row": 1, "col": 1, "value": "Y"},
+    ]
+    (tmp_path / "cells.json").write_text(json.dumps(cells))
+    repair = apply_cells(DIRTY.lazy(), read_cells(tmp_path / "cells.json")).collect()
+    assert repair["road"].to_list() == ["Main Street", "Elm St", "Pine", "Oak Rd"]
+    assert repair["city"].to_list() == ["X", "Y", "Z", None]
+
+    scores = evaluate_repair(DIRTY.lazy(), TRUTH.lazy(), repair.lazy())
+    total = scores.filter(pl.col("column") == "total").row(0, named=True)
+    assert (total["changed"], total["correct"], total["changed_errors"]) == (4, 3, 2)
+    assert total["precision"] == 0.75
+    assert total["recall"] == 1.0  # missing values are not counted as errors for recall
+    assert (total["errors_before"], total["errors_after"]) == (4, 2)
+    assert total["edr"] == 0.5
+
+
+def test_lower_case():
+    repair = DIRTY.with_columns(pl.col("city").str.to_lowercase())
+    scores = evaluate_repair(DIRTY.lazy(), TRUTH.lazy(), repair.lazy(), lower_case=True)
+    assert scores.filter(pl.col("column") == "city")["changed"].item() == 0
+
+
+def test_classify_errors():
+    values = pl.DataFrame(
+        {"v": ["Main", None, "MAIN", "Ma-in", "Mian", "Main Street West", "Foo", "--", "A"]}
+    )
+    truth = pl.DataFrame(
+        {"v": ["Main", "x", "main", "main", "Main", "Main Street", "Bar", "1 2", None]}
+    )
+    errors = classify_errors(values, truth, synonyms=False)
+    assert errors["v"].cast(pl.String).to_list() == [
+        "match",
+        "missing",
+        "capitalization",
+        "special chars",
+        "typo",
+        "token subset",
+        "unknown",
+        "token subset",
+        "unknown",
+    ]
+
+
+def test_error_breakdown_batches(tmp_path):
+    DIRTY.write_csv(tmp_path / "values.csv")
+    TRUTH.write_csv(tmp_path / "targets.csv")
+    dirty, truth = scan_table(tmp_path / "values.csv"), scan_table(tmp_path / "targets.csv")
+    full = error_breakdown(dirty, truth, synonyms=False)
+    batched = error_breakdown(dirty, truth, synonyms=False, batch_size=1)
+    assert full.equals(batched)
+    assert full["count"].sum() == DIRTY.height * DIRTY.width
+    road = dict(full.filter(pl.col("column") == "road").select("error_class", "count").iter_rows())
+    assert road == {"match": 2, "missing": 1, "unknown": 1}  # "St" only with synonyms
+
+
+def test_classify_synonyms(monkeypatch):
+    # a stand-in for the libpostal expansions of street types
+    expansions = {"st": "street", "ave": "avenue"}
+
+    def expand_address(value: str) -> list[str]:
+        return [" ".join(expansions.get(token, token) for token in value.split())]
+
+    postal_expand = types.ModuleType("postal.expand")
+    postal_expand.expand_address = expand_address  # pyright: ignore [reportAttributeAccessIssue]
+    monkeypatch.setitem(sys.modules, "postal", types.ModuleType("postal"))
+    monkeypatch.setitem(sys.modules, "postal.expand", postal_expand)
+    values = pl.DataFrame({"v": ["Main St", "Elm Ave", "Mian", "Oak Ave"]})
+    truth = pl.DataFrame({"v": ["Main Street", "Elm Avenue", "Main", "Pine Street"]})
+    errors = classify_errors(values, truth)
+    assert errors["v"].cast(pl.String).to_list() == ["synonym", "synonym", "typo", "unknown"]
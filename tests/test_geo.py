@@ -0,0 +1,159 @@
+import itertools
+import math
+import random
+
+import polars as pl
+import pytest
+
+from postalcrawl.pack.geo import (
+    CELL_COLUMN,
+    LAT_COLUMN,
+    LON_COLUMN,
+    REGION_COLUMN,
+    GeoIndex,
+    cover_ranges,
+    encode_cell,
+    geohash,
+    haversine_expr,
+    with_geo_cells,
+)
+from postalcrawl.pack.main import COLUMNS, TARGET_COLUMNS, generate_address_rows
+from postalcrawl.pack.publish import PARTITION_COLUMN, publish_dataset, scan_dataset
+from tests.test_projection import validated_record
+
+COUNTRIES = {
+    "de": (47.3, 5.9, 55.0, 15.0),
+    "fr": (42.3, -4.8, 51.1, 8.2),
+    "us": (25.0, -124.0, 49.0, -67.0),
+}
+
+
+def synthetic_addresses(n: int, seed: int = 0) -> pl.LazyFrame:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        code = rng.choice(list(COUNTRIES))
+        min_lat, min_lon, max_lat, max_lon = COUNTRIES[code]
+        row: dict[str, str | float | None] = {
+            col: f"{col} {i}" for col in [*COLUMNS, *TARGET_COLUMNS]
+        }
+        row[PARTITION_COLUMN] = code
+        located = i % 10 != 0  # offline geocoder results without coordinates
+        row[LAT_COLUMN] = rng.uniform(min_lat, max_lat) if located else None
+        row[LON_COLUMN] = rng.uniform(min_lon, max_lon) if located else None
+        rows.append(row)
+    return pl.LazyFrame(rows)
+
+
+@pytest.fixture(scope="module")
+def geo_dataset(tmp_path_factory) -> tuple:
+    out_dir = tmp_path_factory.mktemp("geo")
+    lf = with_geo_cells(synthetic_addresses(5000))
+    publish_dataset(
+        lf,
+        out_dir,
+        COLUMNS,
+        TARGET_COLUMNS,
+        row_group_size=500,
+        partition_by=[PARTITION_COLUMN, REGION_COLUMN],
+        sort_by=CELL_COLUMN,
+    )
+    return out_dir, lf.collect()
+
+
+def ids(df: pl.DataFrame) -> list[str]:
+    return sorted(df["name"].to_list())
+
+
+def test_cells():
+    assert geohash(encode_cell(52.5170365, 13.3888599)) == "u3"  # Berlin
+    assert geohash(encode_cell(-33.8688, 151.2093)) == "r3"  # Sydney
+    points = pl.DataFrame(
+        {LAT_COLUMN: [52.5, -33.8, 0.0, 90.0, None], LON_COLUMN: [13.4, 151.2, 0.0, 180.0, None]}
+    )
+    cells = with_geo_cells(points.lazy()).collect()
+    expected = [encode_cell(lat, lon) for lat, lon in points.rows()[:-1]]
+    assert cells[CELL_COLUMN].to_list() == [*expected, None]
+    assert cells[REGION_COLUMN].to_list() == [*(geohash(c) for c in expected), None]
+
+
+def test_cover_ranges():
+    box = (48.0, 2.0, 49.0, 3.0)
+    ranges = cover_ranges(box, max_ranges=16)
+    assert ranges == sorted(ranges)
+    assert all(high < low for (_, high), (low, _) in itertools.pairwise(ranges))
+    rng = random.Random(1)
+    for _ in range(1000):
+        cell = encode_cell(rng.uniform(48.0, 49.0), rng.uniform(2.0, 3.0))
+        assert any(low <= cell <= high for low, high in ranges)
+
+
+def test_published_partitions(geo_dataset):
+    out_dir, df = geo_dataset
+    assert (out_dir / "dataset" / "target_countrycode=de" / "geo_region=u1").is_dir()
+    scanned = scan_dataset(out_dir).collect()
+    assert scanned.height == df.height
+    assert scanned[LAT_COLUMN].null_count() == df[LAT_COLUMN].null_count()
+    for file in (out_dir / "dataset").rglob("*.parquet"):
+        assert pl.read_parquet(file, columns=[CELL_COLUMN])[CELL_COLUMN].is_sorted()
+
+
+@pytest.mark.parametrize(
+    "box",
+    [
+        (48.0, 2.0, 49.5, 3.5),
+        (50.0, 5.0, 53.0, 10.0),
+        (30.0, -100.0, 45.0, -80.0),
+        (0.0, 0.0, 1.0, 1.0),
+    ],
+)
+def test_bbox(geo_dataset, box):
+    out_dir, df = geo_dataset
+    min_lat, min_lon, max_lat, max_lon = box
+    expected = df.filter(
+        pl.col(LAT_COLUMN).is_between(min_lat, max_lat),
+        pl.col(LON_COLUMN).is_between(min_lon, max_lon),
+    )
+    index = GeoIndex(out_dir)
+    result = index.bbox(*box)
+    assert ids(result) == ids(expected)
+    assert set(result.columns) == set(df.columns)
+    # only the files of the regions around the box are opened
+    assert len(index.cells) < len(list((out_dir / "dataset").rglob("*.parquet")))
+
+
+def test_bbox_country(geo_dataset):
+    out_dir, df = geo_dataset
+    box = (45.0, 4.0, 52.0, 10.0)  # the french-german border
+    result = GeoIndex(out_dir).bbox(*box, countrycode="fr")
+    expected = df.filter(
+        pl.col(PARTITION_COLUMN) == "fr",
+        pl.col(LAT_COLUMN).is_between(45.0, 52.0),
+        pl.col(LON_COLUMN).is_between(4.0, 10.0),
+    )
+    assert expected.height > 0
+    assert ids(result) == ids(expected)
+
+
+def test_radius(geo_dataset):
+    out_dir, df = geo_dataset
+    lat, lon, radius_m = 50.0, 8.0, 100_000
+    result = GeoIndex(out_dir).radius(lat, lon, radius_m)
+    expected = df.drop_nulls(LAT_COLUMN).filter(haversine_expr(lat, lon) <= radius_m)
+    assert expected.height > 0
+    assert ids(result) == ids(expected)
+    assert result["distance_m"].is_sorted()
+    # one degree of latitude is about 111 km
+    north = GeoIndex(out_dir).radius(lat, lon, 0.5 * 111_195)
+    assert all(abs(r - lat) <= 0.5 + 1e-6 for r in north[LAT_COLUMN])
+    one_degree = pl.DataFrame({LAT_COLUMN: [lat + 1.0], LON_COLUMN: [lon]})
+    assert math.isclose(one_degree.select(haversine_expr(lat, lon)).item(), 111_195, rel_tol=1e-3)
+
+
+def test_address_rows_coordinates():
+    record = validated_record(1)
+    rows = list(generate_address_rows([record]))
+    assert (rows[0][LAT_COLUMN], rows[0][LON_COLUMN]) == (52.5170365, 13.3888599)
+    offline = {**record, "osm": {k: v for k, v in record["osm"].items() if k != "geometry"}}
+    rows = list(generate_address_rows([offline]))
+    assert (rows[0][LAT_COLUMN], rows[0][LON_COLUMN]) == (None, None)
@@ -0,0 +1,43 @@
+from postalcrawl.extract.extract import extract_pipeline
+from postalcrawl.extract.host_skip import (
+    BloomFilter,
+    HostSkipList,
+    HostYieldTable,
+    build_host_skip_list,
+)
+from postalcrawl.extract.warc_loaders import offline_record_generator
+from postalcrawl.stats import StatCounter
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(1000, fp_rate=0.01)
+    hosts = [f"host{i}.example.com" for i in range(1000)]
+    for host in hosts:
+        bloom.add(host)
+    assert all(host in bloom for host in hosts)
+    false_positives = sum(f"other{i}.example.org" in bloom for i in range(10_000))
+    assert false_positives < 300
+
+
+def test_skip_list_from_yield_table(tmp_path, synthetic_warc):
+    table = HostYieldTable()
+    for _ in range(3):  # three previous crawls of the same hosts
+        stats = StatCounter()
+        gen = offline_record_generator(synthetic_warc, stats)
+        data = list(extract_pipeline(gen, stats, track_hosts=True))
+        table.update_from_segment(data, stats)
+        assert not stats.filter("host/")
+    assert table["shop0.example.com"] == [3, 3]
+    assert table["blog2.example.com"] == [3, 0]
+
+    skip_list, estimate = build_host_skip_list(table, recall=0.5, min_responses=3, sample_rate=0)
+    assert estimate.skipped_hosts > 0
+    assert estimate.lost_addresses <= 0.5 * estimate.total_addresses
+    skip_list.save(tmp_path / "skip.bin")
+    skip_list = HostSkipList.load(tmp_path / "skip.bin")
+
+    stats = StatCounter()
+    gen = offline_record_generator(synthetic_warc, stats)
+    data = list(extract_pipeline(gen, stats, skip_list=skip_list))
+    assert len(data) == 5  # no address hosts are skipped
+    assert stats["host_skip/skipped"] == estimate.skipped_hosts
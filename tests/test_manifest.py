@@ -0,0 +1,62 @@
+import functools
+import time
+
+from postalcrawl.manifest import StageManifest
+from postalcrawl.pack import main as pack_main
+from postalcrawl.postal_service import PostalParserPool
+from postalcrawl.utils import write_to_jsongz
+from tests.test_postal_service import FAKE_PARSER
+
+
+def validated_record(name: str) -> dict:
+    geocoding = {"name": name, "street": "Main Street", "housenumber": "1", "city": "Berlin",
+                 "postcode": "10115", "country": "Germany", "country_code": "de",
+                 "state": "Berlin"}  # fmt: skip
+    query = {"name": name, "street": "1 Main Street", "city": "Berlin", "postalcode": "10115",
+             "country": "DE", "state": None}  # fmt: skip
+    return {"osm": {"properties": {"geocoding": geocoding}}, "address_query": query}
+
+
+def test_manifest_freshness(tmp_path):
+    inp, out = tmp_path / "in.json", tmp_path / "out.json"
+    inp.write_text("a")
+    out.write_text("b")
+    manifest = StageManifest(out)
+    assert not manifest.is_fresh("v1", [inp, "remote-id"], [out])
+    manifest.commit("v1", [inp, "remote-id"], [out])
+
+    assert StageManifest(out).is_fresh("v1", [inp, "remote-id"], [out])
+    assert not StageManifest(out).is_fresh("v2", [inp, "remote-id"], [out])
+    assert not StageManifest(out).is_fresh("v1", [inp, "other-id"], [out])
+    inp.write_text("a")  # touched, same content
+    assert StageManifest(out).is_fresh("v1", [inp, "remote-id"], [out])
+    inp.write_text("changed")
+    assert not StageManifest(out).is_fresh("v1", [inp, "remote-id"], [out])
+
+
+def test_pack_rebuilds_only_changed_sections(tmp_path, monkeypatch):
+    validated, dataset = tmp_path / "validated", tmp_path / "dataset"
+    dataset.mkdir()
+    for section in ("a", "b"):
+        (validated / section).mkdir(parents=True)
+        write_to_jsongz(
+            [validated_record(f"Shop {section}")], validated / section / "00000.json.gz"
+        )
+    monkeypatch.setattr(pack_main, "VALIDATED_ROOT", validated)
+    monkeypatch.setattr(pack_main, "DATASET_DIR", dataset)
+    fake_pool = functools.partial(PostalParserPool, parser=FAKE_PARSER)
+    monkeypatch.setattr(pack_main, "PostalParserPool", fake_pool)
+
+    pack_main.main(n_parser_workers=1)
+    assert len(pack_main.stale_sections(pack_main.pack_version())) == 0
+    built_at = (dataset / "values.csv").stat().st_mtime_ns
+
+    start = time.perf_counter()
+    pack_main.main(n_parser_workers=1)
+    assert time.perf_counter() - start < 1
+    assert (dataset / "values.csv").stat().st_mtime_ns == built_at
+
+    write_to_jsongz([validated_record("Shop c")], validated / "b" / "00001.json.gz")
+    assert pack_main.stale_sections(pack_main.pack_version()) == [validated / "b"]
+    pack_main.main(n_parser_workers=1)
+    assert (dataset / "values.csv").read_text().count("Shop") == 3
@@ -0,0 +1,122 @@
+import json
+import time
+
+import pytest
+
+from postalcrawl.extract.extract import extract_pipeline, load_json
+from postalcrawl.extract.memo import ParseMemo
+from postalcrawl.extract.structured_data import ALL_SYNTAXES, DEFAULT_SYNTAXES
+from postalcrawl.extract.warc_loaders import offline_record_generator
+from postalcrawl.stats import StatCounter
+from tests.conftest import address_page, write_warc
+
+FOOTER = address_page("Template Store GmbH", "Hauptstr. 1")
+
+
+def template_page(i: int) -> str:
+    """a page specific address and the footer every page of the site repeats"""
+    return address_page(f"Shop {i}", f"Weg {i}").replace("</head>", FOOTER.split("<head>")[1])
+
+
+@pytest.fixture
+def template_warc(tmp_path):
+    pages = [(f"https://shop.example.com/{i}", "text/html", template_page(i)) for i in range(30)]
+    broken = '<script type="application/ld+json">{"@type": "PostalAddress",</script>'
+    pages += [(f"https://broken.example.com/{i}", "text/html", broken) for i in range(3)]
+    return write_warc(tmp_path / "template-00000.warc.gz", pages)
+
+
+def run_pipeline(warc_path, memo=None, **kwargs) -> tuple[list, dict]:
+    stats = StatCounter()
+    gen = offline_record_generator(warc_path, stats)
+    records = list(extract_pipeline(gen, stats, memo=memo, **kwargs))
+    return records, {k: v for k, v in stats.items() if not k.startswith("memo/")}
+
+
+def test_memo_lru():
+    memo, stats = ParseMemo(maxsize=2), StatCounter()
+    calls = []
+
+    def parse(text: str) -> dict:
+        calls.append(text)
+        return json.loads(text)
+
+    first = memo.lookup('{"a": 1}', parse, stats)
+    assert memo.lookup('{"a": 1}', parse, stats) is first
+    memo.lookup('{"b": 2}', parse, stats)
+    memo.lookup('{"a": 1}', parse, stats)  # most recently used
+    memo.lookup('{"c": 3}', parse, stats)  # evicts b
+    memo.lookup('{"b": 2}', parse, stats)
+    assert calls == ['{"a": 1}', '{"b": 2}', '{"c": 3}', '{"b": 2}']
+    assert (stats["memo/hit"], stats["memo/miss"], stats["memo/eviction"]) == (2, 4, 2)
+    assert stats["memo/saved_us"] >= 0
+    assert len(memo) == 2
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{}, {"n_threads": 3}, {"syntaxes": ALL_SYNTAXES}],
+    ids=["serial", "threaded", "all-syntaxes"],
+)
+def test_memo_keeps_outputs(template_warc, kwargs):
+    expected, expected_stats = run_pipeline(template_warc, **kwargs)
+    memo = ParseMemo()
+    records, stats = run_pipeline(template_warc, memo, **kwargs)
+    assert records == expected
+    assert stats == expected_stats
+    assert expected_stats["error/json/decode_error"] == 3
+    # 30 page specific scripts, the footer and the broken script are parsed once
+    assert len(memo) == 32
+
+    # persisted across segments: the second segment is all hits
+    memo_stats = StatCounter()
+    warc_gen = offline_record_generator(template_warc, StatCounter())
+    assert list(extract_pipeline(warc_gen, memo_stats, memo=memo, **kwargs)) == expected
+    assert memo_stats["memo/miss"] == 0 and memo_stats["memo/hit"] == 63
+
+
+def test_load_json_errors():
+    assert load_json('{"a": [1]}') == {"a": [1]}
+    assert isinstance(load_json("{"), json.JSONDecodeError)
+
+
+@pytest.mark.dev
+def test_benchmark_memo(tmp_path):
+    """pages of a site that repeats a large ld+json block, with and without the memo"""
+    catalog = {
+        "@context": "https://schema.org",
+        "@type": "Organization",
+        "name": "Template Store GmbH",
+        "address": {"@type": "PostalAddress", "streetAddress": "Hauptstr. 1"},
+        "department": [
+            {
+                "@type": "Store",
+                "name": f"Filiale {k}",
+                "address": {"@type": "PostalAddress", "streetAddress": f"Weg {k}"},
+            }
+            for k in range(200)
+        ],
+    }
+    footer = f'<script type="application/ld+json">{json.dumps(catalog)}</script>'
+    pages = [
+        (
+            f"https://shop.example.com/{i}",
+            "text/html",
+            template_page(i).replace("</head>", footer + "</head>"),
+        )
+        for i in range(2000)
+    ]
+    warc_path = write_warc(tmp_path / "bench.warc.gz", pages)
+    results = {}
+    for name, memo in [("no memo", None), ("memo", ParseMemo())]:
+        stats = StatCounter()
+        start = time.perf_counter()
+        gen = offline_record_generator(warc_path, stats)
+        records = list(extract_pipeline(gen, stats, syntaxes=DEFAULT_SYNTAXES, memo=memo))
+        results[name] = time.perf_counter() - start
+        assert len(records) == 3 * len(pages)
+        print(
+            f"{name}: {results[name]:.2f}s, {stats['memo/hit']} hits,"
+            f" {stats['memo/saved_us'] / 1e6:.2f}s parsing saved"
+        )
+    print(json.dumps(results))
@@ -0,0 +1,92 @@
+import json
+
+import requests
+
+from postalcrawl.metrics import MetricsAggregator, MetricsPusher
+from postalcrawl.stats import StatCounter, snapshot_delta
+from postalcrawl.utils import write_to_jsongz
+from postalcrawl.validate import main as validate_main
+from postalcrawl.validate.osm_validator import Transport
+from tests.test_projection import FEATURE, crawl_record
+
+
+def test_snapshot_delta_merge():
+    stats = StatCounter()
+    stats.inc("warc/record", 3)
+    stats.observe("nominatim/latency_s", 0.02)
+    first = stats.snapshot()
+    stats.inc("warc/record", 2)
+    stats.inc("host/response/example.com")
+    stats.set("nominatim/in_flight", 7)
+    stats.observe("nominatim/latency_s", 3.0)
+    second = stats.snapshot(exclude_prefixes=("host/",))
+    delta = snapshot_delta(second, first)
+    assert delta["counters"] == {"warc/record": 2}
+    assert delta["gauges"] == {"nominatim/in_flight": 7}
+    assert delta["histograms"]["nominatim/latency_s"]["sum"] == 3.0
+
+    merged = StatCounter()
+    merged.merge(first)
+    merged.merge(json.loads(json.dumps(delta)))
+    assert merged["warc/record"] == 5
+    assert merged.histograms["nominatim/latency_s"].count == 2
+    assert merged.histograms["nominatim/latency_s"].quantile(0.5) == 0.025
+    assert json.loads(json.dumps(stats))["warc/record"] == 5  # stats files keep counters only
+
+
+def test_aggregator_endpoint():
+    aggregator = MetricsAggregator()
+    server = aggregator.serve(host="127.0.0.1", port=0)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        workers = [StatCounter(), StatCounter()]
+        pushers = [MetricsPusher(s, url, worker=f"w{i}") for i, s in enumerate(workers)]
+        for i, stats in enumerate(workers):
+            with pushers[i]:
+                stats.inc("warc/record", 10 * (i + 1))
+                stats.set("nominatim/in_flight", i)
+                stats.observe("nominatim/latency_s", 0.2)
+        workers[0].inc("warc/record", 5)
+        pushers[0].push()  # only the delta is pushed
+
+        text = requests.get(url + "/metrics").text
+        assert "postalcrawl_warc_record_total 35" in text
+        assert 'postalcrawl_nominatim_in_flight{worker="w1"} 1' in text
+        assert 'postalcrawl_nominatim_latency_s_bucket{le="0.25"} 2' in text
+        assert "postalcrawl_nominatim_latency_s_count 2" in text
+        dashboard = requests.get(url).text
+        assert "warc/record" in dashboard and "w0" in dashboard and "w1" in dashboard
+    finally:
+        server.shutdown()
+
+
+def test_failed_push_is_retried():
+    stats = StatCounter()
+    pusher = MetricsPusher(stats, "http://127.0.0.1:9", worker="w")
+    stats.inc("warc/record", 4)
+    assert not pusher.push()
+
+    aggregator = MetricsAggregator()
+    server = aggregator.serve(host="127.0.0.1", port=0)
+    try:
+        pusher.url = f"http://127.0.0.1:{server.server_address[1]}/push"
+        assert pusher.push()
+        assert aggregator.totals()["warc/record"] == 4
+    finally:
+        server.shutdown()
+
+
+async def test_validate_pushes_metrics(tmp_path, monkeypatch, nominatim_stub, metrics_aggregator):
+    monkeypatch.setattr(validate_main, "EXTRACT_ROOT", tmp_path / "extracted")
+    monkeypatch.setattr(validate_main, "VALIDATE_ROOT", tmp_path / "validated")
+    monkeypatch.setattr(validate_main, "NOMINATIM_URL", nominatim_stub.url)
+    nominatim_stub.respond = lambda path: {"type": "FeatureCollection", "features": [FEATURE]}
+    extract_file = tmp_path / "extracted" / "segment" / "00000.json.gz"
+    extract_file.parent.mkdir(parents=True)
+    write_to_jsongz([crawl_record(i) for i in range(3)], extract_file)
+
+    aggregator, url = metrics_aggregator
+    await validate_main.main(
+        use_offline_index=False, metrics_url=url, transport=Transport(retries=0)
+    )
+    assert aggregator.totals()["nominatim/request"] == 3
@@ -0,0 +1,87 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from postalcrawl.stats import StatCounter
+from postalcrawl.utils import read_from_jsongz, write_to_jsongz
+from postalcrawl.validate import main as validate_main
+from postalcrawl.validate.multicore import (
+    SharedBudget,
+    WorkerResult,
+    cpu_report,
+    validate_multicore,
+)
+from postalcrawl.validate.osm_validator import Transport
+from tests.test_projection import FEATURE, crawl_record
+
+
+async def test_shared_budget():
+    semaphore = multiprocessing.get_context("forkserver").BoundedSemaphore(2)
+    budget, in_flight, seen = SharedBudget(semaphore), 0, []
+
+    async def task():
+        nonlocal in_flight
+        async with budget:
+            in_flight += 1
+            seen.append(in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    await asyncio.gather(*(task() for _ in range(10)))
+    budget.close()
+    assert len(seen) == 10 and max(seen) == 2
+    # all permits are back
+    assert semaphore.acquire(block=False) and semaphore.acquire(block=False)
+
+
+def test_validate_multicore(tmp_path, monkeypatch, nominatim_stub, metrics_aggregator):
+    monkeypatch.setattr(validate_main, "EXTRACT_ROOT", tmp_path / "extracted")
+    monkeypatch.setattr(validate_main, "VALIDATE_ROOT", tmp_path / "validated")
+    monkeypatch.setattr(validate_main, "NOMINATIM_URL", nominatim_stub.url)
+    nominatim_stub.delay = 0.02
+    nominatim_stub.respond = lambda path: {"type": "FeatureCollection", "features": [FEATURE]}
+    extract_files = []
+    for i in range(5):
+        extract_file = tmp_path / "extracted" / "segment" / f"{i:05d}.json.gz"
+        extract_file.parent.mkdir(parents=True, exist_ok=True)
+        write_to_jsongz([crawl_record(i * 10 + k) for k in range(10)], extract_file)
+        extract_files.append(extract_file)
+
+    aggregator, url = metrics_aggregator
+    report = validate_multicore(
+        extract_files,
+        2,
+        budget=3,
+        use_offline_index=False,
+        metrics_url=url,
+        transport=Transport(retries=0),
+    )
+    assert report["workers"] == 2 and report["files"] == 5
+    assert report["requests"] == len(nominatim_stub.requests) == 50
+    assert nominatim_stub.max_in_flight <= 3
+    assert 0 < report["mean_in_flight"] <= 3
+    assert aggregator.totals()["nominatim/request"] == 50
+    assert len(aggregator.workers) == 2
+    validated = read_from_jsongz(tmp_path / "validated" / "segment" / "00004.json.gz")
+    assert [r["address_query"]["name"] for r in validated][:2] == [
+        "Bäckerei Schmidt 40",
+        "Bäckerei Schmidt 41",
+    ]
+
+
+@pytest.mark.parametrize(
+    "cpu_s, latency_s, bottleneck",
+    [(9.5, 10.0, "workers"), (1.0, 38.0, "budget"), (1.0, 10.0, "nominatim")],
+)
+def test_cpu_report_bottleneck(cpu_s, latency_s, bottleneck):
+    """one worker for 10s with a budget of 4: busy, using up the budget, or waiting"""
+    stats = StatCounter()
+    stats.inc("nominatim/request", 100)
+    for _ in range(100):
+        stats.observe("nominatim/latency_s", latency_s / 100)
+    result = WorkerResult(worker=0, files=1, cpu_s=cpu_s, wall_s=10.0, stats=stats.snapshot())
+    report = cpu_report([result], budget=4)
+    assert report["bottleneck"] == bottleneck
+    assert report["requests_per_s"] == 10.0
+    assert abs(report["mean_in_flight"] - latency_s / 10) < 1e-9
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from postalcrawl.stats import StatCounter
+from postalcrawl.utils import project_root
+from postalcrawl.validate.offline_geocoder import OfflineGeocoder, split_housenumber
+from postalcrawl.validate.osm_validator import OsmValidator
+
+DATASET_2K = project_root() / "data" / "v1" / "2k" / "full.parquet"
+DATASET_24K = project_root() / "data" / "v1" / "24k" / "full.parquet"
+
+
+@pytest.fixture(scope="module")
+def geocoder():
+    return OfflineGeocoder.from_dataset(DATASET_2K)
+
+
+def test_split_housenumber():
+    assert split_housenumber("550 E 47Th St S") == ("E 47Th St S", "550")
+    assert split_housenumber("Hoofdstraat 14") == ("Hoofdstraat", "14")
+    assert split_housenumber("Main Street") == ("Main Street", None)
+
+
+def test_lookup_exact_and_near_exact(geocoder):
+    exact = geocoder.lookup("Spring Street 600", "06096", "us")
+    assert exact is not None and exact["housenumber"] == "600"
+    # abbreviations, casing and missing country code
+    near = geocoder.lookup("600 Spring St.", "06096")
+    assert near == exact
+    assert geocoder.lookup("600 Spring Street", "99999", "us") is None
+
+
+async def test_validator_uses_offline_geocoder(geocoder):
+    # unreachable endpoint: a hit must not go over HTTP
+    async with OsmValidator("http://127.0.0.1:9", offline_geocoder=geocoder) as validator:
+        feature = await validator.query_validator(
+            name="Holiday Inn", street="600 Spring Street", city="Windsor Locks",
+            state="Connecticut", country="Spojené státy", postalcode="06096",
+        )  # fmt: skip
+    assert feature is not None
+    assert feature["properties"]["geocoding"]["country_code"] == "us"
+    assert validator.stats["offline/hit"] == 1
+    assert validator.stats["nominatim/request"] == 0
+
+
+def test_lookup_feature_name_match(geocoder):
+    stats = StatCounter()
+    query = {"street": "600 Spring Street", "postcode": "06096", "countrycode": "us"}
+    hit = geocoder.lookup_feature(stats, name="HOLIDAY INN express", **query)
+    assert hit is not None
+    assert hit["properties"]["geocoding"]["name"].startswith("Holiday Inn Express")
+    assert geocoder.lookup_feature(stats, **query) == hit  # no name to compare
+    # another business at the same address
+    assert geocoder.lookup_feature(stats, name="Joe's Pizza", **query) is None
+    assert stats["offline/name_mismatch"] == 1
+    assert (stats["offline/hit"], stats["offline/miss"]) == (2, 1)
+
+
+def test_offline_hit_has_geometry(tmp_path):
+    entry = {"housenumber": "600", "street": "Spring Street", "postcode": "06096",
+             "country_code": "us", "lat": 41.93, "lon": -72.64}  # fmt: skip
+    stats = StatCounter()
+    query = {"street": "600 Spring Street", "postcode": "06096", "countrycode": "us"}
+    hit = OfflineGeocoder([entry]).lookup_feature(stats, **query)
+    assert hit is not None
+    assert hit["geometry"] == {"type": "Point", "coordinates": [-72.64, 41.93]}
+
+    OfflineGeocoder([entry]).save(tmp_path / "index.parquet")
+    assert OfflineGeocoder.load(tmp_path / "index.parquet").lookup_feature(stats, **query) == hit
+    no_coordinates = OfflineGeocoder([{**entry, "lat": None}]).lookup_feature(stats, **query)
+    assert no_coordinates is not None and "geometry" not in no_coordinates
+
+
+@pytest.mark.dev
+def test_benchmark_offline_geocoder():
+    import polars as pl
+
+    start = time.perf_counter()
+    geocoder = OfflineGeocoder.from_dataset(DATASET_24K)
+    print(f"built index of {len(geocoder)} addresses in {time.perf_counter() - start:.2f}s")
+
+    stats = StatCounter()
+    queries = pl.read_parquet(DATASET_24K).iter_rows(named=True)
+    for row in queries:
+        street = " ".join(s for s in (row["house_number"], row["road"]) if s)
+        geocoder.lookup_feature(
+            stats, street=street, postcode=row["postcode"], countrycode=row["country_code"]
+        )
+    hit_rate = stats["offline/hit"] / stats["offline/lookup"]
+    mean_us = stats["offline/lookup_ns"] / stats["offline/lookup"] / 1000
+    print(f"hit rate {hit_rate:.1%}, mean latency {mean_us:.1f}µs")
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from postalcrawl.validate.osm_validator import OsmValidator, Transport
+from postalcrawl.validate.query_plan import QueryPlanner
+
+QUERY = {"name": "Shop", "street": "Hauptstr. 1", "city": "Berlin", "state": None,
+         "country": "DE", "postalcode": "10115"}  # fmt: skip
+
+
+async def run_queries(url: str, transport: Transport, n: int, max_concurrent: int = 200):
+    planner = QueryPlanner(max_requests=1)  # one request per query, the stub finds nothing
+    async with OsmValidator(
+        url, max_concurrent=max_concurrent, transport=transport, planner=planner
+    ) as validator:
+        queries = [validator.query_validator(**{**QUERY, "name": f"Shop {i}"}) for i in range(n)]
+        await asyncio.gather(*queries)
+    return validator.stats
+
+
+@pytest.mark.parametrize(
+    "transport, version",
+    [(Transport(pool_maxsize=8), "11"), (Transport(h2c=True, pool_maxsize=2), "20")],
+)
+async def test_connection_reuse(nominatim_stub, transport, version):
+    stats = await run_queries(nominatim_stub.url, transport, 200)
+    assert stats["nominatim/request"] == 200
+    assert stats[f"nominatim/http/{version}"] == 200
+    # connections are kept alive and reused, never more than the pool size
+    assert stats["nominatim/connection"] == nominatim_stub.connections
+    assert nominatim_stub.connections <= transport.pool_maxsize
+    assert stats["nominatim/connection"] - stats["nominatim/dns_cache_hit"] == 1
+
+
+async def test_timeout(nominatim_stub):
+    nominatim_stub.delay = 1.0
+    stats = await run_queries(nominatim_stub.url, Transport(timeout=0.1, retries=0), 3)
+    assert stats["nominatim/timeout"] == 3
+    assert stats["nominatim/request"] == 0
+
+
+@pytest.mark.dev
+@pytest.mark.parametrize(
+    "transport",
+    [
+        Transport(pool_maxsize=8),
+        Transport(pool_maxsize=64),
+        Transport(pool_maxsize=512),
+        Transport(h2c=True, pool_maxsize=1),
+        Transport(h2c=True, pool_maxsize=8),
+    ],
+)
+async def test_transport_benchmark(nominatim_stub, transport):
+    nominatim_stub.delay = 0.02  # ~ a cached Nominatim lookup
+    n = 2000
+    start = time.perf_counter()
+    stats = await run_queries(nominatim_stub.url, transport, n, max_concurrent=512)
+    elapsed = time.perf_counter() - start
+    latency = stats.histograms["nominatim/latency_s"]
+    print(
+        f"\nh2c={transport.h2c} pool={transport.pool_maxsize}: {n / elapsed:.0f} requests/s,"
+        f" {stats['nominatim/connection']} connections,"
+        f" latency mean {latency.sum / latency.count:.3f}s p99 <={latency.quantile(0.99)}s"
+    )
@@ -0,0 +1,60 @@
+import gzip
+import io
+import os
+import random
+import time
+
+import pytest
+
+from postalcrawl.extract.extract import extract_pipeline
+from postalcrawl.extract.parallel_gzip import ParallelGzipReader, find_member_candidates
+from postalcrawl.extract.warc_loaders import offline_record_generator
+from postalcrawl.stats import StatCounter
+from tests.conftest import address_page, write_warc
+
+
+def test_false_member_splits():
+    # incompressible payloads are stored verbatim, so the embedded gzip magic shows up
+    # inside compressed members
+    rng = random.Random(0)
+    members = [rng.randbytes(rng.randint(1, 50_000)) + b"\x1f\x8b\x08\x00" for _ in range(300)]
+    compressed = b"".join(gzip.compress(m, compresslevel=1) for m in members)
+    assert len(find_member_candidates(compressed)) > len(members)
+    reader = ParallelGzipReader(io.BytesIO(compressed), max_workers=4, block_size=64 * 1024)
+    with io.BufferedReader(reader) as stream:
+        assert stream.read() == b"".join(members)
+
+
+def test_parallel_records_match_serial(synthetic_warc):
+    stats, parallel_stats = StatCounter(), StatCounter()
+    serial = list(extract_pipeline(offline_record_generator(synthetic_warc, stats), stats))
+    gen = offline_record_generator(synthetic_warc, parallel_stats, parallel_workers=4)
+    parallel = list(extract_pipeline(gen, parallel_stats))
+    assert parallel == serial
+    assert parallel_stats == stats
+
+
+@pytest.mark.dev
+def test_benchmark_parallel_gzip(tmp_path):
+    rng = random.Random(0)
+    words = [rng.randbytes(6).hex() for _ in range(5000)]
+    pages = []
+    for i in range(6000):
+        text = " ".join(rng.choices(words, k=8000))
+        body = address_page(f"Shop {i}", f"Street {i}") + text if i % 10 == 0 else text
+        pages.append((f"https://host{i}.example.com/", "text/html", body))
+    warc_file = write_warc(tmp_path / "bench-00000.warc.gz", pages)
+    print(f"\nsynthetic WARC: {warc_file.stat().st_size / 1e6:.0f} MB compressed")
+
+    def run(workers: int) -> float:
+        stats = StatCounter()
+        start = time.perf_counter()
+        for record in offline_record_generator(warc_file, stats, parallel_workers=workers):
+            record.content_stream().read()
+        return time.perf_counter() - start
+
+    serial = run(0)
+    print(f"serial gzip: {serial:.2f}s")
+    for workers in (2, 4, os.cpu_count() or 8):
+        elapsed = run(workers)
+        print(f"parallel gzip, {workers} workers: {elapsed:.2f}s ({serial / elapsed:.2f}x)")
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+
+import pytest
+
+from postalcrawl.pack.main import split_street_number_field
+from postalcrawl.postal_service import PostalParserPool
+
+# stand-in for libpostal, which is usually not installed in test environments
+FAKE_PARSER = "tests.test_postal_service:fake_parse_address"
+
+
+def fake_parse_address(address: str) -> list[tuple[str, str]]:
+    house, _, road = address.partition(" ")
+    return [(house, "house_number"), (road.lower(), "road")]
+
+
+def test_pool_parses_in_order():
+    streets = [f"{i} main street" for i in range(5000)]
+    with PostalParserPool(2, parser=FAKE_PARSER) as pool:
+        parsed = list(pool.parse(streets, batch_size=100))
+        assert len(pool.worker_rss()) == 2
+    assert parsed == [fake_parse_address(s) for s in streets]
+
+
+def test_pool_raises_for_missing_parser_module():
+    with pytest.raises(ModuleNotFoundError, match="nonexistent_mod"):
+        PostalParserPool(2, parser="nonexistent_mod:f")
+
+
+def test_split_street_number_field_with_pool():
+    records = [{"street": f"{i} Main Street"} for i in range(10)] + [{"street": None}]
+    with PostalParserPool(2, parser=FAKE_PARSER) as pool:
+        out = list(split_street_number_field(records, pool))
+    assert out[3] == {"street": "Main Street", "house": "3"}
+    assert out[-1] == {"street": None, "house": None}
+
+
+def test_pack_import_does_not_load_postal():
+    code = "import sys, postalcrawl.pack.main; assert 'postal.parser' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,139 @@
+import gzip
+import json
+import time
+
+from postalcrawl.pack.main import generate_address_rows
+from postalcrawl.utils import read_from_jsongz, write_to_jsongz
+from postalcrawl.validate import main as validate_main
+from postalcrawl.validate.offline_geocoder import OfflineGeocoder
+from postalcrawl.validate.osm_validator import OsmValidator, Transport
+from postalcrawl.validate.projection import Projection, field_tree
+
+FEATURE = {
+    "type": "Feature",
+    "properties": {
+        "geocoding": {
+            "place_id": 123456,
+            "osm_type": "node",
+            "osm_id": 987654321,
+            "type": "bakery",
+            "label": "Bäckerei Schmidt, 5, Hauptstraße, Mitte, Berlin, 10115, Deutschland",
+            "name": "Bäckerei Schmidt",
+            "housenumber": "5",
+            "street": "Hauptstraße",
+            "district": "Mitte",
+            "postcode": "10115",
+            "city": "Berlin",
+            "state": "Berlin",
+            "country": "Deutschland",
+            "country_code": "de",
+            "admin": {f"level{i}": f"Admin level {i}" for i in range(4, 11)},
+            "extra": {
+                "opening_hours": "Mo-Fr 07:00-18:00",
+                "phone": "+49 30 1234567",
+                "website": "https://baeckerei.example.com/",
+            },
+            "namedetails": {
+                f"name:{lang}": f"Bäckerei Schmidt ({lang})"
+                for lang in ("de", "en", "fr", "ru", "zh")
+            },
+        }
+    },
+    "geometry": {"type": "Point", "coordinates": [13.3888599, 52.5170365]},
+}
+
+
+def crawl_record(i: int) -> dict:
+    return {
+        "data": {
+            "@type": "LocalBusiness",
+            "name": f"Bäckerei Schmidt {i}",
+            "description": "Frische Brötchen jeden Morgen. " * 20,
+            "image": [f"https://baeckerei.example.com/img/{k}.jpg" for k in range(10)],
+            "address": {
+                "@type": "PostalAddress",
+                "streetAddress": f"Hauptstr. {i}",
+                "addressLocality": "Berlin",
+                "postalCode": "10115",
+                "addressCountry": "DE",
+            },
+            "openingHoursSpecification": [
+                {"@type": "OpeningHoursSpecification", "dayOfWeek": d} for d in range(7)
+            ],
+        },
+        "crawl_metadata": {
+            "url": f"https://baeckerei.example.com/{i}",
+            "warc_rec_id": "x",
+            "warc_date": "y",
+        },
+    }
+
+
+def validated_record(i: int) -> dict:
+    record = crawl_record(i)
+    address = record["data"]["address"]
+    query = {
+        "name": record["data"]["name"],
+        "street": address["streetAddress"],
+        "city": address["addressLocality"],
+        "postalcode": address["postalCode"],
+        "country": address["addressCountry"],
+        "state": None,
+    }
+    return {"osm": FEATURE if i % 5 else None, "crawl": record, "address_query": query}
+
+
+def test_field_tree():
+    assert field_tree(["a.b", "a.c.d", "e"]) == {"a": {"b": {}, "c": {"d": {}}}, "e": {}}
+    # a whole subtree wins over its narrower paths, in any order
+    assert field_tree(["a.b", "a"]) == field_tree(["a", "a.b"]) == {"a": {}}
+
+
+def test_projection_keeps_what_pack_reads(tmp_path):
+    records = [validated_record(i) for i in range(200)]
+    projected = [Projection()(r) for r in records]
+    assert list(generate_address_rows(projected)) == list(generate_address_rows(records))
+    assert projected[0] == {"osm": None, "address_query": records[0]["address_query"]}
+    assert "namedetails" not in projected[1]["osm"]["properties"]["geocoding"]
+
+    full_file, projected_file = tmp_path / "full" / "0.json.gz", tmp_path / "p" / "0.json.gz"
+    for path, data in [(full_file, records), (projected_file, projected)]:
+        path.parent.mkdir()
+        write_to_jsongz(data, path)
+    assert len(OfflineGeocoder.from_validated(projected_file.parent)) == len(
+        OfflineGeocoder.from_validated(full_file.parent)
+    )
+
+    full_size = len(gzip.decompress(full_file.read_bytes()))
+    projected_size = len(gzip.decompress(projected_file.read_bytes()))
+    start = time.perf_counter()
+    read_from_jsongz(full_file)
+    full_parse = time.perf_counter() - start
+    start = time.perf_counter()
+    read_from_jsongz(projected_file)
+    projected_parse = time.perf_counter() - start
+    print(
+        f"\nvalidated json: {full_size / projected_size:.1f}x smaller,"
+        f" parse {full_parse * 1e3:.1f}ms -> {projected_parse * 1e3:.1f}ms"
+    )
+    assert full_size > 5 * projected_size
+
+
+async def test_validate_file_sidecar(tmp_path, monkeypatch, nominatim_stub):
+    monkeypatch.setattr(validate_main, "EXTRACT_ROOT", tmp_path / "extracted")
+    monkeypatch.setattr(validate_main, "VALIDATE_ROOT", tmp_path / "validated")
+    monkeypatch.setattr(validate_main, "VALIDATE_FULL_ROOT", tmp_path / "validated_full")
+    nominatim_stub.respond = lambda path: {"type": "FeatureCollection", "features": [FEATURE]}
+    extract_file = tmp_path / "extracted" / "segment" / "00000.json.gz"
+    extract_file.parent.mkdir(parents=True)
+    write_to_jsongz([crawl_record(i) for i in range(3)], extract_file)
+
+    async with OsmValidator(nominatim_stub.url, transport=Transport(retries=0)) as validator:
+        outputs = await validate_main.validate_file(
+            validator, extract_file, "v1", projection=Projection(), full_sidecar=True
+        )
+    projected, full = (read_from_jsongz(path) for path in outputs)
+    assert outputs[1] == tmp_path / "validated_full" / "segment" / "00000.json.gz"
+    assert [Projection()(r) for r in full] == projected
+    assert full[0]["crawl"]["data"]["name"] == "Bäckerei Schmidt 0"
+    assert json.dumps(projected).count("namedetails") == 0
@@ -0,0 +1,46 @@
+import polars as pl
+
+from postalcrawl.pack.main import COLUMNS, TARGET_COLUMNS
+from postalcrawl.pack.publish import publish_dataset, scan_country
+from postalcrawl.utils import project_root
+
+DATASET_24K = project_root() / "data" / "v1" / "24k" / "full.parquet"
+
+
+def packed_lazyframe() -> pl.LazyFrame:
+    # the published v1 variant, renamed to the columns of the current pack stage
+    renames = {"house_number": "house", "road": "street", "postcode": "postalcode",
+               "locality": "city", "region": "state", "country_code": "countrycode"}  # fmt: skip
+    renames.update({f"target:{k}": f"target_{v}" for k, v in renames.items()})
+    renames.update({"target:name": "target_name", "target:country": "target_country"})
+    return (
+        pl.scan_parquet(DATASET_24K)
+        .rename(renames)
+        .select([*COLUMNS, *TARGET_COLUMNS])
+        .drop_nulls(subset=TARGET_COLUMNS)
+    )
+
+
+def test_publish_dataset(tmp_path):
+    lf = packed_lazyframe()
+    total = lf.select(pl.len()).collect().item()
+    publish_dataset(lf, tmp_path, COLUMNS, TARGET_COLUMNS, row_group_size=1000)
+
+    assert (tmp_path / "dataset" / "target_countrycode=de").is_dir()
+    de = scan_country(tmp_path, "de").collect()
+    assert de.height == lf.filter(pl.col("target_countrycode") == "de").collect().height
+    assert pl.read_csv(tmp_path / "values.csv", infer_schema=False).height == total
+
+
+def test_republish_drops_stale_partitions(tmp_path):
+    lf = packed_lazyframe()
+    publish_dataset(lf, tmp_path, COLUMNS, TARGET_COLUMNS)
+    assert (tmp_path / "dataset" / "target_countrycode=fr").is_dir()
+
+    files = publish_dataset(
+        lf.filter(pl.col("target_countrycode") != "fr"), tmp_path, COLUMNS, TARGET_COLUMNS
+    )
+    assert not (tmp_path / "dataset" / "target_countrycode=fr").exists()
+    assert not any("target_countrycode=fr" in f.parts for f in files)
+    assert (tmp_path / "dataset" / "target_countrycode=de").is_dir()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dataset", "targets.csv", "values.csv"]
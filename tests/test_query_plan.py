@@ -0,0 +1,157 @@
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from postalcrawl.validate.osm_validator import OsmValidator, Transport
+from postalcrawl.validate.query_plan import QueryPlanner, agrees, plan_report
+from tests.test_projection import FEATURE, validated_record
+
+QUERY = {
+    "name": "Bäckerei Schmidt",
+    "street": "Hauptstr. 5",
+    "city": "Berlin",
+    "state": "BE",
+    "country": "DE",
+    "postalcode": "10115",
+}
+EMPTY = {"type": "FeatureCollection", "features": []}
+
+
+def feature(postcode: str | None = "10115", city: str | None = "Berlin", **fields) -> dict:
+    geocoding = {**FEATURE["properties"]["geocoding"], "postcode": postcode, "city": city}
+    geocoding.update(fields)
+    return {**FEATURE, "properties": {"geocoding": geocoding}}
+
+
+def search_params(path: str) -> dict[str, str]:
+    params = {k: v[0] for k, v in parse_qs(urlsplit(path).query).items()}
+    for key in ("format", "limit", "addressdetails", "namedetails", "extratags"):
+        params.pop(key)
+    return params
+
+
+@pytest.fixture
+def validator_for(nominatim_stub):
+    """a validator against the stub, which answers with `respond(search params)`"""
+
+    def create(
+        respond, planner: QueryPlanner | None = None, transport: Transport | None = None
+    ) -> OsmValidator:
+        nominatim_stub.respond = lambda path: respond(search_params(path))
+        return OsmValidator(nominatim_stub.url, transport=transport, planner=planner)
+
+    return create
+
+
+def searches(nominatim_stub) -> list[dict[str, str]]:
+    return [search_params(path) for path in nominatim_stub.requests]
+
+
+async def test_falls_back_to_next_tier(nominatim_stub, validator_for):
+    # the name on the page is not the one in OSM
+    def respond(params):
+        return {"features": [feature()]} if "amenity" not in params else EMPTY
+
+    async with validator_for(respond) as validator:
+        result = await validator.query_validator(**QUERY)
+    assert result == feature()
+    assert [set(p) for p in searches(nominatim_stub)] == [
+        {"amenity", "street", "city", "state", "country", "postalcode"},
+        {"street", "city", "state", "country", "postalcode"},
+    ]
+    report = plan_report(validator.stats)
+    assert report["strategies"]["no_amenity"] == {
+        "requests": 1,
+        "matches": 1,
+        "rejected": 0,
+        "yield_per_request": 1.0,
+    }
+    assert report["requests_per_validated"] == 2.0
+
+
+async def test_rejects_results_that_disagree(nominatim_stub, validator_for):
+    # relaxed structured queries find a namesake in another city, the free-form one the address
+    namesake = feature(postcode="80331", city="München")
+
+    def respond(params):
+        if "amenity" in params:
+            return EMPTY
+        if "q" in params:
+            assert params["q"] == "Hauptstr. 5, 10115, Berlin, DE"
+            return {"features": [feature()]}
+        return {"features": [namesake]}
+
+    async with validator_for(respond, QueryPlanner(max_requests=4)) as validator:
+        result = await validator.query_validator(**QUERY)
+    assert result == feature()
+    report = plan_report(validator.stats)
+    assert [report["strategies"][s]["rejected"] for s in ("no_amenity", "no_region")] == [1, 1]
+    assert report["strategies"]["free_form"]["matches"] == 1
+    assert len(nominatim_stub.requests) == 4
+
+    # a result of the strict query is trusted as it is
+    nominatim_stub.requests.clear()
+    async with validator_for(lambda params: {"features": [namesake]}) as validator:
+        assert await validator.query_validator(**QUERY) == namesake
+    assert plan_report(validator.stats)["strategies"]["full"]["matches"] == 1
+    assert len(nominatim_stub.requests) == 1
+
+
+async def test_budget_and_skipped_tiers(nominatim_stub, validator_for):
+    async with validator_for(lambda params: EMPTY, QueryPlanner(max_requests=2)) as validator:
+        assert await validator.query_validator(**QUERY) is None
+        assert len(nominatim_stub.requests) == 2
+        assert validator.stats["plan/budget_exhausted"] == 1
+
+        # without a name and a state, the first three tiers are the same query
+        nominatim_stub.requests.clear()
+        query = {**QUERY, "name": None, "state": None}
+        assert await validator.query_validator(**query) is None
+        assert [set(p) for p in searches(nominatim_stub)] == [
+            {"street", "city", "country", "postalcode"},
+            {"q"},
+        ]
+        # relaxed tiers need a field that locates the address
+        nominatim_stub.requests.clear()
+        query = {k: None for k in QUERY} | {"name": "Shop", "country": "DE"}
+        assert await validator.query_validator(**query) is None
+        assert [set(p) for p in searches(nominatim_stub)] == [{"amenity", "country"}]
+
+
+async def test_failed_request_ends_plan(nominatim_stub, validator_for):
+    nominatim_stub.delay = 1.0
+    transport = Transport(timeout=0.1, retries=0)
+    async with validator_for(lambda params: EMPTY, transport=transport) as validator:
+        assert await validator.query_validator(**QUERY) is None
+    assert validator.stats["nominatim/timeout"] == 1
+    assert validator.stats["plan/full/request"] == 1
+    assert validator.stats["plan/no_amenity/request"] == 0
+
+
+async def test_record_query_validator(nominatim_stub, validator_for):
+    async with validator_for(lambda params: {"features": [feature()]}) as validator:
+        result = await validator.record_query_validator(validated_record(1)["crawl"])
+    assert result["osm"] == feature()
+    assert result["address_query"]["strategy"] == "full"
+    assert validator.stats["plan/validated"] == 1
+
+    # relaxed tiers: the tier that found the record
+    async with validator_for(
+        lambda params: EMPTY if "amenity" in params else {"features": [feature()]}
+    ) as validator:
+        result = await validator.record_query_validator(validated_record(1)["crawl"])
+    assert result["address_query"]["strategy"] == "no_amenity"
+
+
+def test_agrees():
+    query = {"postalcode": "10 115", "city": "Berlin"}
+    assert agrees(feature(postcode="10115"), query)
+    assert not agrees(feature(postcode="10117"), query)
+    assert agrees(feature(postcode=""), {"city": "berlin"})
+    assert agrees(feature(postcode="", city="Berlin-Mitte"), query)
+    assert not agrees(feature(), {"street": "Hauptstr. 5"})
+    # the postcode area or the city itself locates nothing
+    region = {"name": None, "housenumber": None, "street": None}
+    assert not agrees(feature(type="postcode", **region), query)
+    assert not agrees(feature(type="city", **region), {"city": "Berlin"})
+    assert agrees(feature(type="street", **region), query)
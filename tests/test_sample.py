@@ -0,0 +1,48 @@
+import polars as pl
+
+from postalcrawl.pack.main import COLUMNS
+from postalcrawl.pack.sample import Variant, allocate, sample_variants, variant_allocations
+from tests.test_publish import packed_lazyframe
+
+VARIANTS = [
+    Variant("small", 200),
+    Variant("medium", 2000),
+    Variant("noname", 20_000, named_only=False, drop_name=True),
+]
+
+
+def test_allocate():
+    alloc = allocate({("us", True): 600, ("de", True): 300, ("fr", True): 100}, 10)
+    assert alloc == {("us", True): 6, ("de", True): 3, ("fr", True): 1}
+    assert allocate({("us", True): 5}, 10) == {("us", True): 5}
+
+
+def test_variant_allocations_keep_sizes():
+    counts = {("de", True): 100, ("de", False): 900, ("fr", True): 50, ("fr", False): 950}
+    variants = [Variant("named", 50), Variant("all", 100, named_only=False)]
+    allocations = variant_allocations(counts, variants)
+    # proportionally, "all" would take 5 + 2 named rows, but contains the 50 of "named"
+    assert allocations["named"] == {("de", True): 33, ("fr", True): 17}
+    assert sum(allocations["all"].values()) == 100
+    assert all(allocations["all"][s] >= k for s, k in allocations["named"].items())
+    assert allocations["all"][("de", False)] + allocations["all"][("fr", False)] == 50
+
+
+def test_sample_variants_nested_and_deterministic(tmp_path):
+    lf = packed_lazyframe()
+    out = sample_variants(lf, tmp_path / "a", VARIANTS, seed=1, batch_size=5000)
+    rerun = sample_variants(lf, tmp_path / "b", VARIANTS, seed=1, batch_size=3000)
+    assert out["small"].equals(rerun["small"]) and out["noname"].equals(rerun["noname"])
+
+    small, medium, noname = out["small"], out["medium"], out["noname"]
+    assert (small.height, medium.height, noname.height) == (200, 2000, 20_000)
+    assert small["target_name"].null_count() == 0
+    assert "name" not in noname.columns
+    assert small.join(medium, on=COLUMNS, how="anti", nulls_equal=True).height == 0
+    no_name_cols = [c for c in COLUMNS if c != "name"]
+    assert medium.join(noname, on=no_name_cols, how="anti", nulls_equal=True).height == 0
+
+    # stratified: country shares follow the full dataset
+    us_share = lf.select((pl.col("target_countrycode") == "us").mean()).collect().item()
+    assert abs((medium["target_countrycode"] == "us").mean() - us_share) < 0.01
+    assert pl.read_csv(tmp_path / "a" / "small" / "values.csv").height == 200
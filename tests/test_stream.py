@@ -0,0 +1,186 @@
+import time
+
+import polars as pl
+import pytest
+
+from postalcrawl.extract.extract import extract_pipeline
+from postalcrawl.extract.warc_loaders import offline_record_generator
+from postalcrawl.pack.countries import load_country_index
+from postalcrawl.pack.geo import GEO_COLUMNS
+from postalcrawl.pack.main import (
+    COLUMNS,
+    TARGET_COLUMNS,
+    address_frame,
+    generate_section_rows,
+    split_street_number_field,
+)
+from postalcrawl.postal_service import PostalParserPool
+from postalcrawl.stats import StatCounter
+from postalcrawl.stream import stream
+from postalcrawl.utils import write_to_jsongz
+from postalcrawl.validate import main as validate_main
+from postalcrawl.validate.osm_validator import OsmValidator, Transport
+from tests.conftest import address_page, write_warc
+from tests.test_postal_service import FAKE_PARSER
+from tests.test_projection import FEATURE
+
+SEGMENT_DIR = "crawl-data/CC-MAIN-2025-30/segments/1751905933612.63/warc"
+
+
+def write_segments(root, n_segments: int, n_pages: int) -> list[str]:
+    """CC-like file ids of local WARC files under `root`, `n_pages` address pages each"""
+    (root / SEGMENT_DIR).mkdir(parents=True)
+    file_ids = []
+    for s in range(n_segments):
+        file_id = f"{SEGMENT_DIR}/CC-MAIN-20250707183638-20250707213638-{s:05d}.warc.gz"
+        pages = [
+            (
+                f"https://shop{s}-{i}.example.com/",
+                "text/html",
+                address_page(f"Shop {s}-{i}", f"{i} Hauptstr."),
+            )
+            for i in range(n_pages)
+        ]
+        write_warc(root / file_id, pages)
+        file_ids.append(file_id)
+    return file_ids
+
+
+@pytest.fixture
+def stub_with_feature(nominatim_stub):
+    nominatim_stub.respond = lambda path: {"type": "FeatureCollection", "features": [FEATURE]}
+    return nominatim_stub
+
+
+@pytest.fixture(scope="module")
+def parser_pool():
+    with PostalParserPool(1, parser=FAKE_PARSER) as pool:
+        yield pool
+
+
+def local_source(root):
+    return lambda file_id, stats: offline_record_generator(root / file_id, stats)
+
+
+async def test_stream(tmp_path, monkeypatch, stub_with_feature, parser_pool):
+    monkeypatch.setattr(validate_main, "NOMINATIM_URL", stub_with_feature.url)
+    file_ids = write_segments(tmp_path / "cc", 3, 4)
+    out_file, checkpoints = tmp_path / "addresses.parquet", tmp_path / "checkpoints"
+
+    def run(**kwargs):
+        return stream(
+            file_ids,
+            out_file,
+            record_source=local_source(tmp_path / "cc"),
+            checkpoint_dir=checkpoints,
+            parser_pool=parser_pool,
+            use_offline_index=False,
+            transport=Transport(retries=0),
+            **kwargs,
+        )
+
+    # queues of one record: every stage waits for the next one
+    stats = await run(n_extractors=2, concurrency=2, queue_size=1, row_group_rows=5)
+    df = pl.read_parquet(out_file)
+    assert df.columns == [*COLUMNS, *TARGET_COLUMNS, *GEO_COLUMNS]
+    assert df.height == stats["stream/row"] == 12
+    assert sorted(df["name"])[:2] == ["Shop 0-0", "Shop 0-1"]
+    assert set(df["house"]) == {"0", "1", "2", "3"} and set(df["countrycode"]) == {"de"}
+    assert stats["stream/row_group"] >= 3
+    assert stats["stream/checkpoint_write"] == 3 and stats["warc/record"] == 24
+    assert 0 < stats.gauges["stream/first_row_s"] <= stats.gauges["time/wall_s"]
+
+    stats = await run()
+    assert stats["stream/checkpoint_read"] == 3 and stats["warc/record"] == 0
+    assert pl.read_parquet(out_file).sort("name").equals(df.sort("name"))
+
+
+async def test_stream_pushes_metrics(
+    tmp_path, monkeypatch, stub_with_feature, parser_pool, metrics_aggregator
+):
+    monkeypatch.setattr(validate_main, "NOMINATIM_URL", stub_with_feature.url)
+    file_ids = write_segments(tmp_path / "cc", 1, 3)
+    aggregator, url = metrics_aggregator
+    stats = await stream(
+        file_ids,
+        tmp_path / "addresses.parquet",
+        record_source=local_source(tmp_path / "cc"),
+        parser_pool=parser_pool,
+        use_offline_index=False,
+        transport=Transport(retries=0),
+        metrics_url=url,
+    )
+    assert aggregator.totals()["nominatim/request"] == stats["nominatim/request"] == 3
+
+
+async def test_failed_extractor_fails_stream(tmp_path, monkeypatch, stub_with_feature, parser_pool):
+    monkeypatch.setattr(validate_main, "NOMINATIM_URL", stub_with_feature.url)
+    file_ids = write_segments(tmp_path / "cc", 3, 4)
+    out_file = tmp_path / "addresses.parquet"
+
+    def failing_source(file_id, stats):
+        records = local_source(tmp_path / "cc")(file_id, stats)
+        if file_id == file_ids[1]:
+            yield next(records)
+            raise OSError("connection reset")
+        yield from records
+
+    with pytest.raises(ExceptionGroup) as info:
+        await stream(
+            file_ids,
+            out_file,
+            record_source=failing_source,
+            n_extractors=2,
+            parser_pool=parser_pool,
+            use_offline_index=False,
+            transport=Transport(retries=0),
+            flush_seconds=0.01,
+        )
+    assert info.group_contains(OSError, match="connection reset")
+    assert not out_file.exists()
+
+
+@pytest.mark.dev
+async def test_stream_benchmark(tmp_path, monkeypatch, stub_with_feature, parser_pool):
+    """time to first row and total time of the batch stages against the stream"""
+    monkeypatch.setattr(validate_main, "NOMINATIM_URL", stub_with_feature.url)
+    monkeypatch.setattr(validate_main, "EXTRACT_ROOT", tmp_path / "extracted")
+    monkeypatch.setattr(validate_main, "VALIDATE_ROOT", tmp_path / "validated")
+    stub_with_feature.delay = 0.02
+    root = tmp_path / "cc"
+    file_ids = write_segments(root, 4, 500)
+    transport = Transport(retries=0)
+
+    start = time.perf_counter()
+    extracted = []
+    for file_id in file_ids:
+        stats = StatCounter()
+        out = tmp_path / "extracted" / "s" / file_id.rsplit("/", 1)[1].replace("warc", "json")
+        out.parent.mkdir(parents=True, exist_ok=True)
+        write_to_jsongz(list(extract_pipeline(local_source(root)(file_id, stats), stats)), out)
+        extracted.append(out)
+    async with OsmValidator(stub_with_feature.url, 64, transport=transport) as validator:
+        for extract_file in extracted:
+            await validate_main.validate_file(validator, extract_file, "v")
+    rows = split_street_number_field(
+        generate_section_rows(tmp_path / "validated" / "s"), parser_pool
+    )
+    address_frame(rows, load_country_index()).write_parquet(tmp_path / "batch.parquet")
+    batch_s = time.perf_counter() - start
+
+    stats = await stream(
+        file_ids,
+        tmp_path / "stream.parquet",
+        record_source=local_source(root),
+        concurrency=64,
+        parser_pool=parser_pool,
+        use_offline_index=False,
+        transport=transport,
+        row_group_rows=500,
+        flush_seconds=0.5,
+    )
+    print(
+        f"\nbatch: first row {batch_s:.2f}s, total {batch_s:.2f}s;"
+        f" stream: first row {stats.gauges['stream/first_row_s']:.2f}s,"
+        f" total {stats.gauges['time/wall_s']:.2f}s"
+    )
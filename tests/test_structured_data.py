@@ -0,0 +1,131 @@
+import time
+
+import pytest
+from parsel import Selector
+
+from postalcrawl.extract.extract import RawResponse, extract_pipeline, process_responses
+from postalcrawl.extract.structured_data import ALL_SYNTAXES, page_items
+from postalcrawl.extract.warc_loaders import offline_record_generator
+from postalcrawl.stats import StatCounter
+from tests.conftest import RESOURCES, address_page, write_warc
+
+MICRODATA_PAGE = """<html><body>
+<div itemscope itemtype="https://schema.org/LocalBusiness">
+  <h1 itemprop="name">Bäckerei Schmidt</h1>
+  <a itemprop="url" href="https://baeckerei.example.com/">home</a>
+  <div itemprop="address" itemscope itemtype="https://schema.org/PostalAddress">
+    <span itemprop="streetAddress">Hauptstr.
+      5</span>
+    <meta itemprop="postalCode" content="10115">
+    <span itemprop="addressLocality">Berlin</span>
+  </div>
+  <div itemscope itemtype="https://schema.org/Offer"><span itemprop="price">3</span></div>
+</div>
+</body></html>"""
+
+RDFA_PAGE = """<html><body vocab="https://schema.org/">
+<div typeof="Restaurant">
+  <span property="name">Trattoria</span>
+  <div property="address" typeof="PostalAddress">
+    <span property="streetAddress">Via Roma 1</span>
+    <span property="postalCode">00184</span>
+    <span property="addressLocality">Roma</span>
+    <span property="addressCountry">IT</span>
+  </div>
+</div>
+</body></html>"""
+
+
+def test_page_items():
+    items = list(page_items(MICRODATA_PAGE))
+    # the Offer is not a property of the business, so it is a separate top-level item
+    assert [syntax for syntax, _ in items] == ["microdata", "microdata"]
+    business = items[0][1]
+    assert business == {
+        "@type": "LocalBusiness",
+        "name": "Bäckerei Schmidt",
+        "url": "https://baeckerei.example.com/",
+        "address": {
+            "@type": "PostalAddress",
+            "streetAddress": "Hauptstr. 5",
+            "postalCode": "10115",
+            "addressLocality": "Berlin",
+        },
+    }
+    assert items[1][1] == {"@type": "Offer", "price": "3"}
+
+    ((syntax, restaurant),) = page_items(RDFA_PAGE)
+    assert syntax == "rdfa" and isinstance(restaurant, dict)
+    assert restaurant["address"]["@type"] == "PostalAddress"
+    assert restaurant["address"]["addressCountry"] == "IT"
+
+    combined = address_page("Shop", "Hauptstr. 1").replace("<p>hello</p>", MICRODATA_PAGE)
+    assert [s for s, _ in page_items(combined)] == ["json-ld", "microdata", "microdata"]
+    assert [s for s, _ in page_items(combined, ("json-ld",))] == ["json-ld"]
+
+
+def test_multi_syntax_pipeline(tmp_path):
+    pages = [
+        ("https://a.example.com/", "text/html", address_page("Shop", "Hauptstr. 1")),
+        ("https://b.example.com/", "text/html", MICRODATA_PAGE),
+        ("https://c.example.com/", "text/html; charset=utf-8", RDFA_PAGE),
+        ("https://d.example.com/", "text/html", "<html><div itemscope>no address</div></html>"),
+    ]
+    warc = write_warc(tmp_path / "multi.warc.gz", pages)
+
+    def run(**kwargs):
+        stats = StatCounter()
+        records = list(extract_pipeline(offline_record_generator(warc, stats), stats, **kwargs))
+        return records, stats
+
+    default, _ = run()
+    records, stats = run(syntaxes=ALL_SYNTAXES)
+    assert [r["crawl_metadata"]["syntax"] for r in records] == ["json-ld", "microdata", "rdfa"]
+    assert records[0]["data"] == default[0]["data"]
+    assert records[1]["data"]["address"]["postalCode"] == "10115"
+    assert stats["extract/full_parse"] == 2  # the json-ld page is not parsed as a whole
+
+    threaded, threaded_stats = run(syntaxes=ALL_SYNTAXES, n_threads=2)
+    assert threaded == records
+    assert threaded_stats["extract/syntax/rdfa"] == 1
+
+
+def responses(resource: str, n: int) -> list[RawResponse]:
+    body = (RESOURCES / resource).read_bytes()
+    return [RawResponse(body, "utf-8", {"url": resource}) for _ in range(n)]
+
+
+@pytest.mark.dev
+def test_multi_syntax_benchmark():
+    """cpu per page of json-ld only, the multi-syntax pass and parsing per syntax"""
+    microdata = MICRODATA_PAGE.replace("</body>", "").encode()
+    pages = {
+        "index.html": responses("index.html", 50),
+        "response.1.html": responses("response.1.html", 200),
+        "response.1.html + microdata": [
+            RawResponse(r.body.replace(b"</body>", microdata + b"</body>"), r.charset, {})
+            for r in responses("response.1.html", 200)
+        ],
+    }
+    xpaths = [
+        "//script[@type='application/ld+json']/text()",
+        "//*[@itemscope and not(@itemprop)]",
+        "//*[@typeof and not(@property)]",
+    ]
+
+    def naive(batch: list[RawResponse]):
+        for response in batch:
+            for xpath in xpaths:  # parse again for each syntax
+                Selector(text=response.body.decode()).xpath(xpath).getall()
+
+    for name, batch in pages.items():
+        timings = {}
+        for mode, run in [
+            ("json-ld", lambda batch=batch: process_responses(batch)),
+            ("multi-syntax", lambda batch=batch: process_responses(batch, ALL_SYNTAXES)),
+            ("parse per syntax", lambda batch=batch: naive(batch)),
+        ]:
+            start = time.perf_counter()
+            run()
+            timings[mode] = (time.perf_counter() - start) / len(batch) * 1e6
+        print(f"\n{name}: " + ", ".join(f"{m} {t:.0f}µs/page" for m, t in timings.items()))
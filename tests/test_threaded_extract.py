@@ -0,0 +1,50 @@
+import json
+import time
+
+import pytest
+
+from postalcrawl.extract.extract import extract_pipeline, free_threading_enabled
+from postalcrawl.extract.warc_loaders import offline_record_generator
+from postalcrawl.stats import StatCounter
+from tests.conftest import address_page, write_warc
+
+
+def run_pipeline(warc_path, n_threads: int) -> tuple[list, StatCounter]:
+    stats = StatCounter()
+    gen = offline_record_generator(warc_path, stats)
+    records = list(extract_pipeline(gen, stats, track_hosts=True, n_threads=n_threads))
+    return records, stats
+
+
+@pytest.mark.parametrize("n_threads", [1, 3])
+def test_threaded_backend_matches_serial(synthetic_warc, n_threads):
+    serial, serial_stats = run_pipeline(synthetic_warc, 0)
+    threaded, threaded_stats = run_pipeline(synthetic_warc, n_threads)
+    assert len(serial) == 5
+    assert threaded == serial
+    assert dict(threaded_stats) == dict(serial_stats)
+
+
+@pytest.mark.dev
+def test_benchmark_thread_scaling(tmp_path):
+    """records/s for 1..N threads. run on a GIL build and on python3.13t to compare"""
+    filler = "<div class='product'><p>" + "lorem ipsum dolor sit amet " * 400 + "</p></div>"
+    pages = [
+        (
+            f"https://shop{i}.example.com/",
+            "text/html; charset=utf-8",
+            address_page(f"Shop {i}", f"Hauptstr. {i}").replace("<body>", "<body>" + filler * 4),
+        )
+        for i in range(2000)
+    ]
+    warc_path = write_warc(tmp_path / "bench.warc.gz", pages)
+    build = "free-threaded" if free_threading_enabled() else "GIL"
+    results = {}
+    for n_threads in [0, 1, 2, 4, 8]:
+        start = time.perf_counter()
+        records, stats = run_pipeline(warc_path, n_threads)
+        elapsed = time.perf_counter() - start
+        assert len(records) == len(pages)
+        results[n_threads] = stats["warc/record"] / elapsed
+        print(f"[{build}] threads={n_threads}: {results[n_threads]:.0f} records/s")
+    print(json.dumps({"build": build, "records_per_s": results}))